@@ -0,0 +1,91 @@
+"""Compare the policy diff engine against the previous additions-only implementation on large org policies.
+
+usage: python benchmarks/bench_compute_deltas.py [--bindings 20000] [--members 5] [--changed 10] [--repeat 5]
+"""
+import argparse
+import copy
+import os
+import sys
+import time
+from typing import Any, Dict, List, Set, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from handlers.asset import _compute_deltas, _cond_key
+
+
+def legacy_compute_deltas(asset_json: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """The set-per-binding implementation this engine replaced (additions only), kept for comparison."""
+    asset = (asset_json.get("asset") or {})
+    prior = (asset_json.get("priorAsset") or {})
+    new_bindings = (asset.get("iamPolicy", {}) or {}).get("bindings", []) or []
+    old_bindings = (prior.get("iamPolicy", {}) or {}).get("bindings", []) or []
+
+    old_index: Dict[Tuple[str, Tuple], Set[str]] = {}
+    for ob in old_bindings:
+        role = ob.get("role")
+        if not role:
+            continue
+        old_index[(role, _cond_key(ob.get("condition")))] = set(ob.get("members", []) or [])
+
+    deltas = []
+    for nb in new_bindings:
+        role = nb.get("role")
+        if not role:
+            continue
+        cond = nb.get("condition")
+        ck = _cond_key(cond)
+        new_members = set(nb.get("members", []) or [])
+        if not new_members:
+            continue
+        prev_members = old_index.get((role, ck), set())
+        added = sorted(new_members - prev_members)
+        if (role, ck) not in old_index:
+            deltas.append({"role": role, "members": sorted(new_members), "condition": cond, "change": "members_added"})
+        elif added:
+            deltas.append({"role": role, "members": added, "condition": cond, "change": "members_added"})
+    return deltas
+
+
+def make_policy_change(bindings: int, members: int, changed: int) -> Dict[str, Any]:
+    old = [
+        {
+            "role": f"roles/custom.role{i}",
+            "members": sorted(f"serviceAccount:sa-{i}-{j}@my-proj.iam.gserviceaccount.com" for j in range(members)),
+        }
+        for i in range(bindings)
+    ]
+    new = copy.deepcopy(old)
+    step = max(1, bindings // max(changed, 1))
+    for i in range(0, bindings, step)[:changed]:
+        new[i]["members"] = sorted(new[i]["members"][1:] + [f"user:new-{i}@example.com"])
+    return {"asset": {"iamPolicy": {"bindings": new}}, "priorAsset": {"iamPolicy": {"bindings": old}}}
+
+
+def best_of(fn, msg, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(msg)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--bindings", type=int, nargs="+", default=[1000, 10000, 50000])
+    p.add_argument("--members", type=int, default=5, help="members per binding")
+    p.add_argument("--changed", type=int, default=10, help="bindings with one member swapped")
+    p.add_argument("--repeat", type=int, default=5)
+    args = p.parse_args()
+
+    print(f"{'bindings':>9} {'members':>9} {'legacy ms':>10} {'engine ms':>10} {'speedup':>8}")
+    for n in args.bindings:
+        msg = make_policy_change(n, args.members, args.changed)
+        legacy = best_of(legacy_compute_deltas, msg, args.repeat)
+        engine = best_of(_compute_deltas, msg, args.repeat)
+        print(f"{n:>9} {n * args.members:>9} {legacy * 1000:>10.2f} {engine * 1000:>10.2f} {legacy / engine:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
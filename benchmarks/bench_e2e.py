@@ -0,0 +1,270 @@
+"""End-to-end throughput, latency and allocation benchmark with stubbed CRM and sinks.
+
+Drives ``hello_pubsub``, ``process_feeds``, ``process_audit_logs`` and ``_compute_deltas`` over synthetic
+messages from ``generators.py``. The ``stages-*`` scenarios run the ``hello_pubsub`` pipeline step by step
+to report per-stage latency percentiles. Results are written as JSON; pass a previous result as
+``--baseline`` to print the change and, with ``--fail-on-regression``, exit non-zero on a slowdown.
+
+usage:
+    python benchmarks/bench_e2e.py --output benchmarks/baseline.json --repeat 5
+    python benchmarks/bench_e2e.py --baseline benchmarks/baseline.json --fail-on-regression
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Sequence
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import generators
+
+STAGES = ("decode", "parse", "classify", "build", "send")
+
+
+class StubCRM:
+    """Stands in for the CRM client: every ancestor resolves to the same project."""
+
+    class _Get:
+        def get(self, name):
+            return self
+
+        def execute(self):
+            return {"projectId": "my-proj", "name": "folders/1", "displayName": "Bench"}
+
+    def projects(self): return self._Get()
+
+    def folders(self): return self._Get()
+
+    def organizations(self): return self._Get()
+
+
+def setup(dedup: bool) -> None:
+    # env must be in place before main reads its config at import time
+    os.environ.update(LOG_LEVEL="ERROR", DEST_TYPES="null", DEDUP_ENABLED="true" if dedup else "false")
+    os.environ.pop("DEST_CONFIG_FILE", None)
+
+    import lib.gcp as gcp
+    from lib.destinations import factory
+    from lib.destinations.base import Destination
+    from lib.destinations.render import render
+    from lib.metrics import stage
+
+    class NullSink(Destination):
+        """Renders like the Slack sink, then drops the message."""
+
+        def __init__(self, env=None):
+            self.sent = 0
+
+        def send(self, event):
+            with stage("render", destination="null"):
+                render(event, "slack_mrkdwn")
+            self.sent += 1
+
+    gcp.crm_client = StubCRM
+    gcp.ancestor_cache.clear()
+    factory.REGISTRY["null"] = NullSink
+    factory.reset_destination()
+
+
+class FakeEvent:
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+
+def percentiles(samples_ns: Sequence[int]) -> Dict[str, float]:
+    s = sorted(samples_ns)
+    if not s:
+        return {}
+
+    def at(q: float) -> float:
+        return round(s[min(len(s) - 1, int(q * len(s)))] / 1e6, 4)
+
+    return {"p50": at(0.50), "p90": at(0.90), "p99": at(0.99), "max": round(s[-1] / 1e6, 4)}
+
+
+def timed(fn: Callable[[Any], Any], inputs: List[Any]) -> Dict[str, Any]:
+    lat: List[int] = []
+    clock = time.perf_counter_ns
+    start = clock()
+    for x in inputs:
+        t0 = clock()
+        fn(x)
+        lat.append(clock() - t0)
+    elapsed = (clock() - start) / 1e9
+    return {"messages": len(inputs), "msgs_per_sec": round(len(inputs) / elapsed, 1), "latency_ms": percentiles(lat)}
+
+
+def staged(envelopes: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """The hello_pubsub pipeline with a clock around each stage."""
+    from handlers import lookup
+    from lib.decode import PayloadRef, b64decode, loads
+    from lib.destinations.factory import get_destination
+
+    clock = time.perf_counter_ns
+    per_stage: Dict[str, List[int]] = {s: [] for s in STAGES}
+    total: List[int] = []
+    start = clock()
+    for env in envelopes:
+        t0 = clock()
+        raw = b64decode(env["message"]["data"])
+        t1 = clock()
+        msg = loads(raw)
+        t2 = clock()
+        handler = lookup(msg)
+        t3 = clock()
+        evt = handler.build(msg, PayloadRef(raw))
+        t4 = clock()
+        if evt is not None:
+            get_destination().send(evt)
+        t5 = clock()
+        for stage, a, b in zip(STAGES, (t0, t1, t2, t3, t4), (t1, t2, t3, t4, t5)):
+            per_stage[stage].append(b - a)
+        total.append(t5 - t0)
+    elapsed = (clock() - start) / 1e9
+    return {
+        "messages": len(envelopes),
+        "msgs_per_sec": round(len(envelopes) / elapsed, 1),
+        "latency_ms": percentiles(total),
+        "stages_ms": {s: percentiles(v) for s, v in per_stage.items()},
+    }
+
+
+def allocations(fn: Callable[[Any], Any], inputs: List[Any]) -> Dict[str, float]:
+    """Peak traced memory allocated while handling one message (KiB), over a separate, untimed pass."""
+    peaks = []
+    tracemalloc.start()
+    try:
+        for x in inputs:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            fn(x)
+            peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    finally:
+        tracemalloc.stop()
+    peaks.sort()
+    return {
+        "mean_peak_kib": round(sum(peaks) / len(peaks) / 1024, 1),
+        "p99_peak_kib": round(peaks[min(len(peaks) - 1, int(0.99 * len(peaks)))] / 1024, 1),
+    }
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    setup(args.dedup)
+    import main
+    from handlers.asset import _compute_deltas, process_feeds
+    from handlers.audit import process_audit_logs
+
+    n = args.messages
+    assets = [generators.asset_message(args.bindings, args.members, args.changed, args.removed, args.conditions, seed=i)
+              for i in range(n)]
+    audits = [generators.audit_message(args.deltas, args.removes, args.conditions, seed=i) for i in range(n)]
+
+    def events(msgs: List[Dict[str, Any]], prefix: str) -> List[FakeEvent]:
+        return [FakeEvent(generators.envelope(m, f"{prefix}-{i}")) for i, m in enumerate(msgs)]
+
+    scenarios: Dict[str, Callable[[], Dict[str, Any]]] = {
+        "compute_deltas": lambda: timed(_compute_deltas, assets),
+        "process_feeds": lambda: timed(process_feeds, assets),
+        "process_audit_logs": lambda: timed(process_audit_logs, audits),
+        "hello_pubsub-asset": lambda: timed(main.hello_pubsub, events(assets, "asset")),
+        "hello_pubsub-audit": lambda: timed(main.hello_pubsub, events(audits, "audit")),
+        "stages-asset": lambda: staged([e.data for e in events(assets, "s-asset")]),
+        "stages-audit": lambda: staged([e.data for e in events(audits, "s-audit")]),
+    }
+    alloc_targets: Dict[str, Callable[[], Dict[str, float]]] = {
+        "compute_deltas": lambda: allocations(_compute_deltas, assets[:args.alloc_samples]),
+        "process_feeds": lambda: allocations(process_feeds, assets[:args.alloc_samples]),
+        "process_audit_logs": lambda: allocations(process_audit_logs, audits[:args.alloc_samples]),
+        "hello_pubsub-asset": lambda: allocations(main.hello_pubsub, events(assets[:args.alloc_samples], "a-asset")),
+        "hello_pubsub-audit": lambda: allocations(main.hello_pubsub, events(audits[:args.alloc_samples], "a-audit")),
+    }
+
+    results: Dict[str, Any] = {}
+    for name, fn in scenarios.items():
+        if args.scenarios and not any(name.startswith(s) for s in args.scenarios):
+            continue
+        fn()  # warm-up pass: caches, lazy imports, destination graph
+        # best of N damps noise from other tenants on shared CI machines
+        results[name] = max((fn() for _ in range(args.repeat)), key=lambda r: r["msgs_per_sec"])
+        if name in alloc_targets and args.alloc_samples:
+            results[name]["alloc"] = alloc_targets[name]()
+
+    params = {k: getattr(args, k) for k in ("messages", "bindings", "members", "changed", "removed", "conditions",
+                                            "deltas", "removes", "dedup")}
+    return {
+        "meta": {"python": platform.python_version(), "platform": platform.platform(),
+                 "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), "params": params},
+        "scenarios": results,
+    }
+
+
+def report(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Print a table; return the scenarios whose throughput fell more than ``tolerance`` below the baseline."""
+    base = (baseline or {}).get("scenarios", {})
+    regressions = []
+    if baseline and baseline["meta"]["params"] != result["meta"]["params"]:
+        print("warning: baseline was recorded with different parameters:", baseline["meta"]["params"])
+    print(f"{'scenario':<20} {'msgs/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'peak KiB':>9} {'vs base':>8}")
+    for name, r in result["scenarios"].items():
+        lat = r["latency_ms"]
+        peak = r.get("alloc", {}).get("mean_peak_kib", "")
+        change = ""
+        if name in base:
+            ratio = r["msgs_per_sec"] / base[name]["msgs_per_sec"]
+            change = f"{(ratio - 1) * 100:+.0f}%"
+            if ratio < 1 - tolerance:
+                regressions.append(name)
+        print(f"{name:<20} {r['msgs_per_sec']:>10} {lat['p50']:>8} {lat['p99']:>8} {peak:>9} {change:>8}")
+        for stage, p in r.get("stages_ms", {}).items():
+            print(f"  {stage:<18} {'':>10} {p['p50']:>8} {p['p99']:>8}")
+    return regressions
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--messages", type=int, default=1000, help="messages per scenario")
+    p.add_argument("--bindings", type=int, default=200, help="asset feed: bindings per policy")
+    p.add_argument("--members", type=int, default=5, help="asset feed: members per binding")
+    p.add_argument("--changed", type=int, default=3, help="asset feed: bindings gaining a member")
+    p.add_argument("--removed", type=int, default=1, help="asset feed: bindings losing a member")
+    p.add_argument("--conditions", type=float, default=0.1, help="fraction of bindings/deltas with a condition")
+    p.add_argument("--deltas", type=int, default=4, help="audit log: ADD binding deltas")
+    p.add_argument("--removes", type=int, default=1, help="audit log: REMOVE binding deltas")
+    p.add_argument("--dedup", action="store_true", help="keep messageId/sink dedup on (in-memory store)")
+    p.add_argument("--repeat", type=int, default=3, help="timed passes per scenario; the fastest is kept")
+    p.add_argument("--alloc-samples", type=int, default=200, help="messages traced for allocations (0 to skip)")
+    p.add_argument("--scenarios", nargs="*", help="only run scenarios starting with these names")
+    p.add_argument("--output", help="write results as JSON (e.g. a new baseline)")
+    p.add_argument("--baseline", help="previous results JSON to compare throughput against")
+    p.add_argument("--tolerance", type=float, default=0.25, help="allowed throughput drop vs baseline")
+    p.add_argument("--fail-on-regression", action="store_true")
+    args = p.parse_args()
+
+    result = run(args)
+    logging.disable(logging.NOTSET)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    regressions = report(result, baseline, args.tolerance)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+            f.write("\n")
+    if regressions:
+        print(f"\nthroughput regressed beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        if args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
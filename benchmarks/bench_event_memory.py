@@ -0,0 +1,88 @@
+"""Memory footprint of buffered events: dataclass ``IamChangeEvent`` vs interned ``CompactEvent``.
+
+Each event is built from freshly decoded strings, as the handlers produce them, with members drawn from a shared
+pool of principals repeated across roles.
+
+usage: python benchmarks/bench_event_memory.py [--events 10000] [--roles 5] [--members 8] [--principals 200]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tracemalloc
+from typing import Callable, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.destinations import compact
+from lib.destinations.base import ChangeGroup, IamChangeEvent, event_to_dict
+
+
+def make_events(n: int, roles: int, members: int, principals: int, seed: int = 1) -> List[IamChangeEvent]:
+    rnd = random.Random(seed)
+    pool = [f"serviceAccount:sa-{i}@my-proj-{i % 7}.iam.gserviceaccount.com" for i in range(principals)]
+    events = []
+    for i in range(n):
+        # round-trip through JSON so every string is a distinct object, like a decoded Pub/Sub payload
+        changes = json.loads(json.dumps([
+            ["binding_added", f"roles/custom.role{rnd.randrange(50)}", rnd.sample(pool, members)] for _ in range(roles)
+        ]))
+        events.append(IamChangeEvent(
+            resource_type="cloudresourcemanager.googleapis.com/Project",
+            resource_name=f"//cloudresourcemanager.googleapis.com/projects/{i % 100}",
+            resource_display=f"my-proj-{i % 100}",
+            actor=None,
+            source="asset-feed",
+            timestamp="2025-08-21T10:00:24Z",
+            logs_url=None,
+            raw=None,
+            changes=[ChangeGroup(et, role, None, m) for et, role, m in changes],
+        ))
+    return events
+
+
+def footprint(build: Callable[[], list]) -> int:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del kept
+    return used
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--events", type=int, default=10000)
+    p.add_argument("--roles", type=int, default=5, help="change groups per event")
+    p.add_argument("--members", type=int, default=8, help="members per change group")
+    p.add_argument("--principals", type=int, default=200, help="distinct principals shared by all events")
+    args = p.parse_args()
+
+    def plain() -> list:
+        return make_events(args.events, args.roles, args.members, args.principals)
+
+    def compacted() -> list:
+        interner = compact.Interner()
+        out = []
+        # convert as events arrive so the decoded duplicates can be freed, as a buffer would
+        for e in make_events(args.events, args.roles, args.members, args.principals):
+            out.append(compact.compact(e, interner))
+        return out
+
+    dataclass_bytes = footprint(plain)
+    compact_bytes = footprint(compacted)
+    print(f"{'representation':<16} {'resident MiB':>12} {'bytes/event':>12}")
+    print(f"{'dataclass':<16} {dataclass_bytes / 2**20:>12.2f} {dataclass_bytes / args.events:>12.0f}")
+    print(f"{'compact':<16} {compact_bytes / 2**20:>12.2f} {compact_bytes / args.events:>12.0f}")
+
+    sample = make_events(min(args.events, 1000), args.roles, args.members, args.principals)
+    as_json = sum(len(json.dumps(event_to_dict(e), separators=(",", ":"))) for e in sample)
+    as_compact = sum(len(compact.dumps(e)) for e in sample)
+    print(f"\nserialized, {len(sample)} events: json {as_json / len(sample):.0f} B/event, "
+          f"compact {as_compact / len(sample):.0f} B/event")
+
+
+if __name__ == "__main__":
+    main()
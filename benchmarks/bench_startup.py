@@ -0,0 +1,58 @@
+"""Cold-start cost: import time of the Cloud Function entry point, measured with ``python -X importtime``.
+
+Each run is a fresh interpreter. Reports the median cumulative import time of the target module and the
+slowest imports underneath it.
+
+usage: python benchmarks/bench_startup.py [--module main] [--runs 5] [--top 15] [--dest-types slack]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(module: str, env: Dict[str, str]) -> List[Tuple[str, int, int]]:
+    """(module, self us, cumulative us) for every import of one fresh ``import <module>``."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative, name = (p.strip() for p in line[len("import time:"):].split("|"))
+        rows.append((name, int(self_us), int(cumulative)))
+    return rows
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--module", default="main")
+    p.add_argument("--runs", type=int, default=5)
+    p.add_argument("--top", type=int, default=15, help="slowest imports to list (by cumulative time)")
+    p.add_argument("--dest-types", default="slack", help="DEST_TYPES for the child interpreter")
+    args = p.parse_args()
+
+    env = dict(os.environ, DEST_TYPES=args.dest_types, PYTHONDONTWRITEBYTECODE="")
+    import_times(args.module, env)  # warm the bytecode cache so runs only measure imports
+
+    totals = []
+    last: List[Tuple[str, int, int]] = []
+    for _ in range(args.runs):
+        last = import_times(args.module, env)
+        totals.append(next(c for name, _, c in reversed(last) if name == args.module))
+
+    print(f"import {args.module}: median {statistics.median(totals) / 1000:.1f} ms, "
+          f"min {min(totals) / 1000:.1f} ms over {args.runs} runs (DEST_TYPES={args.dest_types})\n")
+    print(f"{'cumulative ms':>13} {'self ms':>8}  module")
+    for name, self_us, cumulative in sorted(last, key=lambda r: r[2], reverse=True)[:args.top]:
+        print(f"{cumulative / 1000:>13.1f} {self_us / 1000:>8.1f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Synthetic, deterministic inputs for the benchmarks: asset-feed messages, GCS audit logs and Pub/Sub envelopes."""
+import base64
+import json
+import random
+from typing import Any, Dict, List, Optional
+
+PROJECT_NUMBER = "1067072829763"
+
+
+def _condition(i: int) -> Dict[str, str]:
+    return {"title": f"expires-{i}", "expression": f'request.time < timestamp("2030-01-{i % 28 + 1:02d}T00:00:00Z")'}
+
+
+def asset_message(
+        bindings: int = 100,
+        members: int = 5,
+        changed: int = 5,
+        removed: int = 0,
+        conditions: float = 0.0,
+        asset_type: str = "cloudresourcemanager.googleapis.com/Project",
+        seed: int = 0,
+) -> Dict[str, Any]:
+    """An asset-feed IAM_POLICY message with a policy of ``bindings`` x ``members``.
+
+    ``changed`` bindings gain one new member and ``removed`` other bindings lose one; ``conditions`` is the
+    fraction of bindings carrying an IAM condition.
+    """
+    rnd = random.Random(seed)
+    old: List[Dict[str, Any]] = []
+    for i in range(bindings):
+        b: Dict[str, Any] = {
+            "role": f"roles/custom.role{i}",
+            "members": [f"serviceAccount:sa-{i}-{j}@my-proj.iam.gserviceaccount.com" for j in range(members)],
+        }
+        if rnd.random() < conditions:
+            b["condition"] = _condition(i)
+        old.append(b)
+
+    new = [dict(b, members=list(b["members"])) for b in old]
+    picks = rnd.sample(range(bindings), min(bindings, changed + removed))
+    for i in picks[:changed]:
+        new[i]["members"].append(f"user:new-{seed}-{i}@example.com")
+    for i in picks[changed:]:
+        new[i]["members"] = new[i]["members"][1:]
+
+    name = f"//cloudresourcemanager.googleapis.com/projects/{PROJECT_NUMBER}"
+    ancestors = [f"projects/{PROJECT_NUMBER}", "organizations/204449333134"]
+    return {
+        "asset": {"name": name, "assetType": asset_type, "ancestors": ancestors, "iamPolicy": {"bindings": new},
+                  "updateTime": "2025-08-21T10:00:24.618693Z"},
+        "priorAsset": {"name": name, "assetType": asset_type, "ancestors": ancestors,
+                       "iamPolicy": {"bindings": old}},
+        "priorAssetState": "PRESENT",
+        "window": {"startTime": "2025-08-21T10:00:24.618693Z"},
+    }
+
+
+def audit_message(deltas: int = 4, removes: int = 0, conditions: float = 0.0, seed: int = 0) -> Dict[str, Any]:
+    """A GCS ``storage.setIamPermissions`` Admin Activity log with ``deltas`` ADD and ``removes`` REMOVE deltas."""
+    rnd = random.Random(seed)
+    binding_deltas = []
+    for i in range(deltas + removes):
+        d: Dict[str, Any] = {
+            "action": "ADD" if i < deltas else "REMOVE",
+            "member": f"user:user-{seed}-{i}@example.com",
+            "role": f"roles/storage.{rnd.choice(['objectViewer', 'objectAdmin', 'bucketViewer'])}",
+        }
+        if rnd.random() < conditions:
+            d["condition"] = _condition(i)
+        binding_deltas.append(d)
+    bucket = f"bench-bucket-{seed}"
+    return {
+        "insertId": f"bench{seed}",
+        "logName": "projects/my-proj/logs/cloudaudit.googleapis.com%2Factivity",
+        "protoPayload": {
+            "@type": "type.googleapis.com/google.cloud.audit.AuditLog",
+            "authenticationInfo": {"principalEmail": "bob@example.com"},
+            "methodName": "storage.setIamPermissions",
+            "resourceName": f"projects/_/buckets/{bucket}",
+            "serviceData": {
+                "@type": "type.googleapis.com/google.iam.v1.logging.AuditData",
+                "policyDelta": {"bindingDeltas": binding_deltas},
+            },
+            "serviceName": "storage.googleapis.com",
+        },
+        "resource": {"labels": {"bucket_name": bucket, "project_id": "my-proj"}, "type": "gcs_bucket"},
+        "timestamp": "2025-08-21T10:00:24.618693819Z",
+    }
+
+
+def envelope(msg: Dict[str, Any], message_id: Optional[str] = None) -> Dict[str, Any]:
+    """Pub/Sub push envelope, as ``hello_pubsub`` receives it in ``event.data``."""
+    return {
+        "message": {
+            "data": base64.b64encode(json.dumps(msg).encode()).decode(),
+            "attributes": {},
+            "messageId": message_id,
+            "publishTime": "2025-08-21T10:00:25Z",
+        },
+        "subscription": "projects/my-proj/subscriptions/bench",
+    }
@@ -9,10 +9,15 @@ DEFAULT_CHANNEL = "#test-temp"
 class Config:
     dest_types: str
     log_level: int
+    dedup_enabled: bool = True
+    metrics_log_interval: float = 60.0
 
 
 def load_config() -> Config:
     level = getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO)
     # Default to Slack, but we won't require Slack vars unless Slack is actually selected.
     dest_types = os.getenv("DEST_TYPES", os.getenv("DEST_TYPE", "slack"))
-    return Config(dest_types=dest_types, log_level=level)
+    dedup_enabled = os.getenv("DEDUP_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on")
+    metrics_log_interval = float(os.getenv("METRICS_LOG_INTERVAL", "60"))
+    return Config(dest_types=dest_types, log_level=level, dedup_enabled=dedup_enabled,
+                  metrics_log_interval=metrics_log_interval)
@@ -0,0 +1,57 @@
+"""Handler registry: each handler declares the dispatch key(s) of the messages it builds events from.
+
+Keys are
+  ("asset", <content type>)                                  for Cloud Asset feed messages
+  ("audit", <serviceName>, <methodName>, <resource.type>)    for audit log entries
+so routing a message is one key computation and one dict lookup.
+"""
+import importlib
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+from lib.decode import PayloadRef
+from lib.destinations.base import IamChangeEvent
+
+DispatchKey = Tuple[str, ...]
+BuildFn = Callable[[Dict[str, Any], Optional[PayloadRef]], Optional[IamChangeEvent]]
+
+
+class Handler(NamedTuple):
+    name: str
+    build: BuildFn  # (message, source bytes ref) -> event, or None when there is nothing to notify
+
+
+HANDLERS: Dict[DispatchKey, Handler] = {}
+
+
+def register(name: str, *keys: DispatchKey) -> Callable[[BuildFn], BuildFn]:
+    def _decorator(fn: BuildFn) -> BuildFn:
+        for key in keys:
+            if key in HANDLERS:
+                raise ValueError(f"dispatch key {key} already registered by {HANDLERS[key].name}")
+            HANDLERS[key] = Handler(name, fn)
+        return fn
+
+    return _decorator
+
+
+def dispatch_key(msg: Dict[str, Any]) -> Optional[DispatchKey]:
+    current = msg.get("asset")
+    if isinstance(current, dict):
+        prior = msg.get("priorAsset") or {}
+        content_type = "iam-policy" if "iamPolicy" in current or "iamPolicy" in prior else "resource"
+        return ("asset", content_type)
+
+    pp = msg.get("protoPayload")
+    if isinstance(pp, dict):
+        res = msg.get("resource") or {}
+        return ("audit", pp.get("serviceName"), pp.get("methodName"), res.get("type"))
+    return None
+
+
+def lookup(msg: Dict[str, Any]) -> Optional[Handler]:
+    return HANDLERS.get(dispatch_key(msg))
+
+
+# Import handler modules last so their @register decorators populate HANDLERS.
+for _module in ("asset", "audit", "resource"):
+    importlib.import_module(f"handlers.{_module}")
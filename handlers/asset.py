@@ -1,14 +1,27 @@
 import logging
+import os
 import re
-from typing import Dict, Any, List, Optional, Tuple, Set
+from typing import Any, Dict, List, Optional, Tuple
 
+from handlers import register
+from lib.decode import PayloadRef
 from lib.destinations.base import ChangeGroup, IamChangeEvent
-from lib.destinations.factory import make_destination
-from lib.gcp import crm_client
+from lib.destinations.factory import get_destination
+from lib.gcp import ancestor_path, resolve_ancestor
 from lib.logs_url import build_log_url, logs_query_activity
+from lib.metrics import stage
+from lib.policy_store import Seen, SqlitePolicyStore, default_policy_store
+from lib.suppress import drop_suppressed, suppressor
 
+# Feeds for these types carry no priorAsset: they are skipped unless POLICY_STORE_PATH keeps their last policy.
 IGNORED_ASSET_TYPES = {"storage.googleapis.com/Bucket"}
 
+# Which delta kinds turn into notifications: "binding_added", "binding_removed" (comma-separated).
+NOTIFY_EVENT_TYPES = frozenset(
+    x.strip() for x in os.getenv("NOTIFY_EVENT_TYPES", "binding_added").split(",") if x.strip()
+)
+CHANGE_EVENT_TYPES = {"members_added": "binding_added", "members_removed": "binding_removed"}
+
 
 def _cond_key(cond: Optional[Dict[str, Any]]) -> Tuple:
     """Stable, comparable key for a condition dict (None → unique sentinel)."""
@@ -18,105 +31,133 @@ def _cond_key(cond: Optional[Dict[str, Any]]) -> Tuple:
     return ("cond", cond.get("expression"), cond.get("title"), cond.get("description"))
 
 
-def _compute_deltas(asset_json: Dict[str, Any]) -> List[Dict[str, Any]]:
-    asset = (asset_json.get("asset") or {})
-    prior = (asset_json.get("priorAsset") or {})
+def _bindings(resource: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return (resource.get("iamPolicy", {}) or {}).get("bindings", []) or []
+
+
+def _diff_members(old: List[str], new: List[str]) -> Tuple[List[str], List[str]]:
+    """(added, removed) between two member lists, each sorted.
 
-    new_bindings: List[Dict[str, Any]] = (asset.get("iamPolicy", {}) or {}).get("bindings", []) or []
-    old_bindings: List[Dict[str, Any]] = (prior.get("iamPolicy", {}) or {}).get("bindings", []) or []
+    Unchanged bindings — nearly all of them in a large policy — are detected with one list comparison and cost
+    no set building or sorting; for changed ones only the (small) difference is sorted.
+    """
+    if old == new:
+        return [], []
+    old_set, new_set = set(old), set(new)
+    added = sorted({m for m in new if m not in old_set})
+    removed = sorted({m for m in old if m not in new_set})
+    return added, removed
 
-    # Index old by (role, cond_key) -> set(members)
-    old_index: Dict[Tuple[str, Tuple], Set[str]] = {}
-    for ob in old_bindings:
+
+def _compute_deltas(asset_json: Dict[str, Any],
+                    prior_bindings: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+    """Member additions and removals between ``priorAsset`` and ``asset`` IAM policies, per (role, condition).
+
+    ``prior_bindings`` (from the policy store) replaces the ``priorAsset`` policy when given.
+    One pass over each binding list: old bindings are indexed by (role, condition), new bindings are matched
+    against (and popped from) that index, and whatever is left in it was removed entirely.
+    """
+    asset = (asset_json.get("asset") or {})
+    if prior_bindings is None:
+        prior_bindings = _bindings(asset_json.get("priorAsset") or {})
+
+    # Index old by (role, cond_key) -> (condition, members)
+    old_index: Dict[Tuple[str, Tuple], Tuple[Any, List[str]]] = {}
+    for ob in prior_bindings:
         role = ob.get("role")
         if not role:
             continue
-        ck = _cond_key(ob.get("condition"))
-        members = set(ob.get("members", []) or [])
-        old_index[(role, ck)] = members
+        cond = ob.get("condition")
+        old_index[(role, _cond_key(cond))] = (cond, ob.get("members", []) or [])
 
     deltas: List[Dict[str, Any]] = []
 
+    def _emit(role: str, cond: Any, members: List[str], change: str) -> None:
+        if members:
+            deltas.append({"role": role, "members": members, "condition": cond, "change": change})
+
     # Compare new against old with the same (role, condition)
-    for nb in new_bindings:
+    for nb in _bindings(asset):
         role = nb.get("role")
         if not role:
             continue
         cond = nb.get("condition")
-        ck = _cond_key(cond)
-
-        new_members = set(nb.get("members", []) or [])
-        if not new_members:
-            continue  # nothing to report
-
-        prev_members = old_index.get((role, ck), set())
-        added = sorted(new_members - prev_members)
-
-        if (role, ck) not in old_index:
-            # No prior binding for this (role, condition) → report the whole binding (legacy behavior)
-            deltas.append({
-                "role": role,
-                "members": sorted(new_members),
-                "condition": cond,
-                "change": "members_added",
-            })
-        elif added:
-            # Same (role, condition) existed → report only newly added members
-            deltas.append({
-                "role": role,
-                "members": added,
-                "condition": cond,
-                "change": "members_added",
-            })
-        # else: no net additions for this (role, condition) → no delta
+        new_members = nb.get("members", []) or []
+
+        prev = old_index.pop((role, _cond_key(cond)), None)
+        if prev is None:
+            # No prior binding for this (role, condition) → report the whole binding
+            _emit(role, cond, sorted(set(new_members)), "members_added")
+            continue
+
+        added, removed = _diff_members(prev[1], new_members)
+        _emit(role, cond, added, "members_added")
+        _emit(role, cond, removed, "members_removed")
+
+    # Bindings that disappeared altogether
+    for (role, _), (cond, old_members) in old_index.items():
+        _emit(role, cond, sorted(set(old_members)), "members_removed")
 
     return deltas
 
 
-def process_feeds(msg: Dict[str, Any]) -> None:
+def _remember(store: SqlitePolicyStore, msg: Dict[str, Any], asset: Dict[str, Any]) -> Seen:
+    """Record this message's policy in the store and return the prior to diff it against."""
+    name = asset.get("name", "unknown")
+    prior = msg.get("priorAsset")
+    seen = store.record(name, asset.get("updateTime", ""), _bindings(asset), _bindings(prior) if prior else None)
+    if msg.get("deleted"):
+        store.forget(name)
+    return seen
+
+
+@register("asset", ("asset", "iam-policy"))
+def build_feed_event(msg: Dict[str, Any], source: Optional[PayloadRef] = None) -> Optional[IamChangeEvent]:
+    """Turn an asset-feed message into an event, or None when there is nothing to notify."""
     asset = msg.get("asset") or {}
     asset_type = asset.get("assetType")
     if not asset or not asset_type:
         logging.debug("No asset payload; skip.")
-        return
-    if asset_type in IGNORED_ASSET_TYPES:
+        return None
+    if suppressor().skips(asset_type):
+        logging.debug("Asset type %s is suppressed; skip.", asset_type)
+        return None
+    store = default_policy_store()
+    if asset_type in IGNORED_ASSET_TYPES and store is None:
         logging.info("Skipping asset type: %s", asset_type)
-        return
-
-    deltas = _compute_deltas(msg)
+        return None
+
+    with stage("delta", handler="asset"):
+        prior_bindings = None
+        if store is not None:
+            seen = _remember(store, msg, asset)
+            if seen.stale:
+                logging.info("Out-of-order feed message for %s; state already newer.", asset.get("name"))
+                return None
+            if seen.prior is None and asset_type in IGNORED_ASSET_TYPES:
+                logging.info("First policy seen for %s; stored as baseline.", asset.get("name"))
+                return None
+            prior_bindings = seen.prior
+        deltas = [
+            d for d in _compute_deltas(msg, prior_bindings) if CHANGE_EVENT_TYPES[d["change"]] in NOTIFY_EVENT_TYPES
+        ]
+    if deltas:
+        with stage("suppress", handler="asset"):
+            deltas = drop_suppressed("asset", asset_type, deltas)
     if not deltas:
-        return
+        return None
 
     asset_name = asset.get("name", "unknown")
     ancestors = asset.get("ancestors", []) or []
     ancestor_name = ancestors[0] if ancestors else ""
     update_time = asset.get("updateTime", "")
 
-    resource_type, resource_id, resource_display = "project", "", "Unknown"
     try:
-        crm = crm_client()
-        if ancestor_name.startswith("projects/"):
-            proj = crm.projects().get(name=ancestor_name).execute()
-            resource_type = "project"
-            resource_id = proj["projectId"]
-            resource_display = proj["projectId"]
-        elif ancestor_name.startswith("folders/"):
-            fld = crm.folders().get(name=ancestor_name).execute()
-            resource_type = "folder"
-            resource_id = fld.get("name", ancestor_name).split("/")[-1]
-            resource_display = f'{fld.get("displayName", ancestor_name)} (*folder-level*)'
-        elif ancestor_name.startswith("organizations/"):
-            org = crm.organizations().get(name=ancestor_name).execute()
-            resource_type = "organization"
-            resource_id = org.get("name", ancestor_name).split("/")[-1]
-            resource_display = f'{org.get("displayName", ancestor_name)} (*organization-level*)'
-        else:
-            resource_id = ancestor_name
-            resource_display = "Unknown"
+        with stage("crm"):
+            resource_type, resource_id, resource_display = resolve_ancestor(ancestor_name)
     except Exception as e:
         logging.warning("CRM lookup failed (%s). Falling back to raw ancestor.", e)
-        resource_id = ancestor_name
-        resource_display = "Unknown"
+        resource_type, resource_id, resource_display = "project", ancestor_name, "Unknown"
 
     service_name = re.sub(r"^/*([^/]+)/.*", r"\1", asset_type)
     resource_name = resource_id if "cloudresourcemanager.googleapis.com" in asset_name else asset_name.split("/")[-1]
@@ -124,34 +165,31 @@ def process_feeds(msg: Dict[str, Any]) -> None:
     scope_key = "organizationId" if resource_type == "organization" else resource_type
     url = build_log_url(query, update_time, scope_key, resource_id)
 
-    groups: List[ChangeGroup] = []
-
-    for b in deltas:
-        b["members"] = [
-            member for member in b["members"]
-            if not any(s in member for s in ["projectEditor", "projectOwner", "projectViewer"])
-        ]
-        if len(b["members"]) == 0:
-            continue
-
-        groups.append(ChangeGroup(
-            event_type="binding_added" if b["change"] == "members_added" else "binding_removed",
+    groups = [
+        ChangeGroup(
+            event_type=CHANGE_EVENT_TYPES[b["change"]],
             role=b.get("role"),
             condition=b.get("condition"),
             members=b.get("members"),
-        ))
-
-    if groups:
-        evt = IamChangeEvent(
-            resource_type=asset_type,
-            resource_name=asset_name,
-            resource_display=resource_display,
-            actor=None,
-            source="asset-feed",
-            timestamp=update_time,
-            logs_url=url,
-            raw=msg,
-            changes=groups,
         )
-        dest = make_destination()
-        dest.send(evt)
+        for b in deltas
+    ]
+    return IamChangeEvent(
+        resource_type=asset_type,
+        resource_name=asset_name,
+        resource_display=resource_display,
+        actor=None,
+        source="asset-feed",
+        timestamp=update_time,
+        logs_url=url,
+        raw=source,
+        changes=groups,
+        ancestors=tuple(ancestors),
+        path=ancestor_path(ancestors),
+    )
+
+
+def process_feeds(msg: Dict[str, Any]) -> None:
+    evt = build_feed_event(msg)
+    if evt is not None:
+        get_destination().send(evt)
@@ -1,33 +1,55 @@
 import logging
 import re
 from collections import defaultdict
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
+from handlers import register
+from lib.decode import PayloadRef
 from lib.destinations.base import ChangeGroup, IamChangeEvent
-from lib.destinations.factory import make_destination
+from lib.destinations.factory import get_destination
+from lib.gcp import ancestor_path, hierarchy
 from lib.logs_url import build_log_url, logs_query_bucket_adds
+from lib.metrics import stage
+from lib.suppress import drop_suppressed, suppressor
 
+RESOURCE_TYPE = "storage.googleapis.com/Bucket"
 
-def process_audit_logs(msg: Dict[str, Any]) -> None:
-    """GCS Admin Activity audit log handler — includes raw condition dicts like asset feed."""
+
+@register("audit", ("audit", "storage.googleapis.com", "storage.setIamPermissions", "gcs_bucket"))
+def build_audit_event(msg: Dict[str, Any], source: Optional[PayloadRef] = None) -> Optional[IamChangeEvent]:
+    """GCS Admin Activity audit log handler — includes raw condition dicts like asset feed.
+
+    Only reached through the registry, which already matched serviceName/methodName/resource.type.
+    """
     pp = msg.get("protoPayload", {}) or {}
     res = msg.get("resource", {}) or {}
     labels = res.get("labels", {}) or {}
-
-    if not (
-            pp.get("serviceName") == "storage.googleapis.com"
-            and pp.get("methodName") == "storage.setIamPermissions"
-            and res.get("type") == "gcs_bucket"
-    ):
-        logging.debug("Not a GCS SetIamPolicy event.")
-        return
+    if suppressor().skips(RESOURCE_TYPE):
+        return None
 
     # Keep only ADD binding deltas
-    deltas = (pp.get("serviceData", {}).get("policyDelta", {}).get("bindingDeltas", []) or [])
-    adds = [d for d in deltas if d.get("action") == "ADD"]
+    with stage("delta", handler="audit"):
+        deltas = (pp.get("serviceData", {}).get("policyDelta", {}).get("bindingDeltas", []) or [])
+        adds = [d for d in deltas if d.get("action") == "ADD"]
     if not adds:
         logging.info("Bucket IAM change has no ADD actions; skipping notify.")
-        return
+        return None
+
+    role_members = defaultdict(list)
+    for d in adds:
+        role = d.get("role", "unknown-role")
+        condition = str(d.get("condition"))
+        member = d.get("member", "unknown-member")
+        role_members[(role, condition)].append(member)
+
+    actor = pp.get("authenticationInfo", {}).get("principalEmail", "unknown")
+    with stage("suppress", handler="audit"):
+        changes = drop_suppressed("audit", RESOURCE_TYPE, [
+            {"role": role, "condition": condition, "members": members}
+            for (role, condition), members in role_members.items()
+        ], actor)
+    if not changes:
+        return None
 
     bucket = labels.get("bucket_name")
     if not bucket:
@@ -36,38 +58,43 @@ def process_audit_logs(msg: Dict[str, Any]) -> None:
         bucket = m.group(1) if m else rn or "unknown-bucket"
 
     project_id = labels.get("project_id", "unknown-project")
-    actor = pp.get("authenticationInfo", {}).get("principalEmail", "unknown")
     ts = msg.get("timestamp") or ""
     url = build_log_url(logs_query_bucket_adds(bucket), ts, "project", project_id)
 
-    groups: List[ChangeGroup] = []
-    role_members = defaultdict(list)
+    groups: List[ChangeGroup] = [
+        ChangeGroup(
+            event_type="binding_added",
+            role=c["role"],
+            condition=c["condition"],
+            members=c["members"]
+        )
+        for c in changes
+    ]
 
-    for d in adds:
-        role = d.get("role", "unknown-role")
-        condition = str(d.get("condition"))
-        member = d.get("member", "unknown-member")
-        role_members[(role, condition)].append(member)
+    ancestors = (f"projects/{project_id}",) if "project_id" in labels else ()
+    index = hierarchy()
+    if ancestors and index is not None:
+        # the log only names the project, by ID; the local index knows its number (what asset events and
+        # rules use), folders and organization
+        chain = index.chain(ancestors[0])
+        if chain:
+            ancestors = tuple(n.name for n in chain)
+    return IamChangeEvent(
+        resource_type=RESOURCE_TYPE,
+        resource_name=bucket,
+        resource_display=project_id,
+        actor=actor,
+        source="audit-logs",
+        timestamp=ts,
+        logs_url=url,
+        raw=source,
+        changes=groups,
+        ancestors=ancestors,
+        path=ancestor_path(ancestors),
+    )
 
-    for (role, condition), members in role_members.items():
-        groups.append(ChangeGroup(
-            event_type="binding_added",
-            role=role,
-            condition=condition,
-            members=members
-        ))
 
-    if groups:
-        evt = IamChangeEvent(
-            resource_type="storage.googleapis.com/Bucket",
-            resource_name=bucket,
-            resource_display=project_id,
-            actor=actor,
-            source="audit-logs",
-            timestamp=ts,
-            logs_url=url,
-            raw=msg,
-            changes=groups,
-        )
-        dest = make_destination()
-        dest.send(evt)
+def process_audit_logs(msg: Dict[str, Any]) -> None:
+    evt = build_audit_event(msg)
+    if evt is not None:
+        get_destination().send(evt)
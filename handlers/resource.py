@@ -0,0 +1,28 @@
+import logging
+from typing import Any, Dict, Optional
+
+from handlers import register
+from lib.decode import PayloadRef
+from lib.destinations.base import IamChangeEvent
+from lib.gcp import hierarchy
+from lib.hierarchy import node_from_asset
+
+
+@register("resource", ("asset", "resource"))
+def build_resource_event(msg: Dict[str, Any], source: Optional[PayloadRef] = None) -> Optional[IamChangeEvent]:
+    """Resource-content feed messages for projects, folders and organizations keep the local hierarchy index
+    current (renames, moves, deletions). They never produce a notification.
+    """
+    index = hierarchy()
+    if index is None:
+        return None
+    node = node_from_asset(msg.get("asset") or {})
+    if node is None:
+        return None
+    if msg.get("deleted"):
+        index.remove(node.name)
+        logging.info("Hierarchy: %s deleted", node.name)
+    else:
+        index.update(node)
+        logging.info("Hierarchy: %s is %r under %s", node.name, node.display, node.parent)
+    return None
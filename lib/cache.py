@@ -0,0 +1,158 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+def _fresh(error: BaseException) -> BaseException:
+    """A copy of a cached ``error`` without a traceback.
+
+    Raising one shared instance would keep appending frames to its ``__traceback__``, so every caller's frames
+    (and the payloads they hold) would stay alive until the entry expires.
+    """
+    try:
+        error = copy.copy(error)
+    except Exception:
+        pass  # not copyable: at least drop the old traceback
+    return error.with_traceback(None)
+
+
+class _Flight:
+    """One in-progress load that concurrent callers for the same key wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries expire after a TTL.
+
+    ``get_or_load`` coalesces concurrent misses for the same key into a single
+    call of the loader (single-flight). Loaders may raise; exceptions accepted
+    by ``negative`` are cached for ``negative_ttl`` seconds and re-raised to
+    every caller until they expire.
+    """
+
+    def __init__(
+            self,
+            maxsize: int = 1024,
+            ttl: float = 300.0,
+            negative_ttl: float = 60.0,
+            negative: Optional[Callable[[BaseException], bool]] = None,
+            clock: Callable[[], float] = time.monotonic,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.negative = negative or (lambda e: False)
+        self.clock = clock
+
+        # key -> (expires_at, is_error, value_or_exception)
+        self._data: "OrderedDict[Hashable, Tuple[float, bool, Any]]" = OrderedDict()
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.negative_hits = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _lookup(self, key: Hashable) -> Optional[Tuple[float, bool, Any]]:
+        # caller holds self._lock
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= self.clock():
+            del self._data[key]
+            self.expirations += 1
+            return None
+        self._data.move_to_end(key)
+        return entry
+
+    def _store(self, key: Hashable, is_error: bool, value: Any) -> None:
+        # caller holds self._lock
+        ttl = self.negative_ttl if is_error else self.ttl
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        self._data[key] = (self.clock() + ttl, is_error, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._lookup(key)
+        if entry is None or entry[1]:
+            return default
+        return entry[2]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._store(key, False, value)
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                if entry[1]:
+                    self.negative_hits += 1
+                    raise _fresh(entry[2])
+                self.hits += 1
+                return entry[2]
+
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                self.misses += 1
+                flight = self._flights[key] = _Flight()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise _fresh(flight.error)
+            return flight.value
+
+        try:
+            flight.value = loader()
+        except BaseException as e:
+            flight.error = e
+            with self._lock:
+                if isinstance(e, Exception) and self.negative(e):
+                    self._store(key, True, _fresh(e))
+                del self._flights[key]
+            flight.done.set()
+            raise
+
+        with self._lock:
+            self._store(key, False, flight.value)
+            del self._flights[key]
+        flight.done.set()
+        return flight.value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "negative_hits": self.negative_hits,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
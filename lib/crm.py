@@ -0,0 +1,93 @@
+"""Minimal Cloud Resource Manager v3 client covering the ``get`` and ``search`` calls this service makes.
+
+Mirrors the ``discovery.build("cloudresourcemanager", "v3")`` call shape (``crm.projects().get(name=..).execute()``)
+without fetching or parsing a discovery document, and imports the auth transport only on first use.
+"""
+import os
+import urllib.parse
+from typing import Any, Dict, Iterator, Optional
+
+ENDPOINT = "https://cloudresourcemanager.googleapis.com/v3/"
+SCOPES = ("https://www.googleapis.com/auth/cloud-platform",)
+
+
+class CrmError(Exception):
+    """Non-2xx answer from CRM; ``status_code`` is what ``lib.gcp`` uses for negative caching."""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"CRM returned {status_code}: {message}")
+        self.status_code = status_code
+
+
+class _Request:
+    __slots__ = ("client", "name")
+
+    def __init__(self, client: "CrmClient", name: str):
+        self.client = client
+        self.name = name
+
+    def execute(self) -> Dict[str, Any]:
+        return self.client.get(self.name)
+
+
+class _Collection:
+    __slots__ = ("client",)
+
+    def __init__(self, client: "CrmClient"):
+        self.client = client
+
+    def get(self, name: str) -> _Request:
+        return _Request(self.client, name)
+
+
+class CrmClient:
+    def __init__(self, credentials=None, session=None, endpoint: str = ENDPOINT, timeout: Optional[float] = None):
+        self.credentials = credentials
+        self.endpoint = endpoint
+        self.timeout = float(os.getenv("CRM_TIMEOUT", "10")) if timeout is None else timeout
+        self._session = session
+
+    @property
+    def session(self):
+        if self._session is None:
+            from google.auth.transport.requests import AuthorizedSession
+
+            credentials = self.credentials
+            if credentials is None:
+                from google.auth import default
+
+                credentials, _ = default(scopes=SCOPES)
+            self._session = AuthorizedSession(credentials)
+        return self._session
+
+    def get(self, name: str) -> Dict[str, Any]:
+        """GET ``v3/{name}`` for ``projects/..``, ``folders/..`` or ``organizations/..``."""
+        resp = self.session.get(self.endpoint + urllib.parse.quote(name, safe="/"), timeout=self.timeout)
+        if resp.status_code != 200:
+            raise CrmError(resp.status_code, resp.text[:200])
+        return resp.json()
+
+    def search(self, collection: str, query: str = "", page_size: int = 500) -> Iterator[Dict[str, Any]]:
+        """Every result of ``v3/{collection}:search`` (``projects``, ``folders``, ``organizations``), page by page."""
+        params: Dict[str, Any] = {"pageSize": page_size}
+        if query:
+            params["query"] = query
+        while True:
+            resp = self.session.get(f"{self.endpoint}{collection}:search", params=params, timeout=self.timeout)
+            if resp.status_code != 200:
+                raise CrmError(resp.status_code, resp.text[:200])
+            page = resp.json()
+            yield from page.get(collection, [])
+            token = page.get("nextPageToken")
+            if not token:
+                return
+            params["pageToken"] = token
+
+    def projects(self) -> _Collection:
+        return _Collection(self)
+
+    def folders(self) -> _Collection:
+        return _Collection(self)
+
+    def organizations(self) -> _Collection:
+        return _Collection(self)
@@ -0,0 +1,67 @@
+"""Pub/Sub payload decoding with as few copies as possible.
+
+``orjson`` (optional) parses the decoded bytes directly; the stdlib fallback has to build an intermediate str.
+"""
+import binascii
+import json
+import zlib
+from typing import Any, Dict, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - exercised when orjson isn't installed
+    orjson = None
+
+
+def b64decode(data: Union[str, bytes]) -> bytes:
+    # binascii accepts ASCII str directly, skipping the str -> bytes copy base64.b64decode makes
+    return binascii.a2b_base64(data)
+
+
+def loads(data: Union[bytes, bytearray, memoryview, str]) -> Any:
+    """Parse JSON; raises ValueError (JSONDecodeError/UnicodeDecodeError) on bad input."""
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
+
+
+class PayloadRef:
+    """Slim reference to a source message: keeps its encoded bytes and only parses them on demand.
+
+    Events delivered straight away just hold the bytes. Once an event is buffered (coalescing), ``shrink()``
+    zlib-compresses payloads above ``compress_over`` bytes (level 1), so a held multi-MB org policy costs a
+    fraction of its size.
+    """
+
+    __slots__ = ("_data", "_compressed", "size", "compress_over")
+
+    def __init__(self, data: bytes, compress_over: int = 64 * 1024):
+        self.size = len(data)
+        self.compress_over = compress_over
+        self._compressed = False
+        self._data = bytes(data)  # no copy for bytes
+
+    def shrink(self) -> "PayloadRef":
+        """Compress the payload in place if it is large; called when the event is kept around."""
+        if not self._compressed and self.size > self.compress_over:
+            self._data = zlib.compress(self._data, 1)
+            self._compressed = True
+        return self
+
+    @classmethod
+    def from_message(cls, msg: Dict[str, Any]) -> "PayloadRef":
+        if orjson is not None:
+            return cls(orjson.dumps(msg))
+        return cls(json.dumps(msg, separators=(",", ":")).encode())
+
+    def to_bytes(self) -> bytes:
+        return zlib.decompress(self._data) if self._compressed else self._data
+
+    def materialize(self) -> Dict[str, Any]:
+        """Parse the original message again (a new dict on every call; nothing is cached)."""
+        return loads(self.to_bytes())
+
+    def __repr__(self) -> str:
+        return f"PayloadRef({self.size} bytes{', compressed' if self._compressed else ''})"
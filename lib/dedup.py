@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Mapping, Optional
+
+from lib.cache import TTLCache
+from lib.destinations.base import IamChangeEvent
+
+
+def event_fingerprint(event: IamChangeEvent) -> str:
+    """Stable hash of what an alert says: resource, (event type, role, condition, members) and source timestamp.
+
+    The timestamp keeps a later re-grant of the same members distinct from a redelivery of the same change.
+    """
+    changes = sorted(
+        (
+            g.event_type,
+            g.role or "",
+            json.dumps(g.condition, sort_keys=True, default=str),
+            sorted(set(g.members)),
+        )
+        for g in event.changes
+    )
+    doc = [event.resource_type, event.resource_name, event.timestamp, changes]
+    return hashlib.sha256(json.dumps(doc, separators=(",", ":")).encode()).hexdigest()
+
+
+class MemoryDedupStore:
+    def __init__(self, ttl: float = 86400.0, maxsize: int = 10000):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def seen(self, key: str) -> bool:
+        return self._cache.get(key) is not None
+
+    def get(self, key: str) -> Optional[str]:
+        return self._cache.get(key)
+
+    def add(self, key: str, value: str = "1") -> None:
+        self._cache.set(key, value)
+
+
+class SqliteDedupStore:
+    """On-disk store shared by processes on one host and surviving restarts."""
+
+    def __init__(self, path: str, ttl: float = 86400.0, prune_every: int = 500):
+        self.ttl = ttl
+        self.prune_every = prune_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS dedup (key TEXT PRIMARY KEY, expires_at REAL NOT NULL, value TEXT)"
+        )
+        if "value" not in {r[1] for r in self._db.execute("PRAGMA table_info(dedup)")}:
+            self._db.execute("ALTER TABLE dedup ADD COLUMN value TEXT")  # files written before values were kept
+
+    def seen(self, key: str) -> bool:
+        with self._lock:
+            row = self._db.execute("SELECT expires_at FROM dedup WHERE key = ?", (key,)).fetchone()
+        return row is not None and row[0] > time.time()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT expires_at, value FROM dedup WHERE key = ?", (key,)).fetchone()
+        return row[1] if row is not None and row[0] > time.time() else None
+
+    def add(self, key: str, value: str = "1") -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO dedup (key, expires_at, value) VALUES (?, ?, ?)", (key, now + self.ttl, value)
+            )
+            self._writes += 1
+            if self._writes % self.prune_every == 0:
+                self._db.execute("DELETE FROM dedup WHERE expires_at <= ?", (now,))
+
+
+class TieredDedupStore:
+    """Memory in front of the on-disk store, so repeated checks don't hit SQLite."""
+
+    def __init__(self, memory: MemoryDedupStore, disk: SqliteDedupStore):
+        self.memory = memory
+        self.disk = disk
+
+    def seen(self, key: str) -> bool:
+        if self.memory.seen(key):
+            return True
+        if self.disk.seen(key):
+            self.memory.add(key)
+            return True
+        return False
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.add(key, value)
+        return value
+
+    def add(self, key: str, value: str = "1") -> None:
+        self.memory.add(key, value)
+        self.disk.add(key, value)
+
+
+class PartLog:
+    """The parts of one split event a sink already delivered, so a retried send resumes at the first unsent part.
+
+    Part ``n`` is kept under ``part:<sink>:<fingerprint>:<n>``, with whatever the sink needs to carry on from it
+    (Slack keeps the ``ts`` of the thread the follow-ups reply to).
+    """
+
+    def __init__(self, store, sink: str, event: IamChangeEvent):
+        self.store = store
+        self._prefix = f"part:{sink}:{event_fingerprint(event)}"
+
+    def get(self, n: int) -> Optional[str]:
+        return self.store.get(f"{self._prefix}:{n}")
+
+    def add(self, n: int, value: str = "1") -> None:
+        self.store.add(f"{self._prefix}:{n}", value)
+
+
+def make_dedup_store(env: Optional[Mapping[str, str]] = None):
+    env = os.environ if env is None else env
+    ttl = float(env.get("DEDUP_TTL", "86400"))
+    memory = MemoryDedupStore(ttl=ttl, maxsize=int(env.get("DEDUP_MAX_ENTRIES", "10000")))
+    path = env.get("DEDUP_PATH")
+    if path:
+        return TieredDedupStore(memory, SqliteDedupStore(path, ttl=ttl))
+    return memory
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def default_store():
+    """Process-wide store configured from the environment; shared by the Pub/Sub handler and the sinks."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = make_dedup_store()
+        return _store
+
+
+def reset_default_store() -> None:
+    global _store
+    with _store_lock:
+        _store = None
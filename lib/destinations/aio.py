@@ -0,0 +1,415 @@
+"""Asyncio counterparts of the destinations, so one event loop can keep many deliveries in flight.
+
+``AsyncDestination`` mirrors ``Destination`` with coroutines. Slack and email have native implementations
+(``aiohttp`` and ``aiosmtplib``, both optional) that reuse the sync sinks' config, rendering, splitting and
+Slack rate limiting; any other sink runs in a worker thread behind ``SyncDestinationAdapter``.
+``build_async_destination`` builds the graph from the same settings as ``factory.build_destination``;
+``worker.py --async`` delivers through it.
+"""
+import asyncio
+import functools
+import json
+import logging
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from lib.dedup import PartLog, default_store, event_fingerprint
+from lib.metrics import RATE_LIMITED, RETRIES, stage, timed_send
+from lib.ratelimit import RateLimiter
+
+from .base import Destination, IamChangeEvent
+from .chunking import split_event
+from .composite import DEFAULT_DEADLINE, destination_name
+from .errors import DeliveryError, DestinationConfigError, PartialDeliveryError
+from .rules import RuleSet
+
+try:
+    import aiohttp
+except ImportError:  # optional: only needed by AsyncSlackDestination without an injected session
+    aiohttp = None
+
+try:
+    import aiosmtplib
+except ImportError:  # optional: only needed by AsyncEmailDestination without an injected client factory
+    aiosmtplib = None
+
+
+class AsyncDestination(ABC):
+    @abstractmethod
+    async def send(self, event: IamChangeEvent) -> None:
+        ...
+
+    async def send_many(self, events: List[IamChangeEvent]) -> None:
+        for event in events:
+            await self.send(event)
+
+    async def close(self) -> None:
+        """Release connections and sessions; must run on the loop that used them."""
+
+
+class SyncDestinationAdapter(AsyncDestination):
+    """Runs a blocking ``Destination`` in the default executor so it can be awaited next to async sinks."""
+
+    def __init__(self, inner: Destination):
+        self.inner = inner
+
+    async def send(self, event: IamChangeEvent) -> None:
+        await asyncio.to_thread(self.inner.send, event)
+
+    async def send_many(self, events: List[IamChangeEvent]) -> None:
+        await asyncio.to_thread(self.inner.send_many, events)
+
+    async def close(self) -> None:
+        await asyncio.to_thread(self.inner.close)
+
+
+class AsyncDedupDestination(AsyncDestination):
+    def __init__(self, inner: AsyncDestination, store, sink: str):
+        self.inner = inner
+        self.store = store
+        self.sink = sink
+
+    async def send(self, event: IamChangeEvent) -> None:
+        key = f"{self.sink}:{event_fingerprint(event)}"
+        # the store may be SQLite-backed; keep its I/O off the loop
+        if await asyncio.to_thread(self.store.seen, key):
+            logging.info("%s: already delivered %s; skipping duplicate.", self.sink, event.resource_name)
+            return
+        await self.inner.send(event)
+        await asyncio.to_thread(self.store.add, key)
+
+    async def close(self) -> None:
+        await self.inner.close()
+
+
+class AsyncRoutingDestination(AsyncDestination):
+    def __init__(self, inner: AsyncDestination, rules: RuleSet):
+        self.inner = inner
+        self.rules = rules
+
+    async def send(self, event: IamChangeEvent) -> None:
+        routed = self.rules.apply(event)
+        if routed is not None:
+            await self.inner.send(routed)
+
+    async def send_many(self, events: List[IamChangeEvent]) -> None:
+        routed = [r for r in (self.rules.apply(e) for e in events) if r is not None]
+        if routed:
+            await self.inner.send_many(routed)
+
+    async def close(self) -> None:
+        await self.inner.close()
+
+
+async def throttle(limiter: RateLimiter, key: str) -> None:
+    """``RateLimiter.acquire`` without blocking the loop."""
+    if limiter.rate <= 0:
+        return
+    store = limiter.store  # SQLite when <PREFIX>RATE_PATH is set: every call runs in a thread
+    shifted = await asyncio.to_thread(store.shifted, key)
+    delay = await asyncio.to_thread(store.reserve, key, limiter.rate, limiter.burst)
+    while delay > 0:
+        await asyncio.sleep(delay)
+        now_shifted = await asyncio.to_thread(store.shifted, key)
+        delay = max(now_shifted - shifted, await asyncio.to_thread(store.paused_for, key))
+        shifted = now_shifted
+
+
+class AsyncSlackDestination(AsyncDestination):
+    """Slack over ``aiohttp``; same env vars, payloads, splitting and shared rate limits as ``SlackDestination``.
+
+    ``session`` may be any object with an aiohttp-style ``post()`` async context manager.
+    """
+
+    def __init__(self, env=None, session=None, part_store=None):
+        from .slack_dest import SlackSettings
+
+        if session is None and aiohttp is None:
+            raise DestinationConfigError("AsyncSlackDestination needs aiohttp (pip install aiohttp).")
+        self.config = SlackSettings(env)  # settings, payload building and the shared rate limiter
+        self.part_store = part_store
+        self._session = session
+        self._owns_session = session is None
+        self._transport_errors: Tuple[type, ...] = (OSError, asyncio.TimeoutError)
+        if aiohttp is not None:
+            self._transport_errors += (aiohttp.ClientError,)
+
+    def _get_session(self):
+        # created lazily: an aiohttp session belongs to the loop it was created on
+        if self._session is None:
+            connect, read = self.config.timeout
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(connect=connect, sock_read=read),
+                connector=aiohttp.TCPConnector(limit_per_host=self.config.pool_size),
+            )
+        return self._session
+
+    async def _post(self, payload: Dict[str, object]) -> Tuple[int, Any, str]:
+        cfg = self.config
+        if cfg.webhook:
+            url, headers, body = cfg.webhook, None, cfg._webhook_body(payload)
+        else:
+            url, body = "https://slack.com/api/chat.postMessage", payload
+            headers = {"Authorization": f"Bearer {cfg.token}"}
+        async with self._get_session().post(url, json=body, headers=headers) as resp:
+            return resp.status, resp.headers, await resp.text()
+
+    async def send(self, e: IamChangeEvent) -> None:
+        cfg = self.config
+        thread_ts = None
+        log = None
+        for n, part in enumerate(split_event(e, "slack_mrkdwn", cfg.max_message_bytes, cfg.max_message_lines), 1):
+            if part is not e and self.part_store is not None:
+                log = log or PartLog(self.part_store, "slack", e)
+                done = await asyncio.to_thread(log.get, n)
+                if done is not None:
+                    thread_ts = thread_ts or done or None
+                    continue
+            with stage("render", destination="slack"):
+                payload = cfg._payload(part)
+            if thread_ts:
+                payload["thread_ts"] = thread_ts
+            answer = await self._deliver(payload)
+            if answer is None:
+                return  # permanent failure, already logged
+            if n == 1 and not cfg.webhook:
+                thread_ts = answer.get("ts")
+            if log is not None:
+                await asyncio.to_thread(log.add, n, thread_ts or "")
+
+    async def _deliver(self, payload: Dict[str, object]) -> Optional[Dict[str, Any]]:
+        """Same contract and retry policy as ``SlackDestination._deliver``."""
+        cfg = self.config
+        for attempt in range(cfg.max_attempts):
+            last = attempt == cfg.max_attempts - 1
+            if attempt:
+                RETRIES.inc(destination="slack")
+            await throttle(cfg.limiter, cfg.rate_key)
+            try:
+                with timed_send("slack") as sent:
+                    status, headers, text = await self._post(payload)
+                    answer = {}
+                    if status != 200:
+                        sent.outcome = str(status)
+                    elif not cfg.webhook:
+                        answer = json.loads(text)
+                        if not answer.get("ok", False):
+                            sent.outcome = "error"
+            except self._transport_errors as e:
+                logging.warning("Slack request error (attempt %s): %r", attempt + 1, e)
+                if last:
+                    raise DeliveryError(f"Slack request error after {cfg.max_attempts} attempts: {e!r}") from e
+                await asyncio.sleep(2 ** attempt)
+                continue
+
+            if status == 200 and (cfg.webhook or answer.get("ok", False)):
+                return answer
+            if status in (429, 500, 502, 503, 504):
+                retry_after = int(headers.get("Retry-After", "0"))
+                sleep_for = max(retry_after, 2 ** attempt)
+                if status == 429:
+                    RATE_LIMITED.inc(destination="slack")
+                    await asyncio.to_thread(cfg.limiter.pause, cfg.rate_key, sleep_for)
+                if last:
+                    raise DeliveryError(f"Slack returned {status} after {cfg.max_attempts} attempts",
+                                        retry_after=retry_after)
+                logging.warning("AsyncSlackDestination: retrying after %s seconds (status %s)", sleep_for, status)
+                if not (status == 429 and cfg.limiter.rate > 0):
+                    await asyncio.sleep(sleep_for)
+                continue
+
+            logging.error("AsyncSlackDestination: permanent failure [%s]: %s", status, text)
+            return None
+        return None
+
+    async def close(self) -> None:
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class AsyncEmailDestination(AsyncDestination):
+    """SMTP over ``aiosmtplib``; same env vars and messages as ``EmailDestination``.
+
+    One connection is kept across sends (dropped after ``SMTP_IDLE_TIMEOUT``) and re-established once if the
+    server goes away mid-batch. ``client_factory`` returns an unconnected aiosmtplib-style client.
+    """
+
+    def __init__(self, env=None, client_factory: Optional[Callable[[], Any]] = None, part_store=None):
+        from .email_dest import EmailDestination
+
+        self.config = EmailDestination(env, part_store=part_store)
+        if client_factory is None:
+            if aiosmtplib is None:
+                raise DestinationConfigError("AsyncEmailDestination needs aiosmtplib (pip install aiosmtplib).")
+            cfg = self.config
+            client_factory = functools.partial(
+                aiosmtplib.SMTP,
+                hostname=cfg.smtp_host, port=cfg.smtp_port, timeout=cfg.session.timeout, start_tls=False,
+            )
+        self._factory = client_factory
+        self._disconnected: Tuple[type, ...] = (ConnectionError,)
+        if aiosmtplib is not None:
+            self._disconnected += (aiosmtplib.SMTPServerDisconnected,)
+        self._client = None
+        self._last_used = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self.connects = 0
+
+    async def _connect(self):
+        cfg = self.config
+        client = self._factory()
+        await client.connect()
+        if cfg.smtp_user and cfg.smtp_pass:
+            await client.starttls()
+            await client.login(cfg.smtp_user, cfg.smtp_pass)
+        self.connects += 1
+        return client
+
+    async def _drop(self) -> None:
+        client, self._client = self._client, None
+        if client is not None:
+            try:
+                await client.quit()
+            except Exception:
+                client.close()
+
+    async def send(self, event: IamChangeEvent) -> None:
+        await self.send_many([event])
+
+    async def send_many(self, events: List[IamChangeEvent]) -> None:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # same contract as EmailDestination.send_many: a failure after some events went out is a PartialDeliveryError
+        progress = [0]
+        messages = self.config._messages(events, progress)
+        try:
+            with timed_send("email"):
+                async with self._lock:
+                    await self._send_messages(messages)
+        except Exception as e:
+            if progress[0] == 0:
+                raise
+            raise PartialDeliveryError(progress[0], e) from e
+
+    async def _send_messages(self, messages: Iterator[Any]) -> None:
+        if self._client is not None and time.monotonic() - self._last_used > self.config.session.idle_timeout:
+            await self._drop()
+        reconnected = False
+        while True:
+            # building a mail reads and records split parts in the PartLog (SQLite with DEDUP_PATH): off the loop
+            message = await asyncio.to_thread(next, messages, None)
+            if message is None:
+                return
+            while True:
+                if self._client is None:
+                    self._client = await self._connect()
+                try:
+                    await self._client.send_message(message)
+                except self._disconnected as e:
+                    self._client = None
+                    if reconnected:
+                        raise
+                    logging.info("SMTP session to %s lost (%s); reconnecting.", self.config.smtp_host, e)
+                    reconnected = True
+                    continue
+                self._last_used = time.monotonic()
+                break
+
+    async def close(self) -> None:
+        await self._drop()
+
+
+class AsyncCompositeDestination(AsyncDestination):
+    """Awaits every sink together; a sink past its deadline is cancelled rather than abandoned in a thread."""
+
+    def __init__(
+            self,
+            destinations: List[AsyncDestination],
+            names: Optional[List[str]] = None,
+            deadlines: Optional[Dict[str, float]] = None,
+            default_deadline: float = DEFAULT_DEADLINE,
+    ):
+        self.destinations = destinations
+        self.names = names or [destination_name(d) for d in destinations]
+        self.deadlines = deadlines or {}
+        self.default_deadline = default_deadline
+
+    async def _one(self, name: str, call: Awaitable[None], start: float) -> Dict[str, object]:
+        deadline = self.deadlines.get(name, self.default_deadline)
+        try:
+            await asyncio.wait_for(call, deadline)
+            return {"dest": name, "status": "ok", "ms": round((time.perf_counter() - start) * 1000, 1)}
+        except asyncio.TimeoutError:
+            logging.error("destination_timeout", extra={"dest": name, "deadline_s": deadline})
+            return {"dest": name, "status": "timeout", "ms": round((time.perf_counter() - start) * 1000, 1),
+                    "error": f"timed out after {deadline}s"}
+        except Exception as e:
+            logging.error("destination_failed", exc_info=e, extra={"dest": name})
+            return {"dest": name, "status": "failed", "ms": round((time.perf_counter() - start) * 1000, 1),
+                    "error": str(e)}
+
+    async def _fan_out(self, call: Callable[[AsyncDestination], Awaitable[None]]) -> None:
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *(self._one(name, call(d), start) for name, d in zip(self.names, self.destinations))
+        )
+        errors = [f"{r['dest']}: {r['error']}" for r in results if r["status"] != "ok"]
+        if errors:
+            logging.error("one_or_more_destinations_failed", extra={"errors": errors, "results": list(results)})
+        else:
+            logging.debug("destinations_delivered", extra={"results": list(results)})
+
+    async def send(self, event: IamChangeEvent) -> None:
+        await self._fan_out(lambda d: d.send(event))
+
+    async def send_many(self, events: List[IamChangeEvent]) -> None:
+        await self._fan_out(lambda d: d.send_many(events))
+
+    async def close(self) -> None:
+        await asyncio.gather(*(d.close() for d in self.destinations))
+
+
+# kind -> (native async sink, its optional dependency)
+ASYNC_REGISTRY: Dict[str, Tuple[Callable[..., AsyncDestination], Any]] = {
+    "slack": (AsyncSlackDestination, aiohttp),
+    "email": (AsyncEmailDestination, aiosmtplib),
+}
+
+
+def make_async_single_destination(kind: str, settings=None) -> AsyncDestination:
+    from .factory import _truthy, load_settings, make_single_destination, new_sink, parse_filters
+
+    settings = settings or load_settings()
+    cls, dependency = ASYNC_REGISTRY.get(kind, (None, None))
+    if cls is None or dependency is None or settings.env.get("OUTBOX_PATH"):
+        # no native sink (or its library isn't installed), or delivery goes through the thread-based outbox anyway
+        return SyncDestinationAdapter(make_single_destination(kind, settings))
+
+    dedup = _truthy(settings.env.get("DEDUP_ENABLED", "true"))
+    inst = new_sink(cls, settings.env, default_store() if dedup else None)
+    if dedup:
+        inst = AsyncDedupDestination(inst, default_store(), kind)
+    filters = settings.filters.get(kind) or parse_filters(f"DEST_{kind.upper()}", settings.env)
+    rules = RuleSet.from_env(kind, settings.env, legacy=filters)
+    if rules:
+        inst = AsyncRoutingDestination(inst, rules)
+    return inst
+
+
+def build_async_destination(settings=None) -> AsyncDestination:
+    """Async graph for ``DEST_TYPES``. ``COALESCE_WINDOW_SECONDS`` is not applied here; merge before sending."""
+    from .factory import load_settings
+
+    settings = settings or load_settings()
+    env = settings.env
+    sinks = [make_async_single_destination(t, settings) for t in settings.types]
+    if len(sinks) == 1:
+        return sinks[0]
+    deadlines = {
+        t: float(env[f"DEST_{t.upper()}_TIMEOUT"]) for t in settings.types if f"DEST_{t.upper()}_TIMEOUT" in env
+    }
+    return AsyncCompositeDestination(
+        sinks, names=list(settings.types), deadlines=deadlines, default_deadline=float(env.get("DEST_TIMEOUT", "30"))
+    )
@@ -1,6 +1,10 @@
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from lib.decode import PayloadRef
+
+from .errors import PartialDeliveryError
 
 
 @dataclass
@@ -21,13 +25,77 @@ class IamChangeEvent:
     source: str  # "asset-feed" | "audit-log"
     timestamp: str  # ISO8601
     logs_url: Optional[str]
-    raw: Dict[str, Any]
+    raw: Optional[PayloadRef]  # source message, parsed again only via raw.materialize()
 
     # Grouped changes
     changes: List[ChangeGroup]
 
+    # CRM ancestry of the resource, nearest first ("projects/123", "folders/456", "organizations/789")
+    ancestors: Tuple[str, ...] = ()
+
+    # display names of the ancestors from the organization down, when the local hierarchy index knows them
+    path: Tuple[str, ...] = ()
+
+    # format -> rendering, filled by lib.destinations.render and shared by every sink that gets this event
+    _rendered: Dict[str, Any] = field(default_factory=dict, init=False, repr=False, compare=False)
+
+
+MEMBERS_LABEL = {"binding_added": "Granted to", "binding_removed": "Revoked from"}
+
+
+def change_title(event: IamChangeEvent) -> str:
+    """Headline for an event: "New Role Grant", "Role Revocation", or "IAM Policy Change" when mixed."""
+    kinds = {g.event_type for g in event.changes}
+    if kinds == {"binding_removed"}:
+        return "Role Revocation"
+    if kinds <= {"binding_added"}:
+        return "New Role Grant"
+    return "IAM Policy Change"
+
+
+def event_to_dict(event: IamChangeEvent) -> Dict[str, Any]:
+    """JSON-safe form of an event for queues/persistence. ``raw`` is dropped: sinks never read it."""
+    return {
+        "resource_type": event.resource_type,
+        "resource_name": event.resource_name,
+        "resource_display": event.resource_display,
+        "actor": event.actor,
+        "source": event.source,
+        "timestamp": event.timestamp,
+        "logs_url": event.logs_url,
+        "raw": None,
+        "changes": [asdict(g) for g in event.changes],
+        "ancestors": list(event.ancestors),
+        "path": list(event.path),
+    }
+
+
+def event_from_dict(d: Dict[str, Any]) -> IamChangeEvent:
+    fields = dict(d)
+    fields["raw"] = None
+    fields["changes"] = [ChangeGroup(**g) for g in fields.get("changes", [])]
+    fields["ancestors"] = tuple(fields.get("ancestors", ()))
+    fields["path"] = tuple(fields.get("path", ()))
+    return IamChangeEvent(**fields)
+
 
 class Destination(ABC):
     @abstractmethod
     def send(self, event: IamChangeEvent) -> None:
         ...
+
+    def send_many(self, events: List[IamChangeEvent]) -> None:
+        """Deliver several events; sinks that can share a connection/session override this.
+
+        A failure after the first event raises ``PartialDeliveryError`` saying how many went out.
+        """
+        for i, event in enumerate(events):
+            try:
+                self.send(event)
+            except Exception as e:
+                if i == 0:
+                    raise
+                raise PartialDeliveryError(i, e) from e
+
+    def close(self) -> None:
+        """Release long-lived resources (connections, sessions). Called when the graph is replaced."""
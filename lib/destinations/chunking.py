@@ -0,0 +1,98 @@
+"""Split an event whose rendering would be too large into several smaller events.
+
+Sizes are measured against a text format's templates while walking the members, so parts are produced one at a time
+and the full message is never rendered. Each part carries the original header fields and a slice of the changes;
+an event that already fits is returned as is (keeping its render cache).
+"""
+from dataclasses import replace
+from typing import Iterator, List
+
+from .base import MEMBERS_LABEL, ChangeGroup, IamChangeEvent
+from .render import MEMBERS_PER_LINE, TEMPLATES, format_condition, iter_footer_lines, iter_header_lines
+
+# room for a "(part N)" marker a sink may add
+_PART_MARGIN = 32
+
+
+def _size(s: str) -> int:
+    return len(s.encode("utf-8"))
+
+
+def split_event(event: IamChangeEvent, fmt: str, max_bytes: int, max_lines: int) -> Iterator[IamChangeEvent]:
+    """Yield events whose ``fmt`` rendering stays within ``max_bytes`` (UTF-8) and ``max_lines``.
+
+    A single line longer than the budget (one huge member) still goes out, alone in its part.
+    """
+    t = TEMPLATES[fmt]
+    nl = _size(t.newline)
+    fixed = [*iter_header_lines(event, fmt), *iter_footer_lines(event, fmt)]
+    byte_budget = max(1, max_bytes - sum(_size(s) + nl for s in fixed) - _PART_MARGIN)
+    line_budget = max(1, max_lines - len(fixed))
+
+    parts = _split_changes(event.changes, fmt, byte_budget, line_budget)
+    first = next(parts)
+    second = next(parts, None)
+    if second is None:
+        yield event
+        return
+    yield replace(event, changes=first)
+    yield replace(event, changes=second)
+    for changes in parts:
+        yield replace(event, changes=changes)
+
+
+def _split_changes(groups: List[ChangeGroup], fmt: str, byte_budget: int, line_budget: int
+                   ) -> Iterator[List[ChangeGroup]]:
+    t = TEMPLATES[fmt]
+    esc = t.escape
+    nl = _size(t.newline)
+    more_prefix = _size(t.more(value="")) + nl
+
+    part: List[ChangeGroup] = []
+    used_bytes = used_lines = 0
+
+    for g in groups:
+        label = MEMBERS_LABEL.get(g.event_type, "Members")
+        role_line = _size(t.field(label="Role", value=esc(g.role or "unknown-role"))) + nl
+        cond_line = 0
+        if g.condition:
+            cond_line = _size(t.field(label="With condition", value=esc(format_condition(g.condition)))) + nl
+        first_prefix = _size(t.field(label=label, value="")) + nl
+        # fixed cost of (a piece of) this group in a part: role line, condition line and the first member line
+        overhead_bytes = role_line + cond_line + first_prefix
+        overhead_lines = 2 + (1 if cond_line else 0)
+
+        members = list(g.members)
+        start = 0
+        while True:
+            first_member = _size(esc(members[start])) + 2 if start < len(members) else 0
+            if part and (used_bytes + overhead_bytes + first_member > byte_budget
+                         or used_lines + overhead_lines > line_budget):
+                yield part
+                part, used_bytes, used_lines = [], 0, 0
+            used_bytes += overhead_bytes
+            used_lines += overhead_lines
+            end, in_line = start, 0
+            while end < len(members):
+                cost = _size(esc(members[end])) + 2  # ", " separator
+                line_cost, new_line = 0, in_line == MEMBERS_PER_LINE
+                if new_line:
+                    line_cost = more_prefix
+                if end > start and (used_bytes + line_cost + cost > byte_budget
+                                    or used_lines + (1 if new_line else 0) > line_budget):
+                    break
+                if new_line:
+                    used_lines += 1
+                    in_line = 0
+                used_bytes += line_cost + cost
+                in_line += 1
+                end += 1
+            whole = start == 0 and end == len(members)
+            part.append(g if whole else ChangeGroup(g.event_type, g.role, g.condition, members[start:end]))
+            if end >= len(members):
+                break
+            yield part
+            part, used_bytes, used_lines = [], 0, 0
+            start = end
+    yield part
+
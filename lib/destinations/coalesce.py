@@ -0,0 +1,136 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from .base import ChangeGroup, Destination, IamChangeEvent
+from .compact import AnyEvent, CompactEvent, compact, expand
+
+
+def _cond_key(condition: Any) -> Hashable:
+    # asset-feed conditions are dicts, audit-log ones are strings
+    if isinstance(condition, dict):
+        return json.dumps(condition, sort_keys=True)
+    return condition
+
+
+def _unique(values: List[Optional[str]]) -> List[str]:
+    return list(dict.fromkeys(v for v in values if v))
+
+
+def merge_events(events: List[AnyEvent]) -> IamChangeEvent:
+    """Combine events for the same resource into one, de-duplicating members per (event type, role, condition)."""
+    if len(events) == 1:
+        return expand(events[0])
+
+    groups: "OrderedDict[Tuple, Tuple[Any, Dict[str, None]]]" = OrderedDict()
+    for e in events:
+        for g in e.changes:
+            key = (g.event_type, g.role, _cond_key(g.condition))
+            if key not in groups:
+                groups[key] = (g, {})
+            groups[key][1].update(dict.fromkeys(g.members))
+
+    first, last = events[0], events[-1]
+    actors = _unique([e.actor for e in events])
+    return IamChangeEvent(
+        resource_type=first.resource_type,
+        resource_name=", ".join(_unique([e.resource_name for e in events])),
+        resource_display=first.resource_display,
+        actor=", ".join(actors) if actors else None,
+        source=first.source,
+        timestamp=last.timestamp,
+        logs_url=first.logs_url,
+        raw=None,
+        changes=[ChangeGroup(g.event_type, g.role, g.condition, list(members)) for g, members in groups.values()],
+        ancestors=tuple(first.ancestors),
+        path=tuple(first.path),
+    )
+
+
+class _Buffer:
+    __slots__ = ("deadline", "events")
+
+    def __init__(self, deadline: float):
+        self.deadline = deadline
+        self.events: List[CompactEvent] = []
+
+
+class CoalescingDestination(Destination):
+    """Buffers events per (resource_display, resource_type) for ``window`` seconds and sends one merged event.
+
+    A buffer is sent early once it holds ``max_events`` events. Buffered events are kept in their compact,
+    interned form and live in memory only: put the outbox behind this stage if they must survive a restart.
+    """
+
+    def __init__(self, inner: Destination, window: float, max_events: int = 50):
+        self.inner = inner
+        self.window = window
+        self.max_events = max_events
+        self._buffers: "OrderedDict[Tuple[str, str], _Buffer]" = OrderedDict()
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread: Optional[threading.Thread] = None
+
+    def send(self, event: IamChangeEvent) -> None:
+        key = (event.resource_display, event.resource_type)
+        with self._cond:
+            buf = self._buffers.get(key)
+            if buf is None:
+                buf = self._buffers[key] = _Buffer(time.monotonic() + self.window)
+            buf.events.append(compact(event))
+            full = len(buf.events) >= self.max_events
+            if full:
+                del self._buffers[key]
+            else:
+                self._ensure_thread()
+                self._cond.notify()
+        if full:
+            self.inner.send(merge_events(buf.events))
+
+    def _ensure_thread(self) -> None:
+        # caller holds self._cond
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="coalesce", daemon=True)
+            self._thread.start()
+
+    def _emit(self, events: List[CompactEvent]) -> None:
+        try:
+            self.inner.send(merge_events(events))
+        except Exception:
+            logging.exception("coalesced_send_failed", extra={"events": len(events)})
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stop:
+                    now = time.monotonic()
+                    # buffers are created in deadline order, so only the head can be due first
+                    head = next(iter(self._buffers.values()), None)
+                    if head is not None and head.deadline <= now:
+                        break
+                    self._cond.wait(None if head is None else head.deadline - now)
+                if self._stop:
+                    return
+                now = time.monotonic()
+                due = [k for k, b in self._buffers.items() if b.deadline <= now]
+                batches = [self._buffers.pop(k).events for k in due]
+            for events in batches:
+                self._emit(events)
+
+    def flush(self) -> None:
+        """Send everything buffered right away."""
+        with self._cond:
+            batches = [b.events for b in self._buffers.values()]
+            self._buffers.clear()
+        for events in batches:
+            self._emit(events)
+
+    def close(self) -> None:
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        self.flush()
+        self.inner.close()
@@ -0,0 +1,150 @@
+"""Immutable, slotted event representations for buffering/queuing, with interned member and role strings.
+
+``CompactEvent``/``CompactChangeGroup`` expose the same attributes as ``IamChangeEvent``/``ChangeGroup``, so every
+destination accepts either. ``dumps``/``loads`` give a compact wire form where each distinct string is stored once.
+"""
+import json
+import threading
+import zlib
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Union
+
+from lib.decode import PayloadRef
+
+from .base import ChangeGroup, IamChangeEvent
+
+FORMAT_PREFIX = b"C1"
+
+
+class Interner:
+    """Bounded string table: equal principals/roles share a single str object across buffered events."""
+
+    def __init__(self, maxsize: int = 100_000):
+        self.maxsize = maxsize
+        self._table: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, s: Optional[str]) -> Optional[str]:
+        if s is None:
+            return None
+        hit = self._table.get(s)
+        if hit is not None:
+            return hit
+        with self._lock:
+            if len(self._table) >= self.maxsize:
+                self._table.clear()  # cheap reset; strings already handed out stay valid
+            return self._table.setdefault(s, s)
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+
+default_interner = Interner()
+
+
+class CompactChangeGroup(NamedTuple):
+    event_type: str
+    role: Optional[str]
+    condition: Any
+    members: Tuple[str, ...]
+
+
+class CompactEvent(NamedTuple):
+    resource_type: str
+    resource_name: str
+    resource_display: str
+    actor: Optional[str]
+    source: str
+    timestamp: str
+    logs_url: Optional[str]
+    raw: Optional[PayloadRef]
+    changes: Tuple[CompactChangeGroup, ...]
+    ancestors: Tuple[str, ...] = ()
+    path: Tuple[str, ...] = ()
+
+
+AnyEvent = Union[IamChangeEvent, CompactEvent]
+
+
+def compact(event: AnyEvent, intern: Interner = default_interner) -> CompactEvent:
+    if isinstance(event, CompactEvent):
+        return event
+    return CompactEvent(
+        intern(event.resource_type),
+        event.resource_name,
+        intern(event.resource_display),
+        intern(event.actor),
+        intern(event.source),
+        event.timestamp,
+        event.logs_url,
+        event.raw.shrink() if isinstance(event.raw, PayloadRef) else None,  # buffered: compress large payloads
+        tuple(
+            CompactChangeGroup(intern(g.event_type), intern(g.role), g.condition, tuple(intern(m) for m in g.members))
+            for g in event.changes
+        ),
+        tuple(intern(a) for a in event.ancestors),
+        tuple(intern(p) for p in event.path),
+    )
+
+
+def expand(event: AnyEvent) -> IamChangeEvent:
+    if isinstance(event, IamChangeEvent):
+        return event
+    return IamChangeEvent(
+        resource_type=event.resource_type,
+        resource_name=event.resource_name,
+        resource_display=event.resource_display,
+        actor=event.actor,
+        source=event.source,
+        timestamp=event.timestamp,
+        logs_url=event.logs_url,
+        raw=event.raw,
+        changes=[ChangeGroup(g.event_type, g.role, g.condition, list(g.members)) for g in event.changes],
+        ancestors=tuple(event.ancestors),
+        path=tuple(event.path),
+    )
+
+
+def dumps(event: AnyEvent, compress_over: int = 4096) -> bytes:
+    """Serialize with a string table (each distinct string once); ``raw`` is not persisted."""
+    table: Dict[str, int] = {}
+
+    def ref(s: Optional[str]) -> int:
+        if s is None:
+            return -1
+        idx = table.get(s)
+        if idx is None:
+            idx = table[s] = len(table)
+        return idx
+
+    head = [ref(event.resource_type), ref(event.resource_name), ref(event.resource_display), ref(event.actor),
+            ref(event.source), ref(event.timestamp), ref(event.logs_url)]
+    groups = [[ref(g.event_type), ref(g.role), g.condition, [ref(m) for m in g.members]] for g in event.changes]
+    ancestors = [ref(a) for a in event.ancestors]
+    path = [ref(p) for p in event.path]
+    body = json.dumps([list(table), head, groups, ancestors, path], separators=(",", ":")).encode()
+    if len(body) > compress_over:
+        return FORMAT_PREFIX + b"z" + zlib.compress(body, 1)
+    return FORMAT_PREFIX + b"j" + body
+
+
+def loads(data: bytes, intern: Interner = default_interner) -> CompactEvent:
+    if not data.startswith(FORMAT_PREFIX):
+        raise ValueError("not a compact event payload")
+    body = data[len(FORMAT_PREFIX) + 1:]
+    if data[len(FORMAT_PREFIX):len(FORMAT_PREFIX) + 1] == b"z":
+        body = zlib.decompress(body)
+    strings, head, groups, *rest = json.loads(body)
+    strings = [intern(s) for s in strings]
+
+    def s(idx: int) -> Optional[str]:
+        return None if idx < 0 else strings[idx]
+
+    changes: List[CompactChangeGroup] = [
+        CompactChangeGroup(s(et), s(role), cond, tuple(strings[m] for m in members))
+        for et, role, cond, members in groups
+    ]
+    # payloads written before ancestors/path were added lack the trailing lists
+    ancestors = tuple(strings[a] for a in rest[0]) if rest else ()
+    path = tuple(strings[p] for p in rest[1]) if len(rest) > 1 else ()
+    return CompactEvent(s(head[0]), s(head[1]), s(head[2]), s(head[3]), s(head[4]), s(head[5]), s(head[6]), None,
+                        tuple(changes), ancestors, path)
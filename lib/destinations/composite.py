@@ -1,23 +1,86 @@
 import logging
-from typing import List
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Dict, List, Optional, Tuple
 
 from .base import Destination, IamChangeEvent
 
+DEFAULT_DEADLINE = 30.0
+
+
+def destination_name(d: Destination) -> str:
+    # unwrap decorators (filters, outbox, ...) so logs name the actual sink
+    while hasattr(d, "inner"):
+        d = d.inner
+    return d.__class__.__name__
+
 
 class CompositeDestination(Destination):
-    def __init__(self, destinations: List[Destination]):
+    def __init__(
+            self,
+            destinations: List[Destination],
+            names: Optional[List[str]] = None,
+            deadlines: Optional[Dict[str, float]] = None,
+            default_deadline: float = DEFAULT_DEADLINE,
+            max_workers: int = 8,
+    ):
         self.destinations = destinations
+        self.names = names or [destination_name(d) for d in destinations]
+        self.deadlines = deadlines or {}
+        self.default_deadline = default_deadline
+        self.max_workers = max_workers
+        # One bounded pool per sink: a sink stuck past its deadline only ties up its own threads, so it can't
+        # starve the healthy sinks. Threads are started on demand.
+        self._pools = [
+            ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"fanout-{name}") for name in self.names
+        ]
+
+    @staticmethod
+    def _timed_send(d: Destination, event: IamChangeEvent) -> float:
+        t0 = time.perf_counter()
+        d.send(event)
+        return time.perf_counter() - t0
 
     def send(self, event: IamChangeEvent) -> None:
+        # Fan out in parallel: end-to-end latency is the slowest sink, not the sum of all sinks.
+        start = time.perf_counter()
+        futures: List[Tuple[str, Future]] = [
+            (name, pool.submit(self._timed_send, d, event))
+            for name, d, pool in zip(self.names, self.destinations, self._pools)
+        ]
+
+        results: List[Dict[str, object]] = []
         errors: List[str] = []
-        for d in self.destinations:
+        for name, fut in futures:
+            deadline = self.deadlines.get(name, self.default_deadline)
+            remaining = max(0.0, start + deadline - time.perf_counter())
             try:
-                d.send(event)
+                elapsed = fut.result(timeout=remaining)
+                results.append({"dest": name, "status": "ok", "ms": round(elapsed * 1000, 1)})
+            except FutureTimeout:
+                # A sink that hasn't started yet is cancelled; one already running is abandoned (threads can't be
+                # killed) and its result ignored.
+                fut.cancel()
+                ms = round((time.perf_counter() - start) * 1000, 1)
+                logging.error("destination_timeout", extra={"dest": name, "deadline_s": deadline})
+                results.append({"dest": name, "status": "timeout", "ms": ms})
+                errors.append(f"{name}: timed out after {deadline}s")
             except Exception as e:
                 # never fail the whole pipeline because one sink died
-                logging.exception("destination_failed", extra={"dest": d.__class__.__name__})
-                errors.append(f"{d.__class__.__name__}: {e}")
+                ms = round((time.perf_counter() - start) * 1000, 1)
+                logging.error("destination_failed", exc_info=e, extra={"dest": name})
+                results.append({"dest": name, "status": "failed", "ms": ms, "error": str(e)})
+                errors.append(f"{name}: {e}")
 
         if errors:
             # Let your function log a single summarized error; your runtime logs can be routed to a DLQ topic if desired
-            logging.error("one_or_more_destinations_failed", extra={"errors": errors})
+            logging.error("one_or_more_destinations_failed", extra={"errors": errors, "results": results})
+        else:
+            logging.debug("destinations_delivered", extra={"results": results})
+
+    def close(self) -> None:
+        for pool in self._pools:
+            pool.shutdown(wait=False, cancel_futures=True)
+        for d in self.destinations:
+            d.close()
@@ -0,0 +1,25 @@
+import logging
+
+from lib.dedup import event_fingerprint
+
+from .base import Destination, IamChangeEvent
+
+
+class DedupDestination(Destination):
+    """Skips events this sink already delivered (e.g. on a Pub/Sub redelivery after another sink failed)."""
+
+    def __init__(self, inner: Destination, store, sink: str):
+        self.inner = inner
+        self.store = store
+        self.sink = sink
+
+    def send(self, event: IamChangeEvent) -> None:
+        key = f"{self.sink}:{event_fingerprint(event)}"
+        if self.store.seen(key):
+            logging.info("%s: already delivered %s; skipping duplicate.", self.sink, event.resource_name)
+            return
+        self.inner.send(event)
+        self.store.add(key)
+
+    def close(self) -> None:
+        self.inner.close()
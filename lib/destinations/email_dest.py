@@ -1,45 +1,175 @@
+import logging
 import os
 import smtplib
+import threading
+import time
 from email.message import EmailMessage
+from typing import Iterable, Iterator, List, Mapping, Optional
+
+from lib.dedup import PartLog
+from lib.metrics import stage, timed_send
 
 from .base import Destination, IamChangeEvent
+from .chunking import split_event
+from .errors import PartialDeliveryError
+from .render import render, subject
+
+
+class SmtpSession:
+    """Keeps one authenticated SMTP connection open across sends.
+
+    The connection is dropped after ``idle_timeout`` seconds without use, probed with NOOP when it has been
+    idle for ``health_check_after`` seconds, and re-established transparently when the server went away.
+    """
+
+    def __init__(
+            self,
+            host: str,
+            port: int,
+            user: Optional[str] = None,
+            password: Optional[str] = None,
+            timeout: float = 10.0,
+            idle_timeout: float = 60.0,
+            health_check_after: float = 5.0,
+    ):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+
+        self.lock = threading.Lock()
+        self._conn: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+        self.connects = 0
+
+    def _connect(self) -> smtplib.SMTP:
+        conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.user and self.password:
+            conn.starttls()
+            conn.login(self.user, self.password)
+        self.connects += 1
+        return conn
+
+    def _alive(self, conn: smtplib.SMTP) -> bool:
+        try:
+            return conn.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def drop(self) -> None:
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        try:
+            conn.quit()
+        except (smtplib.SMTPException, OSError):
+            conn.close()
+
+    def get(self) -> smtplib.SMTP:
+        """Return a usable connection; caller holds ``self.lock``."""
+        idle = time.monotonic() - self._last_used
+        if self._conn is not None and idle > self.idle_timeout:
+            self.drop()
+        elif self._conn is not None and idle > self.health_check_after and not self._alive(self._conn):
+            logging.info("SMTP session to %s went stale; reconnecting.", self.host)
+            self.drop()
+        if self._conn is None:
+            self._conn = self._connect()
+        return self._conn
+
+    def send_messages(self, messages: Iterable[EmailMessage]) -> None:
+        """Send messages in order over the session; ``messages`` may be a generator, consumed one at a time."""
+        with self.lock:
+            reconnected = False
+            for message in messages:
+                while True:
+                    conn = self.get()
+                    try:
+                        conn.send_message(message)
+                    except (smtplib.SMTPServerDisconnected, ConnectionError) as e:
+                        # server closed the session under us: reconnect once and resume with the unsent messages
+                        self.drop()
+                        if reconnected:
+                            raise
+                        logging.info("SMTP session to %s lost (%s); reconnecting.", self.host, e)
+                        reconnected = True
+                        continue
+                    self._last_used = time.monotonic()
+                    break
+
+    def close(self) -> None:
+        with self.lock:
+            self.drop()
 
 
 class EmailDestination(Destination):
-    def __init__(self):
-        self.smtp_host = os.getenv("SMTP_HOST", "localhost")
-        self.smtp_port = int(os.getenv("SMTP_PORT", "25"))
-        self.smtp_user = os.getenv("SMTP_USER")
-        self.smtp_pass = os.getenv("SMTP_PASS")
-        self.from_addr = os.getenv("SMTP_EMAIL_FROM")
-        self.to_addr = os.getenv("SMTP_EMAIL_TO")
+    def __init__(self, env: Optional[Mapping[str, str]] = None, part_store=None):
+        env = os.environ if env is None else env
+        self.part_store = part_store  # dedup store recording the parts of split alerts already sent
+        self.smtp_host = env.get("SMTP_HOST", "localhost")
+        self.smtp_port = int(env.get("SMTP_PORT", "25"))
+        self.smtp_user = env.get("SMTP_USER")
+        self.smtp_pass = env.get("SMTP_PASS")
+        self.from_addr = env.get("SMTP_EMAIL_FROM")
+        self.to_addr = env.get("SMTP_EMAIL_TO")
 
-    def send(self, event: IamChangeEvent) -> None:
+        self.session = SmtpSession(
+            self.smtp_host,
+            self.smtp_port,
+            self.smtp_user,
+            self.smtp_pass,
+            timeout=float(env.get("SMTP_TIMEOUT", "10")),
+            idle_timeout=float(env.get("SMTP_IDLE_TIMEOUT", "60")),
+            health_check_after=float(env.get("SMTP_HEALTH_CHECK_AFTER", "5")),
+        )
+        self.max_message_bytes = int(env.get("SMTP_MAX_MESSAGE_BYTES", "500000"))
+        self.max_message_lines = int(env.get("SMTP_MAX_MESSAGE_LINES", "5000"))
+
+    def _build_message(self, event: IamChangeEvent, part: int = 1) -> EmailMessage:
         msg = EmailMessage()
-        msg["Subject"] = f"[GCP IAM] New Role Grant in {event.resource_display}"
+        msg["Subject"] = subject(event) if part == 1 else f"{subject(event)} (part {part})"
         msg["From"] = self.from_addr
         msg["To"] = self.to_addr
+        msg.set_content(render(event, "text"))
+        msg.add_alternative(render(event, "html"), subtype="html")
+        return msg
+
+    def send(self, event: IamChangeEvent) -> None:
+        self.send_many([event])
+
+    def _messages(self, events: List[IamChangeEvent], progress: Optional[List[int]] = None) -> Iterator[EmailMessage]:
+        # oversized events become several mails, each built just before it is sent; sized on the (larger) html part.
+        # progress[0] counts the events whose mails have all been sent (the next one is only pulled after a send),
+        # and the parts of a split event are recorded as they go out, so a retry skips the ones already mailed.
+        progress = [0] if progress is None else progress
+        for i, e in enumerate(events):
+            progress[0] = i
+            log = None
+            for n, part in enumerate(split_event(e, "html", self.max_message_bytes, self.max_message_lines), 1):
+                if part is not e and self.part_store is not None:
+                    log = log or PartLog(self.part_store, "email", e)
+                    if log.get(n) is not None:
+                        continue
+                with stage("render", destination="email"):
+                    msg = self._build_message(part, n)
+                yield msg
+                if log is not None:
+                    log.add(n)
+        progress[0] = len(events)
+
+    def send_many(self, events: List[IamChangeEvent]) -> None:
+        # one session (and one STARTTLS+AUTH at most) for the whole batch
+        progress = [0]
+        try:
+            with timed_send("email"):
+                self.session.send_messages(self._messages(events, progress))
+        except Exception as e:
+            if progress[0] == 0:
+                raise
+            raise PartialDeliveryError(progress[0], e) from e
 
-        header = f"New Role Grant in {event.resource_display or 'Unknown'}"
-        lines = [
-            header,
-            f"<b>Asset Type:</b> {event.resource_type}",
-            f"<b>Asset Name:</b> {event.resource_name}",
-        ]
-        for g in event.changes:
-            lines.append(f"<b>Role:</b> {g.role}")
-            lines.append(f"<b>Granted to:</b> {g.members}")
-            if g.condition:
-                lines.append(f"<b>With condition:</b> {g.condition}")
-        if event.logs_url:
-            lines.append(f'<b><a href="{event.logs_url}">Browse Audit Logs</a></b>')
-
-        body = "<br>".join(lines)
-
-        msg.set_content(body)
-        msg.add_alternative(body, subtype="html")
-        with smtplib.SMTP(self.smtp_host, self.smtp_port, timeout=10) as s:
-            if self.smtp_user and self.smtp_pass:
-                s.starttls()
-                s.login(self.smtp_user, self.smtp_pass)
-            s.send_message(msg)
+    def close(self) -> None:
+        self.session.close()
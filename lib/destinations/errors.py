@@ -1,2 +1,22 @@
+from typing import Optional
+
+
 class DestinationConfigError(RuntimeError):
     pass
+
+
+class DeliveryError(RuntimeError):
+    """Transient delivery failure: the event was not delivered but may succeed later."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class PartialDeliveryError(DeliveryError):
+    """A batch failed partway: the first ``delivered`` events went out, the one after them failed."""
+
+    def __init__(self, delivered: int, cause: BaseException):
+        super().__init__(str(cause), getattr(cause, "retry_after", None))
+        self.delivered = delivered
+        self.cause = cause
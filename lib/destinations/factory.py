@@ -1,67 +1,253 @@
+import importlib
+import inspect
+import json
+import logging
 import os
-from typing import Dict, List
+import threading
+from dataclasses import dataclass, replace
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional, Tuple, Type
 
-from .base import IamChangeEvent, Destination
+from lib.dedup import default_store
+
+from .base import Destination
+from .coalesce import CoalescingDestination
 from .composite import CompositeDestination
-from .email_dest import EmailDestination
-from .slack_dest import SlackDestination
+from .dedup_dest import DedupDestination
+from .outbox import Outbox, OutboxDestination
+from .rules import RoutingDestination, RuleSet
 
+# Sink classes are imported on first use so a process only pays for the sinks in DEST_TYPES
+# (requests for slack, smtplib for email).
 REGISTRY = {
-    "slack": SlackDestination,
-    "email": EmailDestination,
+    "slack": "lib.destinations.slack_dest:SlackDestination",
+    "email": "lib.destinations.email_dest:EmailDestination",
 }
 
+FILTER_KEYS = ("event_types", "roles", "resource_types")
+
 
-def _csv(name: str, default: str = "") -> List[str]:
-    raw = os.getenv(name, default)
+def _split_csv(raw: str) -> List[str]:
     return [x.strip().lower() for x in raw.split(",") if x.strip()]
 
 
-def parse_filters(prefix: str) -> Dict[str, List[str]]:
+def _truthy(raw: str) -> bool:
+    return raw.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _csv(name: str, default: str = "", env: Optional[Mapping[str, str]] = None) -> List[str]:
+    env = os.environ if env is None else env
+    return _split_csv(env.get(name, default))
+
+
+def parse_filters(prefix: str, env: Optional[Mapping[str, str]] = None) -> Dict[str, List[str]]:
     # Example envs:
     # DEST_SLACK_EVENT_TYPES=binding_added,binding_removed
     # DEST_SLACK_ROLES=roles/storage.admin
     # DEST_SLACK_RESOURCE_TYPES=storage.googleapis.com/Bucket
     return {
-        "event_types": _csv(f"{prefix}_EVENT_TYPES"),
-        "roles": _csv(f"{prefix}_ROLES"),
-        "resource_types": _csv(f"{prefix}_RESOURCE_TYPES"),
+        "event_types": _csv(f"{prefix}_EVENT_TYPES", env=env),
+        "roles": _csv(f"{prefix}_ROLES", env=env),
+        "resource_types": _csv(f"{prefix}_RESOURCE_TYPES", env=env),
     }
 
 
-def make_single_destination(kind: str) -> Destination:
-    cls = REGISTRY[kind]
-    inst = cls()
+@dataclass(frozen=True)
+class DestinationSettings:
+    """Immutable snapshot of everything needed to build the destination graph."""
+    types: Tuple[str, ...]
+    filters: Mapping[str, Mapping[str, Tuple[str, ...]]]  # kind -> filter name -> values
+    env: Mapping[str, str]  # process env overlaid with DEST_CONFIG_FILE, read by the sinks
+    config_file: Optional[str] = None
+    config_mtime: Optional[float] = None
+
+
+def _read_config_file(path: str) -> Dict[str, str]:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError(f"{path}: expected a JSON object of VAR -> value")
+    return {str(k): str(v) for k, v in data.items()}
+
+
+def load_settings(env: Optional[Mapping[str, str]] = None) -> DestinationSettings:
+    """Snapshot destination config from the environment.
+
+    If ``DEST_CONFIG_FILE`` points to a JSON object (e.g. a mounted secret/config map), its
+    ``VAR: value`` pairs override the process environment.
+    """
+    merged = dict(os.environ if env is None else env)
+    path = merged.get("DEST_CONFIG_FILE") or None
+    mtime = None
+    if path:
+        mtime = os.stat(path).st_mtime
+        merged.update(_read_config_file(path))
+
+    types = tuple(_csv("DEST_TYPES", merged.get("DEST_TYPE", "slack"), env=merged))
+    filters = {
+        kind: MappingProxyType({k: tuple(v) for k, v in parse_filters(f"DEST_{kind.upper()}", merged).items()})
+        for kind in types
+    }
+    return DestinationSettings(
+        types=types,
+        filters=MappingProxyType(filters),
+        env=MappingProxyType(merged),
+        config_file=path,
+        config_mtime=mtime,
+    )
+
+
+_outboxes: Dict[str, Outbox] = {}
+_outboxes_lock = threading.Lock()
+
+
+def _outbox(path: str) -> Outbox:
+    # one SQLite handle per path for the whole process, shared across graph rebuilds
+    with _outboxes_lock:
+        if path not in _outboxes:
+            _outboxes[path] = Outbox(path)
+        return _outboxes[path]
+
+
+def sink_class(kind: str) -> Type[Destination]:
+    target = REGISTRY[kind]
+    if isinstance(target, str):
+        module, _, name = target.partition(":")
+        target = getattr(importlib.import_module(module), name)
+    return target
+
+
+def new_sink(cls, env: Mapping[str, str], part_store=None):
+    """``cls(env)``, plus ``part_store`` for sinks that split alerts and take one to record the parts they sent."""
+    if part_store is not None and "part_store" in inspect.signature(cls).parameters:
+        return cls(env, part_store=part_store)
+    return cls(env)
 
-    # Optional: decorate with a filter wrapper if any filters are set
-    filters = parse_filters(f"DEST_{kind.upper()}")
-    if any(filters.values()):
-        inst = _FilterWrapper(inst, **filters)
+
+def make_single_destination(kind: str, settings: Optional[DestinationSettings] = None) -> Destination:
+    settings = settings or load_settings()
+    dedup = _truthy(settings.env.get("DEDUP_ENABLED", "true"))
+    inst = new_sink(sink_class(kind), settings.env, default_store() if dedup else None)
+
+    # Optional: persist and deliver from a background worker instead of inside the handler
+    outbox_path = settings.env.get("OUTBOX_PATH")
+    if outbox_path:
+        inst = OutboxDestination.from_env(inst, _outbox(outbox_path), kind, settings.env)
+
+    # Skip events this sink already accepted (Pub/Sub redelivery after a partial failure)
+    if dedup:
+        inst = DedupDestination(inst, default_store(), kind)
+
+    # Optional: routing rules (DEST_<KIND>_RULES and the DEST_<KIND>_ROLES/... filters), compiled once here
+    filters = settings.filters.get(kind) or parse_filters(f"DEST_{kind.upper()}", settings.env)
+    rules = RuleSet.from_env(kind, settings.env, legacy=filters)
+    if rules:
+        inst = RoutingDestination(inst, rules)
     return inst
 
 
-class _FilterWrapper(Destination):
-    def __init__(self, inner: Destination, event_types: List[str], roles: List[str], resource_types: List[str]):
-        self.inner = inner
-        self.event_types = set(event_types)
-        self.roles = set(roles)
-        self.resource_types = set(resource_types)
+def build_destination(settings: DestinationSettings) -> Destination:
+    env = settings.env
+    if len(settings.types) == 1:
+        dest = make_single_destination(settings.types[0], settings)
+    else:
+        sinks = [make_single_destination(t, settings) for t in settings.types]
+        deadlines = {
+            t: float(env[f"DEST_{t.upper()}_TIMEOUT"]) for t in settings.types if f"DEST_{t.upper()}_TIMEOUT" in env
+        }
+        dest = CompositeDestination(
+            sinks,
+            names=list(settings.types),
+            deadlines=deadlines,
+            default_deadline=float(env.get("DEST_TIMEOUT", "30")),
+            max_workers=int(env.get("FANOUT_MAX_WORKERS", "8")),
+        )
 
-    def send(self, event: IamChangeEvent) -> None:
-        if self.event_types and event.event_type not in self.event_types:
-            return
-        if self.roles and (event.role or "") not in self.roles:
-            return
-        if self.resource_types and (event.resource_type or "") not in self.resource_types:
-            return
-        self.inner.send(event)
+    # Optional: merge bursts of events for the same resource before fan-out
+    window = float(env.get("COALESCE_WINDOW_SECONDS", "0"))
+    if window > 0:
+        dest = CoalescingDestination(dest, window, max_events=int(env.get("COALESCE_MAX_EVENTS", "50")))
+    return dest
 
 
 def make_destination() -> Destination:
-    # New: multiple destinations
-    types = _csv("DEST_TYPES", os.getenv("DEST_TYPE", "slack"))
-    if len(types) == 1:
-        return make_single_destination(types[0])
+    """Build a fresh destination graph from the current environment (not cached)."""
+    return build_destination(load_settings())
+
+
+_lock = threading.Lock()
+_settings: Optional[DestinationSettings] = None
+_destination: Optional[Destination] = None
+
+
+def _config_changed(settings: DestinationSettings) -> bool:
+    if not settings.config_file:
+        return False
+    try:
+        return os.stat(settings.config_file).st_mtime != settings.config_mtime
+    except OSError:
+        return False  # file briefly missing during a config map swap: keep the current graph
+
+
+def _current_mtime(path: Optional[str]) -> Optional[float]:
+    try:
+        return os.stat(path).st_mtime if path else None
+    except OSError:
+        return None
+
+
+def _close_later(old: Destination, settings: Optional[DestinationSettings]) -> None:
+    # other threads may still be sending through the old graph: give them DEST_TIMEOUT to finish
+    grace = float(settings.env.get("DEST_TIMEOUT", "30")) if settings is not None else 0.0
+    timer = threading.Timer(grace, old.close)
+    timer.daemon = True
+    timer.start()
+
+
+def _rebuild(stale: Optional[Destination]) -> Destination:
+    global _settings, _destination
+    with _lock:
+        if _destination is not None and _destination is not stale:
+            return _destination  # another thread rebuilt it while we waited
+        try:
+            settings = load_settings()
+            dest = build_destination(settings)
+        except Exception:
+            if _destination is None or _settings is None:
+                raise
+            # e.g. DEST_CONFIG_FILE half-written during a config map swap: keep delivering through the current
+            # graph, and don't re-read the file until it changes again
+            logging.exception("Destination config reload failed; keeping the current graph.")
+            _settings = replace(_settings, config_mtime=_current_mtime(_settings.config_file))
+            return _destination
+        old, old_settings, _settings, _destination = _destination, _settings, settings, dest
+    if old is not None:
+        _close_later(old, old_settings)
+    logging.info("Destination graph built for %s", ",".join(settings.types))
+    return dest
+
+
+def reload_destination() -> Destination:
+    """Rebuild the process-wide destination graph; the previous one is closed once in-flight sends had time to end."""
+    return _rebuild(_destination)
+
+
+def get_destination() -> Destination:
+    """Return the process-wide destination graph, building it on first use.
+
+    The graph is rebuilt when ``DEST_CONFIG_FILE`` changes on disk; environment variables are only
+    read again through an explicit ``reload_destination()``.
+    """
+    dest, settings = _destination, _settings
+    if dest is None or (settings is not None and _config_changed(settings)):
+        return _rebuild(dest)
+    return dest
+
 
-    sinks = [make_single_destination(t) for t in types]
-    return CompositeDestination(sinks)
+def reset_destination() -> None:
+    """Drop the cached graph; the next ``get_destination()`` builds a new one."""
+    global _settings, _destination
+    with _lock:
+        old, _settings, _destination = _destination, None, None
+    if old is not None:
+        old.close()
@@ -0,0 +1,251 @@
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from . import compact
+from .base import Destination, IamChangeEvent, event_from_dict
+from .errors import DeliveryError, PartialDeliveryError
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    sink         TEXT    NOT NULL,
+    payload      BLOB    NOT NULL,
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    available_at REAL    NOT NULL,
+    status       TEXT    NOT NULL DEFAULT 'pending',  -- 'pending' | 'dead'
+    last_error   TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_ready ON outbox (sink, status, available_at);
+"""
+
+
+def _decode(payload: bytes) -> IamChangeEvent:
+    if payload.startswith(compact.FORMAT_PREFIX):
+        return compact.expand(compact.loads(payload))
+    return event_from_dict(json.loads(payload))  # rows queued before the compact format
+
+
+class Outbox:
+    """SQLite (WAL) backed queue shared by every sink of a process; safe across processes on one host.
+
+    Claimed rows are leased rather than removed, so a crashed worker's batch becomes available again
+    once the lease expires.
+    """
+
+    def __init__(self, path: str, lease_seconds: float = 120.0):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+    def enqueue(self, sink: str, payload: bytes) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO outbox (sink, payload, available_at) VALUES (?, ?, ?)",
+                (sink, payload, time.time()),
+            )
+
+    def claim(self, sink: str, limit: int) -> List[Tuple[int, bytes, int]]:
+        """Lease up to ``limit`` ready rows: returns (id, payload, attempts_so_far)."""
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._db.execute(
+                    "SELECT id, payload, attempts FROM outbox"
+                    " WHERE sink = ? AND status = 'pending' AND available_at <= ?"
+                    " ORDER BY id LIMIT ?",
+                    (sink, now, limit),
+                ).fetchall()
+                self._db.executemany(
+                    "UPDATE outbox SET available_at = ?, attempts = attempts + 1 WHERE id = ?",
+                    [(now + self.lease_seconds, r[0]) for r in rows],
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return [(r[0], r[1], r[2]) for r in rows]
+
+    def ack(self, ids: List[int]) -> None:
+        with self._lock:
+            self._db.executemany("DELETE FROM outbox WHERE id = ?", [(i,) for i in ids])
+
+    def retry(self, row_id: int, delay: float, error: str) -> None:
+        with self._lock:
+            self._db.execute(
+                "UPDATE outbox SET available_at = ?, last_error = ? WHERE id = ?",
+                (time.time() + delay, error, row_id),
+            )
+
+    def dead_letter(self, row_id: int, error: str) -> None:
+        with self._lock:
+            self._db.execute("UPDATE outbox SET status = 'dead', last_error = ? WHERE id = ?", (error, row_id))
+
+    def counts(self, sink: Optional[str] = None) -> Dict[str, int]:
+        q = "SELECT status, COUNT(*) FROM outbox"
+        args: Tuple[Any, ...] = ()
+        if sink is not None:
+            q, args = q + " WHERE sink = ?", (sink,)
+        with self._lock:
+            rows = self._db.execute(q + " GROUP BY status", args).fetchall()
+        out = {"pending": 0, "dead": 0}
+        out.update({status: n for status, n in rows})
+        return out
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class OutboxDestination(Destination):
+    """Persists events for ``inner`` and returns immediately; a background worker delivers them.
+
+    Failed batches are retried per event with jittered exponential backoff (honoring
+    ``DeliveryError.retry_after``) and dead-lettered after ``max_attempts``.
+    """
+
+    def __init__(
+            self,
+            inner: Destination,
+            outbox: Outbox,
+            sink: str,
+            batch_size: int = 20,
+            max_attempts: int = 8,
+            backoff_base: float = 2.0,
+            backoff_max: float = 300.0,
+            poll_interval: float = 1.0,
+    ):
+        self.inner = inner
+        self.outbox = outbox
+        self.sink = sink
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.poll_interval = poll_interval
+
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        # flush() bookkeeping: events enqueued by this instance vs. the count seen before an empty claim
+        self._progress = threading.Condition()
+        self._enqueued = 0
+        self._drained = 0
+        self._worker: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, inner: Destination, outbox: Outbox, sink: str, env: Mapping[str, str]) -> "OutboxDestination":
+        return cls(
+            inner,
+            outbox,
+            sink,
+            batch_size=int(env.get("OUTBOX_BATCH_SIZE", "20")),
+            max_attempts=int(env.get("OUTBOX_MAX_ATTEMPTS", "8")),
+            backoff_base=float(env.get("OUTBOX_BACKOFF_BASE", "2")),
+            backoff_max=float(env.get("OUTBOX_BACKOFF_MAX", "300")),
+            poll_interval=float(env.get("OUTBOX_POLL_INTERVAL", "1")),
+        )
+
+    def send(self, event: IamChangeEvent) -> None:
+        self.outbox.enqueue(self.sink, compact.dumps(event))
+        with self._progress:
+            self._enqueued += 1
+        self._ensure_worker()
+        self._wake.set()
+
+    def _ensure_worker(self) -> None:
+        if self._worker is not None:
+            return
+        with self._start_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name=f"outbox-{self.sink}", daemon=True)
+                self._worker.start()
+
+    def _backoff(self, attempts: int, retry_after: Optional[float]) -> float:
+        delay = min(self.backoff_max, self.backoff_base * 2 ** max(attempts - 1, 0))
+        delay *= random.uniform(0.5, 1.5)
+        return max(delay, retry_after or 0)
+
+    def _fail(self, row_id: int, attempts: int, e: Exception) -> None:
+        if attempts >= self.max_attempts:
+            logging.error("outbox_dead_letter", extra={"sink": self.sink, "id": row_id, "error": str(e)})
+            self.outbox.dead_letter(row_id, str(e))
+            return
+        delay = self._backoff(attempts, getattr(e, "retry_after", None) if isinstance(e, DeliveryError) else None)
+        logging.warning("Outbox %s: delivery of %s failed (attempt %s), retry in %.1fs: %s",
+                        self.sink, row_id, attempts, delay, e)
+        self.outbox.retry(row_id, delay, str(e))
+
+    def drain_once(self) -> int:
+        """Deliver one batch of ready rows. Returns how many rows were claimed."""
+        rows = self.outbox.claim(self.sink, self.batch_size)
+        if not rows:
+            return 0
+
+        claimed = len(rows)
+        events = [_decode(payload) for _, payload, _ in rows]
+        try:
+            self.inner.send_many(events)
+            self.outbox.ack([r[0] for r in rows])
+            return claimed
+        except Exception as e:
+            # events the sink already delivered before the failure must not be sent again
+            delivered = e.delivered if isinstance(e, PartialDeliveryError) else 0
+            if delivered:
+                self.outbox.ack([r[0] for r in rows[:delivered]])
+                rows, events = rows[delivered:], events[delivered:]
+                e = e.cause
+            if len(rows) == 1:
+                self._fail(rows[0][0], rows[0][2] + 1, e)
+                return claimed
+            logging.warning("Outbox %s: batch of %s failed (%s); retrying the %s undelivered one by one",
+                            self.sink, claimed, e, len(rows))
+
+        # Isolate the failing events so one bad message doesn't hold back the rest.
+        for (row_id, _, attempts), event in zip(rows, events):
+            try:
+                self.inner.send(event)
+                self.outbox.ack([row_id])
+            except Exception as e:
+                self._fail(row_id, attempts + 1, e)
+        return claimed
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            with self._progress:
+                seen = self._enqueued
+            try:
+                if self.drain_once():
+                    continue
+            except Exception:
+                logging.exception("outbox_worker_error", extra={"sink": self.sink})
+            with self._progress:
+                self._drained = seen
+                self._progress.notify_all()
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def flush(self, timeout: float = 30.0) -> bool:
+        """Wait until nothing is ready to deliver (rows in backoff don't count). Returns False on timeout."""
+        if self._worker is None:
+            return True
+        with self._progress:
+            target = self._enqueued
+            self._wake.set()
+            return self._progress.wait_for(lambda: self._drained >= target, timeout)
+
+    def close(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._worker is not None:
+            self._worker.join(timeout=5)
+        self.inner.close()
@@ -0,0 +1,162 @@
+"""Render an event once per output format and share the result between sinks.
+
+Formats: ``slack_mrkdwn``, ``blocks`` (Slack Block Kit), ``html`` and ``text``. ``iter_lines`` yields a format's
+lines lazily and spreads long member lists over continuation lines, so nothing has to build one giant string;
+``render`` joins them and memoizes the result on the event.
+"""
+import html
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional
+
+from .base import MEMBERS_LABEL, ChangeGroup, IamChangeEvent, change_title
+
+MEMBERS_PER_LINE = 50
+BLOCK_TEXT_LIMIT = 3000  # Slack's limit for a section block's text
+
+
+class Template(NamedTuple):
+    escape: Callable[[str], str]
+    header: Callable[..., str]
+    field: Callable[..., str]
+    more: Callable[..., str]  # continuation of a long member list
+    link: Callable[..., str]
+    newline: str
+    escape_url: Callable[[str], str] = str
+
+
+def _slack_escape(s: str) -> str:
+    return s.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def _slack_url(url: str) -> str:
+    # inside <url|label> a bare "|" would end the URL early
+    return _slack_escape(url).replace("|", "%7C")
+
+
+# format strings are bound once here; rendering only calls them
+TEMPLATES: Dict[str, Template] = {
+    "slack_mrkdwn": Template(
+        escape=_slack_escape,
+        header=":information_source: {title} in {display}".format,
+        field="*{label}:* {value}".format,
+        more="    {value}".format,
+        link="*<{url}|Browse Audit Logs>*".format,
+        newline="\n",
+        escape_url=_slack_url,
+    ),
+    "html": Template(
+        escape=html.escape,
+        header="{title} in {display}".format,
+        field="<b>{label}:</b> {value}".format,
+        more="&nbsp;&nbsp;&nbsp;&nbsp;{value}".format,
+        link='<b><a href="{url}">Browse Audit Logs</a></b>'.format,
+        newline="<br>\n",
+        escape_url=html.escape,
+    ),
+    "text": Template(
+        escape=str,
+        header="{title} in {display}".format,
+        field="{label}: {value}".format,
+        more="    {value}".format,
+        link="Audit logs: {url}".format,
+        newline="\n",
+    ),
+}
+FORMATS = tuple(TEMPLATES) + ("blocks",)
+
+
+def format_condition(condition: Any) -> str:
+    # asset-feed conditions are dicts, audit-log ones are already strings
+    if isinstance(condition, dict):
+        title, expression = condition.get("title"), condition.get("expression")
+        if title and expression:
+            return f"{title} ({expression})"
+        return str(title or expression or condition)
+    return str(condition)
+
+
+def _member_lines(t: Template, label: str, members: List[str]) -> Iterator[str]:
+    esc = t.escape
+    yield t.field(label=label, value=", ".join(esc(m) for m in members[:MEMBERS_PER_LINE]))
+    for i in range(MEMBERS_PER_LINE, len(members), MEMBERS_PER_LINE):
+        yield t.more(value=", ".join(esc(m) for m in members[i:i + MEMBERS_PER_LINE]))
+
+
+def iter_group_lines(g: ChangeGroup, fmt: str) -> Iterator[str]:
+    t = TEMPLATES[fmt]
+    yield t.field(label="Role", value=t.escape(g.role or "unknown-role"))
+    yield from _member_lines(t, MEMBERS_LABEL.get(g.event_type, "Members"), list(g.members))
+    if g.condition:
+        yield t.field(label="With condition", value=t.escape(format_condition(g.condition)))
+
+
+def iter_header_lines(event: IamChangeEvent, fmt: str) -> Iterator[str]:
+    t = TEMPLATES[fmt]
+    yield t.header(title=change_title(event), display=t.escape(event.resource_display or "Unknown"))
+    yield t.field(label="Asset Type", value=t.escape(event.resource_type or ""))
+    yield t.field(label="Asset Name", value=t.escape(event.resource_name or ""))
+    if event.path:
+        yield t.field(label="Hierarchy", value=t.escape(" / ".join(event.path)))
+
+
+def iter_footer_lines(event: IamChangeEvent, fmt: str) -> Iterator[str]:
+    if event.logs_url:
+        t = TEMPLATES[fmt]
+        yield t.link(url=t.escape_url(event.logs_url))
+
+
+def iter_lines(event: IamChangeEvent, fmt: str) -> Iterator[str]:
+    """Lines of ``event`` in a text format (``slack_mrkdwn``, ``html``, ``text``), produced on demand."""
+    yield from iter_header_lines(event, fmt)
+    for g in event.changes:
+        yield from iter_group_lines(g, fmt)
+    yield from iter_footer_lines(event, fmt)
+
+
+def _split_line(line: str, limit: int) -> Iterator[str]:
+    """``line`` in pieces of at most ``limit`` characters, cut after a ", " where possible."""
+    while len(line) > limit:
+        cut = line.rfind(", ", 0, limit - 1) + 2
+        if cut < 2:
+            cut = limit
+            amp = line.rfind("&", cut - 5, cut)
+            if amp > 0 and ";" not in line[amp:cut]:
+                cut = amp  # don't split an escaped "&amp;"
+        yield line[:cut].rstrip()
+        line = line[cut:]
+    yield line
+
+
+def _blocks(event: IamChangeEvent) -> List[Dict[str, Any]]:
+    lines = iter_lines(event, "slack_mrkdwn")
+    header = next(lines)
+    blocks: List[Dict[str, Any]] = [{"type": "section", "text": {"type": "mrkdwn", "text": header}}]
+    buf: List[str] = []
+    size = 0
+    for line in lines:
+        for piece in _split_line(line, BLOCK_TEXT_LIMIT):
+            if buf and size + len(piece) + 1 > BLOCK_TEXT_LIMIT:
+                blocks.append({"type": "section", "text": {"type": "mrkdwn", "text": "\n".join(buf)}})
+                buf, size = [], 0
+            buf.append(piece)
+            size += len(piece) + 1
+    if buf:
+        blocks.append({"type": "section", "text": {"type": "mrkdwn", "text": "\n".join(buf)}})
+    return blocks
+
+
+def subject(event: IamChangeEvent) -> str:
+    return f"[GCP IAM] {change_title(event)} in {event.resource_display}"
+
+
+def render(event: IamChangeEvent, fmt: str) -> Any:
+    """``fmt`` rendering of ``event``: a str, or a list of blocks for ``blocks``. Computed once per event."""
+    cache: Optional[Dict[str, Any]] = getattr(event, "_rendered", None)
+    if cache is not None and fmt in cache:
+        return cache[fmt]
+    if fmt == "blocks":
+        out: Any = _blocks(event)
+    else:
+        out = TEMPLATES[fmt].newline.join(iter_lines(event, fmt))
+    if cache is not None:
+        cache[fmt] = out  # concurrent sinks may both render; either result is the same
+    return out
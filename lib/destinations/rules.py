@@ -0,0 +1,220 @@
+"""Per-sink routing rules, compiled once when the destination graph is built and evaluated per ``ChangeGroup``.
+
+A rule matches a change group when every field it sets matches (lists within a field are alternatives):
+
+* ``roles`` - exact role, prefix (``roles/storage.*``) or glob (``roles/*Admin``); case-insensitive
+* ``members`` - regular expressions, searched in each member; an include rule matches the group if any member
+  does, an exclude rule removes only the members it matches
+* ``event_types``, ``resource_types`` - exact, case-insensitive
+* ``ancestors`` - the resource sits under one of these (``folders/123``, ``organizations/456``, ``projects/789``)
+
+A group is delivered when no exclude rule drops it or all of its members, and no include rule exists or one
+matches what is left. Candidate rules are
+found through a trie over the literal prefix of each role pattern, so evaluation doesn't scan every rule.
+"""
+import dataclasses
+import fnmatch
+import json
+import re
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, List, Mapping, Optional, Pattern, Sequence, Tuple
+
+from .base import Destination, IamChangeEvent
+
+INCLUDE, EXCLUDE = "include", "exclude"
+RULE_FIELDS = ("roles", "members", "event_types", "resource_types", "ancestors")
+_WILDCARDS = re.compile(r"[*?\[]")
+
+
+@dataclasses.dataclass(frozen=True)
+class Rule:
+    action: str = INCLUDE
+    roles: Tuple[str, ...] = ()
+    members: Tuple[str, ...] = ()
+    event_types: Tuple[str, ...] = ()
+    resource_types: Tuple[str, ...] = ()
+    ancestors: Tuple[str, ...] = ()
+
+    @classmethod
+    def from_dict(cls, d: Mapping[str, Any]) -> "Rule":
+        unknown = set(d) - set(RULE_FIELDS) - {"action"}
+        if unknown:
+            raise ValueError(f"unknown rule field(s): {', '.join(sorted(unknown))}")
+        action = str(d.get("action", INCLUDE)).lower()
+        if action not in (INCLUDE, EXCLUDE):
+            raise ValueError(f"rule action must be {INCLUDE!r} or {EXCLUDE!r}, got {action!r}")
+        fields = {}
+        for f in RULE_FIELDS:
+            v = d.get(f) or ()
+            fields[f] = (v,) if isinstance(v, str) else tuple(str(x) for x in v)
+        return cls(action=action, **fields)
+
+
+class _CompiledRule:
+    __slots__ = ("index", "action", "members", "event_types", "resource_types", "ancestors")
+
+    def __init__(self, index: int, rule: Rule):
+        self.index = index
+        self.action = rule.action
+        self.members: Optional[Pattern] = (
+            re.compile("|".join(f"(?:{p})" for p in rule.members)) if rule.members else None
+        )
+        self.event_types = frozenset(x.lower() for x in rule.event_types)
+        self.resource_types = frozenset(x.lower() for x in rule.resource_types)
+        self.ancestors = frozenset(x.lower() for x in rule.ancestors)
+
+    def matches_event(self, resource_type: str, ancestors: FrozenSet[str]) -> bool:
+        if self.resource_types and resource_type not in self.resource_types:
+            return False
+        return not self.ancestors or not self.ancestors.isdisjoint(ancestors)
+
+    def matches_group(self, event_type: str, members: Sequence[str]) -> bool:
+        if self.event_types and event_type not in self.event_types:
+            return False
+        return self.members is None or any(self.members.search(m) for m in members)
+
+
+class _TrieNode:
+    __slots__ = ("children", "entries")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        # (rule index, None for "anything below this prefix" | "" for "exactly here" | compiled glob)
+        self.entries: List[Tuple[int, Any]] = []
+
+
+class RoleIndex:
+    """Maps a role to the rules whose role patterns match it, walking only the role's own characters."""
+
+    def __init__(self):
+        self._root = _TrieNode()
+        self._any: List[int] = []  # rules without a role constraint
+
+    def add(self, rule_index: int, patterns: Sequence[str]) -> None:
+        if not patterns:
+            self._any.append(rule_index)
+            return
+        for pattern in patterns:
+            pattern = pattern.lower()
+            m = _WILDCARDS.search(pattern)
+            literal = pattern if m is None else pattern[:m.start()]
+            node = self._root
+            for ch in literal:
+                node = node.children.setdefault(ch, _TrieNode())
+            if m is None:
+                node.entries.append((rule_index, ""))
+            elif pattern[m.start():] == "*":
+                node.entries.append((rule_index, None))
+            else:
+                node.entries.append((rule_index, re.compile(fnmatch.translate(pattern))))
+
+    def lookup(self, role: str) -> FrozenSet[int]:
+        role = role.lower()
+        found = set(self._any)
+        node = self._root
+        depth = 0
+        while node is not None:
+            for idx, matcher in node.entries:
+                if matcher is None or (matcher == "" and depth == len(role)) or (
+                        matcher != "" and matcher.match(role)):
+                    found.add(idx)
+            if depth == len(role):
+                break
+            node = node.children.get(role[depth])
+            depth += 1
+        return frozenset(found)
+
+
+class RuleSet:
+    def __init__(self, rules: Sequence[Rule]):
+        self.rules = tuple(rules)
+        self._compiled = [_CompiledRule(i, r) for i, r in enumerate(self.rules)]
+        self._has_includes = any(r.action == INCLUDE for r in self.rules)
+        index = RoleIndex()
+        for i, r in enumerate(self.rules):
+            index.add(i, r.roles)
+        # roles repeat heavily across events; remember which rules each one can hit
+        self._candidates = lru_cache(maxsize=4096)(index.lookup)
+
+    def __bool__(self) -> bool:
+        return bool(self.rules)
+
+    @classmethod
+    def from_env(cls, kind: str, env: Mapping[str, str], legacy: Optional[Mapping[str, Sequence[str]]] = None
+                 ) -> "RuleSet":
+        """``DEST_<KIND>_RULES`` (a JSON list of rule objects) plus the older per-sink filter variables."""
+        rules: List[Rule] = []
+        raw = env.get(f"DEST_{kind.upper()}_RULES")
+        if raw:
+            data = json.loads(raw)
+            if not isinstance(data, list):
+                raise ValueError(f"DEST_{kind.upper()}_RULES must be a JSON list of rule objects")
+            rules.extend(Rule.from_dict(d) for d in data)
+        if legacy and any(legacy.values()):
+            # DEST_<KIND>_EVENT_TYPES / _ROLES / _RESOURCE_TYPES: one include rule
+            rules.append(Rule(**{k: tuple(v) for k, v in legacy.items() if v}))
+        return cls(rules)
+
+    def select(self, event: IamChangeEvent) -> List[Any]:
+        """The change groups this rule set lets through, without the members exclude rules matched.
+
+        Untouched groups are returned as they are; a group that lost members is a copy.
+        """
+        resource_type = (event.resource_type or "").lower()
+        ancestors = frozenset(a.lower() for a in getattr(event, "ancestors", ()))
+        applicable = {c.index for c in self._compiled if c.matches_event(resource_type, ancestors)}
+
+        kept = []
+        for g in event.changes:
+            event_type = (g.event_type or "").lower()
+            rules = [self._compiled[idx] for idx in self._candidates(g.role or "") & applicable]
+            members, excluded = g.members, False
+            for rule in rules:
+                if rule.action != EXCLUDE or (rule.event_types and event_type not in rule.event_types):
+                    continue
+                if rule.members is None:
+                    excluded = True
+                    break
+                members = [m for m in members if not rule.members.search(m)]
+            if excluded or (g.members and not members):
+                continue
+            if self._has_includes and not any(
+                    r.action == INCLUDE and r.matches_group(event_type, members) for r in rules):
+                continue
+            if len(members) != len(g.members):
+                g = g._replace(members=tuple(members)) if isinstance(g, tuple) else dataclasses.replace(
+                    g, members=members)
+            kept.append(g)
+        return kept
+
+    def apply(self, event: IamChangeEvent) -> Optional[IamChangeEvent]:
+        """The event itself when every group passes whole, a shallow copy holding what passed, or None."""
+        kept = self.select(event)
+        if len(kept) == len(event.changes) and all(k is g for k, g in zip(kept, event.changes)):
+            return event
+        if not kept:
+            return None
+        if isinstance(event, tuple):  # CompactEvent
+            return event._replace(changes=tuple(kept))
+        return dataclasses.replace(event, changes=kept)
+
+
+class RoutingDestination(Destination):
+    """Hands the inner sink only the change groups its rules select; events with none left are dropped."""
+
+    def __init__(self, inner: Destination, rules: RuleSet):
+        self.inner = inner
+        self.rules = rules
+
+    def send(self, event: IamChangeEvent) -> None:
+        routed = self.rules.apply(event)
+        if routed is not None:
+            self.inner.send(routed)
+
+    def send_many(self, events: List[IamChangeEvent]) -> None:
+        routed = [r for r in (self.rules.apply(e) for e in events) if r is not None]
+        if routed:
+            self.inner.send_many(routed)
+
+    def close(self) -> None:
+        self.inner.close()
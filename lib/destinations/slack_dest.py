@@ -1,17 +1,32 @@
 import logging
 import os
-import requests
+import threading
 import time
+from typing import Dict, Mapping, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from lib.dedup import PartLog
+from lib.metrics import RATE_LIMITED, RETRIES, stage, timed_send
+from lib.ratelimit import limiter_key, make_rate_limiter
+
+from .base import Destination, IamChangeEvent
+from .chunking import split_event
+from .errors import DeliveryError, DestinationConfigError
+from .render import render
 
-from .base import IamChangeEvent, Destination
-from .errors import DestinationConfigError
+MAX_BLOCKS = 50
 
 
-class SlackDestination(Destination):
-    def __init__(self):
-        self.webhook = os.getenv("SLACK_WEBHOOK_URL")
-        self.token = os.getenv("SLACK_TOKEN")
-        self.channel = os.getenv("SLACK_CHANNEL")
+class SlackSettings:
+    """Slack config from the environment plus payload building; shared by the sync and async sinks."""
+
+    def __init__(self, env: Optional[Mapping[str, str]] = None):
+        env = os.environ if env is None else env
+        self.webhook = env.get("SLACK_WEBHOOK_URL")
+        self.token = env.get("SLACK_TOKEN")
+        self.channel = env.get("SLACK_CHANNEL")
 
         if not self.webhook and not (self.token and self.channel):
             raise DestinationConfigError(
@@ -19,62 +34,149 @@ class SlackDestination(Destination):
                 "or both SLACK_TOKEN and SLACK_CHANNEL."
             )
 
-    def send(self, e: IamChangeEvent) -> None:
-        header = f":information_source: New Role Grant in {e.resource_display or 'Unknown'}"
-        lines = [
-            header,
-            f"*Asset Type:* {e.resource_type}",
-            f"*Asset Name:* {e.resource_name}",
-        ]
-        for g in e.changes:
-            lines.append(f"*Role:* {g.role}")
-            lines.append(f"*Granted to:* {g.members}")
-            if g.condition:
-                lines.append(f"*With condition:* {g.condition}")
-        if e.logs_url:
-            lines.append(f"*<{e.logs_url}|Browse Audit Logs>*")
-
-        text = "\n".join(lines)
-
-        payload = {
+        self.timeout = (
+            float(env.get("SLACK_CONNECT_TIMEOUT", "3")),
+            float(env.get("SLACK_READ_TIMEOUT", "10")),
+        )
+        self.pool_size = int(env.get("SLACK_POOL_SIZE", "4"))
+        self.max_attempts = max(1, int(env.get("SLACK_MAX_ATTEMPTS", "3")))
+        self.use_blocks = env.get("SLACK_FORMAT", "mrkdwn").strip().lower() == "blocks"
+        self.max_message_bytes = int(env.get("SLACK_MAX_MESSAGE_BYTES", "12000"))
+        self.max_message_lines = int(env.get("SLACK_MAX_MESSAGE_LINES", "100"))
+        # Slack allows about one message per second per channel; every sender on the host shares this budget
+        self.limiter = make_rate_limiter("SLACK_", env)
+        self.rate_key = limiter_key("webhook", self.webhook) if self.webhook else limiter_key("channel", self.channel)
+
+    @staticmethod
+    def _webhook_body(payload: Dict[str, object]) -> Dict[str, object]:
+        # incoming webhooks post to their own channel as their own user
+        return {k: payload[k] for k in ("text", "blocks") if k in payload}
+
+    def _payload(self, e: IamChangeEvent) -> Dict[str, object]:
+        payload: Dict[str, object] = {
             "channel": self.channel,
-            "text": text,
+            "text": render(e, "slack_mrkdwn"),
             "username": "IAM Notification",
             "unfurl_links": False,
             "unfurl_media": False,
             "icon_emoji": ":identification_card:",
         }
+        if self.use_blocks:
+            blocks = render(e, "blocks")
+            if len(blocks) <= MAX_BLOCKS:  # otherwise Slack rejects the message; "text" alone still goes out
+                payload["blocks"] = blocks
+        return payload
+
 
-        # retry up to 3 times with exponential backoff
-        for attempt in range(3):
+class SlackDestination(SlackSettings, Destination):
+    def __init__(self, env: Optional[Mapping[str, str]] = None, part_store=None):
+        super().__init__(env)
+        self.part_store = part_store  # dedup store recording the parts of split alerts already sent
+
+        # One keep-alive session per sink: TCP+TLS to Slack is paid once, not per message.
+        self._adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.pool_size, max_retries=0)
+        self.session = requests.Session()
+        self.session.mount("https://", self._adapter)
+        self.session.mount("http://", self._adapter)
+        self._stats_lock = threading.Lock()
+        self._requests = 0
+
+    def _post(self, url: str, **kwargs) -> requests.Response:
+        with self._stats_lock:
+            self._requests += 1
+        return self.session.post(url, timeout=self.timeout, **kwargs)
+
+    def connection_stats(self) -> Dict[str, int]:
+        """Requests sent vs. connections opened by the pool; the difference was served by keep-alive."""
+        pools = self._adapter.poolmanager.pools
+        opened = sum(getattr(pools[k], "num_connections", 0) for k in list(pools.keys()))
+        with self._stats_lock:
+            sent = self._requests
+        return {"requests": sent, "connections_opened": opened, "connections_reused": max(sent - opened, 0)}
+
+    def close(self) -> None:
+        self.session.close()
+
+    def send(self, e: IamChangeEvent) -> None:
+        # oversized events go out as several messages; with the token API the follow-ups are threaded replies.
+        # Sent parts are recorded, so a retry after part k failed starts at part k, in the same thread.
+        thread_ts = None
+        log = None
+        parts = split_event(e, "slack_mrkdwn", self.max_message_bytes, self.max_message_lines)
+        for n, part in enumerate(parts, 1):
+            if part is not e and self.part_store is not None:
+                log = log or PartLog(self.part_store, "slack", e)
+                done = log.get(n)
+                if done is not None:
+                    thread_ts = thread_ts or done or None
+                    continue
+            with stage("render", destination="slack"):
+                payload = self._payload(part)
+            if thread_ts:
+                payload["thread_ts"] = thread_ts
+            answer = self._deliver(payload)
+            if answer is None:
+                return  # permanent failure, already logged
+            if n == 1 and not self.webhook:
+                thread_ts = answer.get("ts")
+            if log is not None:
+                log.add(n, thread_ts or "")
+
+    def _deliver(self, payload: Dict[str, object]) -> Optional[Dict[str, object]]:
+        """Post one message: the API answer on success, None on a permanent failure; raises once retries run out."""
+        # retry with exponential backoff; transient failures that outlive the retries are raised
+        for attempt in range(self.max_attempts):
+            last = attempt == self.max_attempts - 1
+            if attempt:
+                RETRIES.inc(destination="slack")
+            with stage("throttle", destination="slack"):
+                self.limiter.acquire(self.rate_key)
             try:
-                if self.webhook:
-                    resp = requests.post(self.webhook, json={"text": text}, timeout=(3, 10))
-                else:  # token+channel
-                    resp = requests.post(
-                        "https://slack.com/api/chat.postMessage",
-                        headers={"Authorization": f"Bearer {self.token}"},
-                        json=payload,
-                        timeout=(3, 10),
-                    )
+                with timed_send("slack") as sent:
+                    if self.webhook:
+                        resp = self._post(self.webhook, json=self._webhook_body(payload))
+                    else:  # token+channel
+                        resp = self._post(
+                            "https://slack.com/api/chat.postMessage",
+                            headers={"Authorization": f"Bearer {self.token}"},
+                            json=payload,
+                        )
+                    answer = {}
+                    if resp.status_code != 200:
+                        sent.outcome = str(resp.status_code)
+                    elif not self.webhook:
+                        answer = resp.json()
+                        if not answer.get("ok", False):
+                            sent.outcome = "error"  # the token API answers 200 with ok:false
             except requests.RequestException as e:
                 logging.warning("Slack request error (attempt %s): %s", attempt + 1, e)
-                if attempt == 2:
-                    logging.error("SlackDestination: giving up after 3 attempts.")
-                    return
+                if last:
+                    raise DeliveryError(f"Slack request error after {self.max_attempts} attempts: {e}") from e
                 time.sleep(2 ** attempt)
                 continue
 
             # handle rate limit / transient server errors
-            if resp.status_code == 200 and (self.webhook or resp.json().get("ok", False)):
-                return
+            if resp.status_code == 200 and (self.webhook or answer.get("ok", False)):
+                return answer
             if resp.status_code in (429, 500, 502, 503, 504):
                 retry_after = int(resp.headers.get("Retry-After", "0"))
                 sleep_for = max(retry_after, 2 ** attempt)
+                if resp.status_code == 429:
+                    RATE_LIMITED.inc(destination="slack")
+                    # hold back every sender of this webhook/channel, not just this call
+                    self.limiter.pause(self.rate_key, sleep_for)
+                if last:
+                    raise DeliveryError(
+                        f"Slack returned {resp.status_code} after {self.max_attempts} attempts",
+                        retry_after=retry_after,
+                    )
                 logging.warning("SlackDestination: retrying after %s seconds (status %s)", sleep_for, resp.status_code)
+                if resp.status_code == 429 and self.limiter.rate > 0:
+                    continue  # the next acquire() sits out the pause
                 time.sleep(sleep_for)
                 continue
 
             # all other errors = permanent failure
             logging.error("SlackDestination: permanent failure [%s]: %s", resp.status_code, resp.text)
-            return
+            return None
+        return None
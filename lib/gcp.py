@@ -1,10 +1,162 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
+from typing import Iterable, NamedTuple, Optional, Sequence, Tuple
 
-from google.auth import default
-from googleapiclient import discovery
+from lib.cache import TTLCache
+from lib.crm import CrmClient
+from lib.hierarchy import HierarchyIndex, Node
+
+# Statuses that won't change on retry within a TTL: cache them as negative results.
+NEGATIVE_STATUSES = {403, 404}
+
+
+@lru_cache(maxsize=1)
+def crm_client() -> CrmClient:
+    # credentials are resolved on the first request, not at cold start
+    return CrmClient()
 
 
 @lru_cache(maxsize=1)
-def crm_client():
-    credentials, _ = default()
-    return discovery.build("cloudresourcemanager", "v3", credentials=credentials)
+def hierarchy() -> Optional[HierarchyIndex]:
+    """Local hierarchy index mapped from ``HIERARCHY_INDEX_PATH``; None when not configured."""
+    path = os.getenv("HIERARCHY_INDEX_PATH")
+    if not path:
+        return None
+    try:
+        return HierarchyIndex(path)
+    except (OSError, ValueError) as e:
+        # keep an empty index: feed updates still fill it, and misses fall back to CRM
+        logging.warning("Hierarchy index %s unusable (%s); starting empty.", path, e)
+        return HierarchyIndex()
+
+
+def save_hierarchy() -> None:
+    """Write the feed updates the index picked up back to ``HIERARCHY_INDEX_PATH``, so a restart keeps them."""
+    path = os.getenv("HIERARCHY_INDEX_PATH")
+    index = hierarchy()
+    if not path or index is None or not index.changed:
+        return
+    try:
+        count = index.save(path)
+    except OSError as e:
+        logging.warning("Could not save hierarchy index %s: %s", path, e)
+        return
+    logging.info("Hierarchy index %s saved (%s entries).", path, count)
+
+
+class Ancestor(NamedTuple):
+    resource_type: str  # "project" | "folder" | "organization"
+    resource_id: str
+    resource_display: str
+
+
+def _from_node(node: Node) -> Ancestor:
+    # same shapes as _fetch_ancestor builds from CRM answers
+    kind, _, rid = node.name.partition("/")
+    if kind == "projects":
+        return Ancestor("project", node.display, node.display)
+    if kind == "folders":
+        return Ancestor("folder", rid, f"{node.display} (*folder-level*)")
+    return Ancestor("organization", rid, f"{node.display} (*organization-level*)")
+
+
+def _http_status(e: BaseException) -> Optional[int]:
+    resp = getattr(e, "resp", None)
+    status = getattr(e, "status_code", None) or getattr(resp, "status", None)
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_negative(e: BaseException) -> bool:
+    return _http_status(e) in NEGATIVE_STATUSES
+
+
+def _fetch_ancestor(ancestor_name: str) -> Ancestor:
+    crm = crm_client()
+    if ancestor_name.startswith("projects/"):
+        proj = crm.projects().get(name=ancestor_name).execute()
+        return Ancestor("project", proj["projectId"], proj["projectId"])
+    if ancestor_name.startswith("folders/"):
+        fld = crm.folders().get(name=ancestor_name).execute()
+        return Ancestor(
+            "folder",
+            fld.get("name", ancestor_name).split("/")[-1],
+            f'{fld.get("displayName", ancestor_name)} (*folder-level*)',
+        )
+    if ancestor_name.startswith("organizations/"):
+        org = crm.organizations().get(name=ancestor_name).execute()
+        return Ancestor(
+            "organization",
+            org.get("name", ancestor_name).split("/")[-1],
+            f'{org.get("displayName", ancestor_name)} (*organization-level*)',
+        )
+    return Ancestor("project", ancestor_name, "Unknown")
+
+
+ancestor_cache = TTLCache(
+    maxsize=int(os.getenv("CRM_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("CRM_CACHE_TTL", "3600")),
+    negative_ttl=float(os.getenv("CRM_CACHE_NEGATIVE_TTL", "300")),
+    negative=_is_negative,
+)
+
+
+def resolve_ancestor(ancestor_name: str) -> Ancestor:
+    """Resolve a CRM ancestor (``projects/123``, ``folders/..``, ``organizations/..``).
+
+    The local hierarchy index answers first, when configured. Otherwise the lookup goes through the cache:
+    concurrent lookups of the same name share one CRM request, and 403/404 answers are cached for
+    ``CRM_CACHE_NEGATIVE_TTL`` seconds and re-raised.
+    """
+    index = hierarchy()
+    if index is not None:
+        node = index.get(ancestor_name)
+        if node is not None:
+            return _from_node(node)
+    return ancestor_cache.get_or_load(ancestor_name, lambda: _fetch_ancestor(ancestor_name))
+
+
+def prefetch_ancestors(names: Iterable[str], max_workers: int = 8) -> None:
+    """Warm the cache for a batch: each distinct ancestor is resolved once, concurrently.
+
+    Failures are left for the per-message lookup to handle (and negative-cache).
+    """
+    index = hierarchy()
+    distinct = [
+        n for n in dict.fromkeys(names)
+        if n and (index is None or index.get(n) is None) and ancestor_cache.get(n) is None
+    ]
+    if not distinct:
+        return
+
+    def _one(name: str) -> None:
+        try:
+            resolve_ancestor(name)
+        except Exception as e:
+            logging.debug("Prefetch of %s failed: %s", name, e)
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(distinct))) as pool:
+        list(pool.map(_one, distinct))
+
+
+def ancestor_path(ancestors: Sequence[str]) -> Tuple[str, ...]:
+    """Display names from the organization down to ``ancestors[0]``, from the local index only.
+
+    A lone ancestor (audit logs only name the project) is completed with the index's parent chain.
+    Empty without an index; names the index doesn't know show as themselves.
+    """
+    index = hierarchy()
+    if index is None or not ancestors:
+        return ()
+    names = list(ancestors)
+    if len(names) == 1:
+        names = [n.name for n in index.chain(names[0])] or names
+    path = []
+    for name in reversed(names):
+        node = index.get(name)
+        path.append(node.display if node is not None else name)
+    return tuple(path)
@@ -0,0 +1,324 @@
+"""Local index of the CRM hierarchy (organizations, folders, projects), so ancestors resolve without CRM calls.
+
+The index is built in bulk (CRM search, or an Asset Inventory export of the cloudresourcemanager asset types) and
+written as one sorted binary file that is memory-mapped read-only; a lookup is a binary search over the mapped keys,
+and nothing is parsed up front. Changes seen afterwards (resource-content feed messages) go into an in-memory
+overlay that takes precedence over the file; ``save`` writes both back as a new file (the worker does so when
+it stops, see ``lib.gcp.save_hierarchy``).
+
+File layout (little endian)::
+
+    header    b"IAMHIDX1", uint32 count, uint32 alias count
+    keys      count x uint64: kind << 56 | numeric id, ascending
+    records   count x 3 uint32: parent record (0xFFFFFFFF = none), display offset, display length
+    aliases   alias count x uint64: hash of "projects/<projectId>", ascending
+    targets   alias count x uint32: record of each alias
+    displays  UTF-8 display names (projectId for projects, displayName otherwise)
+
+usage:
+    python -m lib.hierarchy build --out hierarchy.idx --from-crm
+    python -m lib.hierarchy build --out hierarchy.idx --from-export resourcemanager-assets.ndjson
+    python -m lib.hierarchy show --index hierarchy.idx projects/123456789
+"""
+import bisect
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+from lib.decode import loads
+
+MAGIC = b"IAMHIDX1"
+_HEADER = struct.Struct("<8sII")
+_NO_PARENT = 0xFFFFFFFF
+_MAX_DEPTH = 32  # folders nest at most 10 deep; guards against a cycle in bad data
+
+# kind code <-> name prefix; organizations sort first
+KINDS = {"organizations": 1, "folders": 2, "projects": 3}
+_PREFIX = {code: prefix for prefix, code in KINDS.items()}
+
+CRM_ASSET_TYPES = {
+    "cloudresourcemanager.googleapis.com/Organization": "organizations",
+    "cloudresourcemanager.googleapis.com/Folder": "folders",
+    "cloudresourcemanager.googleapis.com/Project": "projects",
+}
+
+
+class Node(NamedTuple):
+    name: str  # "projects/123", "folders/456", "organizations/789"
+    display: str
+    parent: Optional[str]
+
+
+def _key(name: str) -> Optional[int]:
+    prefix, _, rid = name.partition("/")
+    code = KINDS.get(prefix)
+    if code is None or not rid.isdigit() or int(rid) >= 1 << 56:
+        return None
+    return code << 56 | int(rid)
+
+
+def _name(key: int) -> str:
+    return f"{_PREFIX[key >> 56]}/{key & ((1 << 56) - 1)}"
+
+
+def _alias_hash(name: str) -> int:
+    return int.from_bytes(hashlib.blake2b(name.encode(), digest_size=8).digest(), "little")
+
+
+def _pad8(n: int) -> int:
+    return (n + 7) & ~7
+
+
+def write_index(path: str, nodes: Iterable[Node]) -> int:
+    """Write ``nodes`` as an index file at ``path`` (atomically replaced); returns the number of entries.
+
+    Nodes with a non-numeric name are skipped; a parent missing from ``nodes`` is dropped.
+    """
+    by_key = {}
+    for node in nodes:
+        key = _key(node.name)
+        if key is not None:
+            by_key[key] = node
+    keys = sorted(by_key)
+    index = {k: i for i, k in enumerate(keys)}
+
+    records: List[int] = []
+    displays = bytearray()
+    aliases = []
+    for i, key in enumerate(keys):
+        node = by_key[key]
+        display = node.display.encode("utf-8")
+        parent = _key(node.parent) if node.parent else None
+        records += [index.get(parent, _NO_PARENT), len(displays), len(display)]
+        displays += display
+        if key >> 56 == KINDS["projects"] and node.display:
+            aliases.append((_alias_hash(f"projects/{node.display}"), i))
+    aliases.sort()
+
+    count = len(keys)
+    out = bytearray(_HEADER.pack(MAGIC, count, len(aliases)))
+    out += struct.pack(f"<{count}Q", *keys)
+    out += struct.pack(f"<{3 * count}I", *records)
+    out += bytes(_pad8(len(out)) - len(out))
+    out += struct.pack(f"<{len(aliases)}Q", *(h for h, _ in aliases))
+    out += struct.pack(f"<{len(aliases)}I", *(i for _, i in aliases))
+    out += displays
+
+    import tempfile
+
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=".hierarchy-")
+    with os.fdopen(fd, "wb") as f:
+        f.write(out)
+    # readers that already mapped the old file keep it; new readers get this one
+    os.replace(tmp, path)
+    return count
+
+
+class HierarchyIndex:
+    """Read-only mapped index plus an in-memory overlay of later changes. Lookups are thread-safe."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._overlay: Dict[str, Optional[Node]] = {}  # name -> node, None = deleted
+        self._aliases: Dict[str, str] = {}  # projects/<projectId> -> projects/<number>, for overlay projects
+        self._lock = threading.Lock()
+        self._count = 0
+        self._keys: Any = ()
+        if path:
+            self._map(path)
+
+    def _map(self, path: str) -> None:
+        if sys.byteorder != "little":
+            raise ValueError("hierarchy index files are little endian")
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, n_alias = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not a hierarchy index")
+        view = memoryview(self._mm)
+        pos = _HEADER.size
+        self._keys = view[pos:pos + 8 * count].cast("Q")
+        pos += 8 * count
+        self._records = view[pos:pos + 12 * count].cast("I")
+        pos = _pad8(pos + 12 * count)
+        self._alias_keys = view[pos:pos + 8 * n_alias].cast("Q")
+        pos += 8 * n_alias
+        self._alias_targets = view[pos:pos + 4 * n_alias].cast("I")
+        self._displays = view[pos + 4 * n_alias:]
+        self._count = count
+
+    def _find(self, name: str) -> Optional[int]:
+        key = _key(name)
+        if key is not None:
+            i = bisect.bisect_left(self._keys, key)
+            return i if i < self._count and self._keys[i] == key else None
+        if name.startswith("projects/") and self._count:  # projects/<projectId>, as in audit log labels
+            h = _alias_hash(name)
+            j = bisect.bisect_left(self._alias_keys, h)
+            while j < len(self._alias_keys) and self._alias_keys[j] == h:
+                i = self._alias_targets[j]
+                if self._display(i) == name[len("projects/"):]:
+                    return i
+                j += 1
+        return None
+
+    def _display(self, i: int) -> str:
+        off, length = self._records[3 * i + 1], self._records[3 * i + 2]
+        return str(self._displays[off:off + length], "utf-8")
+
+    def _node(self, i: int) -> Node:
+        parent = self._records[3 * i]
+        return Node(_name(self._keys[i]), self._display(i),
+                    None if parent == _NO_PARENT else _name(self._keys[parent]))
+
+    def get(self, name: str) -> Optional[Node]:
+        """Node for ``projects/<number or projectId>``, ``folders/<id>`` or ``organizations/<id>``, if known."""
+        with self._lock:
+            name = self._aliases.get(name, name)
+            if name in self._overlay:
+                return self._overlay[name]
+        i = self._find(name)
+        if i is None:
+            return None
+        node = self._node(i)
+        if node.name != name:  # found by projectId: the overlay may know better
+            with self._lock:
+                return self._overlay.get(node.name, node)
+        return node
+
+    def chain(self, name: str) -> List[Node]:
+        """``name`` and its ancestors, nearest first, as far as the index knows them."""
+        out: List[Node] = []
+        node = self.get(name)
+        while node is not None and len(out) < _MAX_DEPTH:
+            out.append(node)
+            node = self.get(node.parent) if node.parent else None
+        return out
+
+    def update(self, node: Node) -> None:
+        with self._lock:
+            self._overlay[node.name] = node
+            if node.name.startswith("projects/"):
+                self._aliases[f"projects/{node.display}"] = node.name
+
+    def remove(self, name: str) -> None:
+        with self._lock:
+            self._overlay[name] = None
+
+    @property
+    def changed(self) -> bool:
+        """Whether feed updates have been applied on top of the mapped file since it was loaded."""
+        with self._lock:
+            return bool(self._overlay)
+
+    def nodes(self) -> Iterator[Node]:
+        """Every live node: the file's entries with the overlay applied."""
+        with self._lock:
+            overlay = dict(self._overlay)
+        for i in range(self._count):
+            node = self._node(i)
+            if node.name not in overlay:
+                yield node
+        yield from (node for node in overlay.values() if node is not None)
+
+    def save(self, path: Optional[str] = None) -> int:
+        """Write file + overlay to ``path`` (default: the mapped file, replaced atomically)."""
+        path = path or self.path
+        if not path:
+            raise ValueError("no path to save the hierarchy index to")
+        return write_index(path, list(self.nodes()))
+
+
+def _parent_from_data(data: Dict[str, Any]) -> Optional[str]:
+    parent = data.get("parent")
+    if isinstance(parent, str):  # v3: "folders/123"
+        return parent or None
+    if isinstance(parent, dict) and parent.get("id"):  # v1: {"type": "folder", "id": "123"}
+        return f"{parent.get('type')}s/{parent['id']}"
+    return None
+
+
+def node_from_asset(asset: Dict[str, Any]) -> Optional[Node]:
+    """Node for a cloudresourcemanager asset (feed message or export line); None for other asset types."""
+    asset_type = asset.get("assetType") or asset.get("asset_type")
+    prefix = CRM_ASSET_TYPES.get(asset_type)
+    if prefix is None:
+        return None
+    ancestors = asset.get("ancestors") or []
+    name = ancestors[0] if ancestors else f"{prefix}/{asset.get('name', '').rsplit('/', 1)[-1]}"
+    data = (asset.get("resource") or {}).get("data") or {}
+    if prefix == "projects":
+        display = data.get("projectId")
+    else:
+        display = data.get("displayName")
+    parent = ancestors[1] if len(ancestors) > 1 else _parent_from_data(data)
+    return Node(name, display or name, parent)
+
+
+def node_from_crm(resource: Dict[str, Any]) -> Node:
+    """Node for a CRM v3 project/folder/organization resource."""
+    name = resource["name"]
+    display = resource.get("projectId") if name.startswith("projects/") else resource.get("displayName")
+    return Node(name, display or name, resource.get("parent") or None)
+
+
+def nodes_from_crm(client) -> Iterator[Node]:
+    for collection in ("organizations", "folders", "projects"):
+        for resource in client.search(collection):
+            yield node_from_crm(resource)
+
+
+def nodes_from_export(lines: Iterable[bytes]) -> Iterator[Node]:
+    """Nodes from NDJSON asset exports/feed messages (bare assets or ``{"asset": ...}``); other lines are skipped."""
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            doc = loads(line)
+        except ValueError:
+            continue
+        if isinstance(doc, dict):
+            node = node_from_asset(doc.get("asset") if isinstance(doc.get("asset"), dict) else doc)
+            if node is not None:
+                yield node
+
+
+def _export_file(path: str) -> Iterator[Node]:
+    with open(path, "rb") as f:
+        yield from nodes_from_export(f)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="write an index file")
+    build.add_argument("--out", required=True)
+    src = build.add_mutually_exclusive_group(required=True)
+    src.add_argument("--from-crm", action="store_true", help="search all visible organizations, folders, projects")
+    src.add_argument("--from-export", nargs="+", metavar="NDJSON", help="Asset Inventory export files")
+    show = sub.add_parser("show", help="print the ancestor chain of resources")
+    show.add_argument("--index", required=True)
+    show.add_argument("names", nargs="+")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        if args.from_crm:
+            from lib.crm import CrmClient
+            nodes = nodes_from_crm(CrmClient())
+        else:
+            nodes = (n for path in args.from_export for n in _export_file(path))
+        print(f"{write_index(args.out, nodes)} entries written to {args.out}")
+    else:
+        index = HierarchyIndex(args.index)
+        for name in args.names:
+            print(" / ".join(f"{n.display} ({n.name})" for n in reversed(index.chain(name))) or f"{name}: not found")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""In-process counters and latency histograms, exported as structured log records or Prometheus text.
+
+Stages are timed with ``stage("decode")`` (a context manager). Long-running mode can expose the registry
+with ``serve(port)``; the Cloud Function keeps it in memory and logs it every ``METRICS_LOG_INTERVAL`` seconds.
+"""
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# seconds; covers a cached CRM hit (sub-ms) up to a Slack call that sat out a Retry-After
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _fmt_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    inner = ",".join('{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+    return "{" + inner + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = _key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(_key(labels), 0)
+
+    def samples(self) -> List[Tuple[LabelKey, float]]:
+        with self._lock:
+            return list(self._values.items())
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelKey, List[float]] = {}  # per-bucket counts + [+Inf, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = _key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 3)
+            series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, **labels: str) -> int:
+        series = self._series.get(_key(labels))
+        return int(series[-1]) if series else 0
+
+    def samples(self) -> List[Tuple[LabelKey, List[float]]]:
+        with self._lock:
+            return [(k, list(v)) for k, v in self._series.items()]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+        self._next_log: Optional[float] = None
+
+    def _get_or_add(self, name: str, factory):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = factory()
+            return self._metrics[name]
+
+    def counter(self, name: str, help: str = "") -> Counter:
+        return self._get_or_add(name, lambda: Counter(name, help))
+
+    def histogram(self, name: str, help: str = "", buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_add(name, lambda: Histogram(name, help, buckets))
+
+    def reset(self) -> None:
+        """Zero every series (tests, or after a periodic export that should report deltas)."""
+        for m in list(self._metrics.values()):
+            m.reset()
+
+    def snapshot(self) -> Dict[str, List[Dict]]:
+        """JSON-friendly view: counters as values, histograms as count/sum and cumulative buckets."""
+        out: Dict[str, List[Dict]] = {}
+        for name, m in sorted(self._metrics.items()):
+            if isinstance(m, Counter):
+                out[name] = [{"labels": dict(k), "value": v} for k, v in m.samples()]
+            else:
+                rows = []
+                for k, series in m.samples():
+                    cumulative, buckets = 0.0, {}
+                    for le, n in zip(m.buckets, series):
+                        cumulative += n
+                        buckets[str(le)] = int(cumulative)
+                    rows.append({"labels": dict(k), "count": int(series[-1]), "sum": round(series[-2], 6),
+                                 "buckets": buckets})
+                out[name] = rows
+        return out
+
+    def to_prometheus(self) -> str:
+        lines: List[str] = []
+        for name, m in sorted(self._metrics.items()):
+            kind = "counter" if isinstance(m, Counter) else "histogram"
+            lines.append(f"# HELP {name} {m.help}")
+            lines.append(f"# TYPE {name} {kind}")
+            if isinstance(m, Counter):
+                for k, v in m.samples():
+                    lines.append(f"{name}{_fmt_labels(k)} {v:g}")
+                continue
+            for k, series in m.samples():
+                cumulative = 0.0
+                for le, n in zip(m.buckets, series):
+                    cumulative += n
+                    lines.append(f"{name}_bucket{_fmt_labels(k, ('le', f'{le:g}'))} {cumulative:g}")
+                lines.append(f"{name}_bucket{_fmt_labels(k, ('le', '+Inf'))} {series[-1]:g}")
+                lines.append(f"{name}_sum{_fmt_labels(k)} {series[-2]:g}")
+                lines.append(f"{name}_count{_fmt_labels(k)} {series[-1]:g}")
+        return "\n".join(lines) + "\n"
+
+    def log(self, level: int = logging.INFO) -> None:
+        logging.log(level, "metrics", extra={"metrics": self.snapshot()})
+
+    def log_every(self, interval: float, level: int = logging.INFO) -> bool:
+        """``log()`` if ``interval`` seconds passed since the last call that logged; the first call starts the clock."""
+        if interval <= 0:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            due = self._next_log is not None and now >= self._next_log
+            if self._next_log is None or due:
+                self._next_log = now + interval
+        if due:
+            self.log(level)
+        return due
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram(
+    "iam_watcher_stage_seconds", "Time spent per pipeline stage (decode, classify, delta, suppress, crm, render, send)."
+)
+MESSAGES = registry.counter("iam_watcher_messages_total", "Messages handled, by handler and outcome.")
+SEND_SECONDS = registry.histogram("iam_watcher_send_seconds", "Latency of one delivery attempt, by destination.")
+SENDS = registry.counter("iam_watcher_sends_total", "Delivery attempts, by destination and outcome.")
+RETRIES = registry.counter("iam_watcher_send_retries_total", "Delivery attempts retried, by destination.")
+RATE_LIMITED = registry.counter("iam_watcher_rate_limited_total", "HTTP 429 answers, by destination.")
+SUPPRESSED = registry.counter("iam_watcher_suppressed_members_total", "Members dropped by suppression, by handler.")
+
+
+@contextmanager
+def stage(name: str, **labels: str) -> Iterator[None]:
+    """Time the enclosed block into ``iam_watcher_stage_seconds{stage=name}`` (also when it raises)."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - t0, stage=name, **labels)
+
+
+class SendAttempt:
+    __slots__ = ("outcome",)
+
+    def __init__(self):
+        self.outcome: Optional[str] = None
+
+
+@contextmanager
+def timed_send(destination: str) -> Iterator[SendAttempt]:
+    """Time one delivery attempt: counted as ``ok`` (``error`` if it raised) unless the block sets ``outcome``."""
+    attempt = SendAttempt()
+    t0 = time.perf_counter()
+    try:
+        yield attempt
+    except BaseException:
+        attempt.outcome = attempt.outcome or "error"
+        raise
+    finally:
+        SEND_SECONDS.observe(time.perf_counter() - t0, destination=destination)
+        SENDS.inc(destination=destination, outcome=attempt.outcome or "ok")
+
+
+def serve(port: int, host: str = "0.0.0.0", reg: Registry = registry) -> ThreadingHTTPServer:
+    """Serve ``GET /metrics`` in Prometheus text format from a daemon thread."""
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = reg.to_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, fmt, *args):
+            logging.debug("metrics endpoint: " + fmt, *args)
+
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logging.info("Serving metrics on %s:%s/metrics", host, server.server_port)
+    return server
@@ -0,0 +1,120 @@
+"""Last-seen IAM policy per asset, so feeds that arrive without ``priorAsset`` (buckets) can still be diffed.
+
+Each row keeps the bindings of the newest message seen for an asset and the bindings that message was diffed
+against. A redelivery of that message (same ``updateTime``) gets the same prior back, so a failed send retried by
+Pub/Sub still alerts; an older message arriving late is reported as stale instead of rolling the state back, unless it
+carries its own ``priorAsset``, which it is then diffed against.
+Bindings are stored as zlib-compressed canonical JSON.
+"""
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional
+
+Bindings = List[Dict[str, Any]]
+
+
+class Seen(NamedTuple):
+    prior: Optional[Bindings]  # bindings to diff against; None when the asset was never seen
+    stale: bool = False  # the message is older than the stored state
+
+
+def _encode(bindings: Optional[Bindings]) -> Optional[bytes]:
+    if bindings is None:
+        return None
+    return zlib.compress(json.dumps(bindings, separators=(",", ":"), sort_keys=True).encode())
+
+
+def _decode(blob: Optional[bytes]) -> Optional[Bindings]:
+    return None if blob is None else json.loads(zlib.decompress(blob))
+
+
+def _ts_key(update_time: str) -> str:
+    """RFC 3339 UTC timestamp with the fraction padded to nanoseconds, so keys compare as strings."""
+    base, _, frac = update_time.rstrip("Z").partition(".")
+    return f"{base}.{frac.ljust(9, '0')}"
+
+
+class SqlitePolicyStore:
+    """On-disk store shared by processes on one host and surviving restarts."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS policies ("
+            "name TEXT PRIMARY KEY, update_time TEXT NOT NULL, bindings BLOB NOT NULL, prior BLOB)"
+        )
+
+    def get(self, name: str) -> Optional[Bindings]:
+        with self._lock:
+            row = self._db.execute("SELECT bindings FROM policies WHERE name = ?", (name,)).fetchone()
+        return _decode(row[0]) if row else None
+
+    def record(self, name: str, update_time: str, bindings: Bindings, prior: Optional[Bindings] = None) -> Seen:
+        """Store ``bindings`` as the state of ``name`` at ``update_time`` and return what to diff them against.
+
+        A message carrying its own ``prior`` (from ``priorAsset``) is diffed against it and never stale; it only
+        replaces the stored state when it is newer. The stored state and the ordering check are for the rest.
+        """
+        key = _ts_key(update_time) if update_time else ""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT update_time, bindings, prior FROM policies WHERE name = ?", (name,)
+                ).fetchone()
+                if row is not None and key and key <= row[0]:
+                    if prior is not None:
+                        seen = Seen(prior)
+                    elif key < row[0]:
+                        seen = Seen(None, stale=True)
+                    else:
+                        seen = Seen(_decode(row[2]))  # redelivery
+                else:
+                    if prior is None and row is not None:
+                        prior = _decode(row[1])
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO policies (name, update_time, bindings, prior) VALUES (?, ?, ?, ?)",
+                        (name, key, _encode(bindings), _encode(prior)),
+                    )
+                    seen = Seen(prior)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return seen
+
+    def forget(self, name: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM policies WHERE name = ?", (name,))
+
+
+def make_policy_store(env: Optional[Mapping[str, str]] = None) -> Optional[SqlitePolicyStore]:
+    env = os.environ if env is None else env
+    path = env.get("POLICY_STORE_PATH")
+    return SqlitePolicyStore(path) if path else None
+
+
+_store: Optional[SqlitePolicyStore] = None
+_configured = False
+_store_lock = threading.Lock()
+
+
+def default_policy_store() -> Optional[SqlitePolicyStore]:
+    """Process-wide store from ``POLICY_STORE_PATH``; None when not configured."""
+    global _store, _configured
+    with _store_lock:
+        if not _configured:
+            _store = make_policy_store()
+            _configured = True
+        return _store
+
+
+def reset_policy_store() -> None:
+    global _store, _configured
+    with _store_lock:
+        _store, _configured = None, False
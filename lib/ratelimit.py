@@ -0,0 +1,194 @@
+"""Token buckets keyed per webhook/channel, shared by every sender on a host.
+
+A send reserves a token and sleeps until it is due, so callers queue up at the bucket's rate instead of racing
+into 429s. ``pause(key, seconds)`` (from a 429's ``Retry-After``) holds back every sender of that key, including
+ones already waiting: their slots move back behind the pause, still spaced at the bucket's rate. Buckets live in
+memory (threads of one process) or in a SQLite file (processes on one host).
+"""
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Mapping, Optional
+
+
+def _reserve(state: List[float], now: float, rate: float, burst: float) -> float:
+    """Take one token from ``state`` ([tokens, updated_at, paused_until, shifted]); seconds until it may be used.
+
+    Tokens may go negative: each waiting caller owns its slot, so they are served in order at ``rate``.
+    """
+    tokens, updated_at, paused_until = state[:3]
+    start = max(now, paused_until)
+    tokens = min(burst, tokens + max(0.0, start - updated_at) * rate) - 1
+    state[0], state[1] = tokens, max(start, updated_at)
+    return start - now + (-tokens / rate if tokens < 0 else 0.0)
+
+
+def _pause(state: List[float], now: float, seconds: float, rate: float = 0.0) -> None:
+    """Hold the key back until ``now + seconds``.
+
+    Slots already handed out move back together, so the first one falls on the end of the pause and the rest keep
+    their ``rate`` spacing behind it; ``shifted`` adds up how far, for the waiters holding them.
+    """
+    until = now + seconds
+    last = state[1] - min(state[0], 0.0) / rate if rate > 0 else now  # latest slot handed out
+    if last > now:
+        first = last - (math.ceil((last - now) * rate) - 1) / rate  # earliest one not yet due
+        push = max(0.0, until - first)
+        state[1] += push
+        state[3] += push
+    # no burst once the pause is over: the key was just throttled
+    state[0] = min(state[0], 0.0)
+    state[1] = max(state[1], now)
+    state[2] = max(state[2], until)
+
+
+class MemoryRateStore:
+    def __init__(self):
+        self._buckets: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def _state(self, key: str, burst: float, now: float) -> List[float]:
+        state = self._buckets.get(key)
+        if state is None:
+            state = self._buckets[key] = [burst, now, 0.0, 0.0]
+        return state
+
+    def reserve(self, key: str, rate: float, burst: float) -> float:
+        now = time.time()
+        with self._lock:
+            return _reserve(self._state(key, burst, now), now, rate, burst)
+
+    def pause(self, key: str, seconds: float, rate: float = 0.0) -> None:
+        now = time.time()
+        with self._lock:
+            _pause(self._state(key, 0.0, now), now, seconds, rate)
+
+    def paused_for(self, key: str) -> float:
+        with self._lock:
+            state = self._buckets.get(key)
+        return max(0.0, state[2] - time.time()) if state else 0.0
+
+    def shifted(self, key: str) -> float:
+        with self._lock:
+            state = self._buckets.get(key)
+        return state[3] if state else 0.0
+
+
+class SqliteRateStore:
+    """Buckets in a SQLite file, so worker processes on one host share a single budget per key."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS ratelimit (key TEXT PRIMARY KEY, tokens REAL NOT NULL, "
+            "updated_at REAL NOT NULL, paused_until REAL NOT NULL, shifted REAL NOT NULL DEFAULT 0)"
+        )
+        if "shifted" not in {r[1] for r in self._db.execute("PRAGMA table_info(ratelimit)")}:
+            self._db.execute("ALTER TABLE ratelimit ADD COLUMN shifted REAL NOT NULL DEFAULT 0")
+
+    def _update(self, key: str, default_tokens: float, fn: Callable[[List[float], float], float]) -> float:
+        with self._lock:
+            # BEGIN IMMEDIATE takes the write lock up front: read-modify-write is atomic across processes
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = self._db.execute(
+                    "SELECT tokens, updated_at, paused_until, shifted FROM ratelimit WHERE key = ?", (key,)
+                ).fetchone()
+                state = list(row) if row else [default_tokens, now, 0.0, 0.0]
+                out = fn(state, now)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO ratelimit (key, tokens, updated_at, paused_until, shifted) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, *state),
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return out
+
+    def reserve(self, key: str, rate: float, burst: float) -> float:
+        return self._update(key, burst, lambda state, now: _reserve(state, now, rate, burst))
+
+    def pause(self, key: str, seconds: float, rate: float = 0.0) -> None:
+        self._update(key, 0.0, lambda state, now: _pause(state, now, seconds, rate))
+
+    def paused_for(self, key: str) -> float:
+        with self._lock:
+            row = self._db.execute("SELECT paused_until FROM ratelimit WHERE key = ?", (key,)).fetchone()
+        return max(0.0, row[0] - time.time()) if row else 0.0
+
+    def shifted(self, key: str) -> float:
+        with self._lock:
+            row = self._db.execute("SELECT shifted FROM ratelimit WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0.0
+
+
+class RateLimiter:
+    """``rate`` sends per second per key with bursts of up to ``burst``; ``rate <= 0`` disables the limit."""
+
+    def __init__(self, store, rate: float = 1.0, burst: float = 1.0):
+        self.store = store
+        self.rate = rate
+        self.burst = max(1.0, burst)
+
+    def acquire(self, key: str) -> float:
+        """Block until ``key`` may send; returns the seconds waited."""
+        if self.rate <= 0:
+            return 0.0
+        shifted = self.store.shifted(key)  # read first: a pause in between only makes us wait longer
+        return self._wait(key, shifted, self.store.reserve(key, self.rate, self.burst))
+
+    def _wait(self, key: str, shifted: float, delay: float) -> float:
+        waited = 0.0
+        while delay > 0:
+            time.sleep(delay)
+            waited += delay
+            # a 429 seen by another sender while we slept moved our slot back (or, if it was due, holds us)
+            now_shifted = self.store.shifted(key)
+            delay = max(now_shifted - shifted, self.store.paused_for(key))
+            shifted = now_shifted
+        return waited
+
+    def pause(self, key: str, seconds: float) -> None:
+        if seconds > 0:
+            self.store.pause(key, seconds, self.rate)
+
+
+def limiter_key(*parts: str) -> str:
+    # webhook URLs are secrets; keep only a digest in the (possibly on-disk) store
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()[:32]
+
+
+_stores: Dict[Optional[str], object] = {}
+_stores_lock = threading.Lock()
+
+
+def shared_store(path: Optional[str] = None):
+    """Process-wide store: in memory, or the SQLite file at ``path``. Every limiter using it shares the buckets."""
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = SqliteRateStore(path) if path else MemoryRateStore()
+        return store
+
+
+def reset_shared_stores() -> None:
+    with _stores_lock:
+        _stores.clear()
+
+
+def make_rate_limiter(prefix: str, env: Optional[Mapping[str, str]] = None) -> RateLimiter:
+    """Limiter configured from ``<prefix>RATE_PER_SEC``, ``<prefix>RATE_BURST`` and ``<prefix>RATE_PATH``."""
+    env = os.environ if env is None else env
+    return RateLimiter(
+        shared_store(env.get(f"{prefix}RATE_PATH") or None),
+        rate=float(env.get(f"{prefix}RATE_PER_SEC", "1")),
+        burst=float(env.get(f"{prefix}RATE_BURST", "1")),
+    )
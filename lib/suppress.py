@@ -0,0 +1,152 @@
+"""Suppression of expected changes, applied by the handlers right after the diff, before CRM lookups and rendering.
+
+A rule suppresses a member of a change when every field it sets matches (lists within a field are alternatives):
+
+* ``roles`` - exact role, prefix (``roles/storage.*``) or glob (``roles/*Admin``); case-insensitive
+* ``principals`` - exact members (``serviceAccount:terraform@proj.iam.gserviceaccount.com``)
+* ``members`` - regular expressions, searched in each member
+* ``actors`` - exact principal emails of whoever made the change (audit logs only; the asset feed has no actor)
+* ``resource_types`` - exact asset types; a rule setting nothing else drops the whole message before the diff
+
+Rules come from ``SUPPRESS_RULES`` (a JSON list) and/or ``SUPPRESS_RULES_FILE`` (a JSON file holding one), after
+the built-in rule for members containing ``projectEditor``/``projectOwner``/``projectViewer`` (the legacy
+convenience members; ``SUPPRESS_DEFAULTS=false`` drops it). Role constraints go through the routing rules' role
+trie, and rules with only member constraints are merged into one exact-member set and one combined regex.
+"""
+import dataclasses
+import json
+import os
+import re
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, List, Mapping, Optional, Pattern, Sequence, Tuple
+
+from lib.destinations.rules import RoleIndex
+from lib.metrics import SUPPRESSED
+
+SUPPRESS_FIELDS = ("roles", "principals", "members", "actors", "resource_types")
+DEFAULT_RULES = ({"members": ["projectEditor", "projectOwner", "projectViewer"]},)
+
+
+@dataclasses.dataclass(frozen=True)
+class SuppressRule:
+    roles: Tuple[str, ...] = ()
+    principals: Tuple[str, ...] = ()
+    members: Tuple[str, ...] = ()
+    actors: Tuple[str, ...] = ()
+    resource_types: Tuple[str, ...] = ()
+
+    @classmethod
+    def from_dict(cls, d: Mapping[str, Any]) -> "SuppressRule":
+        unknown = set(d) - set(SUPPRESS_FIELDS)
+        if unknown:
+            raise ValueError(f"unknown suppression field(s): {', '.join(sorted(unknown))}")
+        fields = {}
+        for f in SUPPRESS_FIELDS:
+            v = d.get(f) or ()
+            fields[f] = (v,) if isinstance(v, str) else tuple(str(x) for x in v)
+        rule = cls(**fields)
+        if not any(fields.values()):
+            raise ValueError("a suppression rule must set at least one field")
+        return rule
+
+
+class _CompiledRule:
+    __slots__ = ("principals", "members", "actors", "resource_types")
+
+    def __init__(self, principals: Sequence[str], members: Sequence[str], actors: Sequence[str] = (),
+                 resource_types: Sequence[str] = ()):
+        self.principals = frozenset(principals)
+        self.members: Optional[Pattern] = (
+            re.compile("|".join(f"(?:{p})" for p in members)) if members else None
+        )
+        self.actors = frozenset(a.lower() for a in actors)
+        self.resource_types = frozenset(t.lower() for t in resource_types)
+
+    def applies(self, resource_type: str, actor: str) -> bool:
+        if self.resource_types and resource_type not in self.resource_types:
+            return False
+        return not self.actors or actor in self.actors
+
+    def matches(self, member: str) -> bool:
+        if not self.principals and self.members is None:
+            return True
+        return member in self.principals or (self.members is not None and self.members.search(member) is not None)
+
+
+class Suppressor:
+    def __init__(self, rules: Sequence[SuppressRule]):
+        self.rules = tuple(rules)
+        type_only = [r for r in self.rules if not (r.roles or r.principals or r.members or r.actors)]
+        member_only = [r for r in self.rules if not (r.roles or r.actors or r.resource_types)]
+        scoped = [r for r in self.rules if r not in type_only and r not in member_only]
+        self.resource_types: FrozenSet[str] = frozenset(t.lower() for r in type_only for t in r.resource_types)
+
+        self._compiled: List[_CompiledRule] = []
+        index = RoleIndex()
+        if member_only:
+            # one set lookup and one regex search per member, however many of these rules there are
+            index.add(0, ())
+            self._compiled.append(_CompiledRule([p for r in member_only for p in r.principals],
+                                                [m for r in member_only for m in r.members]))
+        for r in scoped:
+            index.add(len(self._compiled), r.roles)
+            self._compiled.append(_CompiledRule(r.principals, r.members, r.actors, r.resource_types))
+        # roles repeat heavily across messages; remember which rules each one can hit
+        self._candidates = lru_cache(maxsize=4096)(index.lookup)
+
+    def __bool__(self) -> bool:
+        return bool(self.rules)
+
+    @classmethod
+    def from_env(cls, env: Mapping[str, str]) -> "Suppressor":
+        data: List[Any] = []
+        if env.get("SUPPRESS_DEFAULTS", "true").lower() not in ("0", "false", "no"):
+            data.extend(DEFAULT_RULES)
+        path = env.get("SUPPRESS_RULES_FILE")
+        if path:
+            with open(path, "r", encoding="utf-8") as f:
+                data.extend(_rule_list(json.load(f), path))
+        raw = env.get("SUPPRESS_RULES")
+        if raw:
+            data.extend(_rule_list(json.loads(raw), "SUPPRESS_RULES"))
+        return cls([SuppressRule.from_dict(d) for d in data])
+
+    def skips(self, resource_type: str) -> bool:
+        """True when the whole resource type is excluded."""
+        return (resource_type or "").lower() in self.resource_types
+
+    def keep(self, resource_type: str, role: str, members: Sequence[str], actor: Optional[str] = None) -> List[str]:
+        """The members of a (resource type, role) change that no rule suppresses."""
+        resource_type, actor = (resource_type or "").lower(), (actor or "").lower()
+        candidates = (self._compiled[i] for i in self._candidates(role or ""))
+        rules = [r for r in candidates if r.applies(resource_type, actor)]
+        if not rules:
+            return list(members)
+        return [m for m in members if not any(r.matches(m) for r in rules)]
+
+
+def _rule_list(data: Any, source: str) -> List[Any]:
+    if not isinstance(data, list):
+        raise ValueError(f"{source} must be a JSON list of suppression rules")
+    return data
+
+
+@lru_cache(maxsize=1)
+def suppressor() -> Suppressor:
+    """Process-wide rules, compiled from the environment; ``main`` and ``worker.run`` call it at start-up."""
+    return Suppressor.from_env(os.environ)
+
+
+def drop_suppressed(handler: str, resource_type: str, changes: List[Dict[str, Any]],
+                    actor: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Remove suppressed members from each ``{"role", "members", ...}`` change; the changes with any member left."""
+    rules = suppressor()
+    kept = []
+    for change in changes:
+        members = rules.keep(resource_type, change.get("role"), change["members"], actor)
+        if len(members) < len(change["members"]):
+            SUPPRESSED.inc(len(change["members"]) - len(members), handler=handler)
+            change["members"] = members
+        if members:
+            kept.append(change)
+    return kept
@@ -2,56 +2,69 @@ import base64
 import json
 import logging
 import sys
-from typing import Dict, Any
 
 import functions_framework
 
 from config import load_config
-from handlers.asset import process_feeds
-from handlers.audit import process_audit_logs
+from handlers import lookup
+from lib.decode import PayloadRef, b64decode, loads
+from lib.dedup import default_store
+from lib.destinations.factory import get_destination
+from lib.gcp import hierarchy
+from lib.metrics import MESSAGES, registry, stage
+from lib.suppress import suppressor
 
 cfg = load_config()
 logging.basicConfig(level=cfg.log_level)
-
-
-def _is_asset(msg: Dict[str, Any]) -> bool:
-    return isinstance(msg.get("asset"), dict)
-
-
-def _is_gcs_iam_audit(msg: Dict[str, Any]) -> bool:
-    pp = msg.get("protoPayload", {})
-    res = msg.get("resource", {})
-    return (
-            pp.get("methodName") == "storage.setIamPermissions"
-            and pp.get("serviceName") == "storage.googleapis.com"
-            and res.get("type") == "gcs_bucket"
-    )
+hierarchy()  # map HIERARCHY_INDEX_PATH at cold start rather than on the first message
+suppressor()  # a bad SUPPRESS_RULES fails the deployment instead of every message
 
 
 @functions_framework.cloud_event
 def hello_pubsub(event):
-    raw = base64.b64decode(event.data["message"]["data"])
-
+    # no background thread survives between invocations, so export what earlier messages recorded from here
+    registry.log_every(cfg.metrics_log_interval)
+    message_id = event.data["message"].get("messageId") if cfg.dedup_enabled else None
+    if message_id and default_store().seen(f"msg:{message_id}"):
+        logging.info("Pub/Sub message %s already processed; ignoring redelivery.", message_id)
+        MESSAGES.inc(handler="none", outcome="duplicate")
+        return
+
+    with stage("decode"):
+        raw = b64decode(event.data["message"]["data"])
+        try:
+            msg = loads(raw)
+        except ValueError:
+            logging.warning("Non-JSON Pub/Sub message received; ignoring. Payload=%r", raw[:200])
+            MESSAGES.inc(handler="none", outcome="invalid")
+            return  # ack and drop
+
+    name = "none"
     try:
-        msg = json.loads(raw)
-    except json.JSONDecodeError:
-        logging.warning("Non-JSON Pub/Sub message received; ignoring. Payload=%r", raw[:200])
-        return  # ack and drop
-
-    try:
-        if _is_asset(msg):
-            process_feeds(msg)
-            return
-        if _is_gcs_iam_audit(msg):
-            process_audit_logs(msg)
-            return
-
-        logging.warning("Unrecognized message format; ignoring.")
+        with stage("classify"):
+            handler = lookup(msg) if isinstance(msg, dict) else None
+        if handler is None:
+            logging.warning("Unrecognized message format; ignoring.")
+            outcome = "unrecognized"
+        else:
+            name = handler.name
+            evt = handler.build(msg, PayloadRef(raw))
+            del msg  # the event only keeps the slim PayloadRef; let the parsed dict go before delivery
+            outcome = "no_change"
+            if evt is not None:
+                with stage("send"):
+                    get_destination().send(evt)
+                outcome = "sent"
     except Exception as e:
         # Re-raise only for transient/unknown errors to trigger retry
         logging.exception("Unhandled error; will retry: %s", e)
+        MESSAGES.inc(handler=name, outcome="failed")
         raise
 
+    MESSAGES.inc(handler=name, outcome=outcome)
+    if message_id:
+        default_store().add(f"msg:{message_id}")
+
 
 if __name__ == "__main__":
     # usage: python main.py ./payload.json
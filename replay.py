@@ -0,0 +1,333 @@
+"""Replay exported history through the classifier, diff and routing rules without alerting anyone.
+
+Input files (optionally gzipped) hold one JSON document per line, in any mix of:
+  - Cloud Logging exports (one LogEntry per line)
+  - Asset Inventory exports and history dumps: bare asset snapshots (``exportAssets``), TemporalAssets, or
+    ``batchGetAssetsHistory`` responses. Consecutive snapshots of an asset are diffed against each other;
+    the first one only sets the baseline.
+  - saved Pub/Sub envelopes (``{"message": {"data": <base64>}}``) or bare feed messages
+
+usage:
+    python replay.py logs-2025-*.json.gz --workers 8
+    python replay.py assets.ndjson --out alerts.ndjson           # would-be alerts, one JSON per line
+    python replay.py envelopes.ndjson --out - --format text      # rendered alerts on stdout
+
+Routing uses the same DEST_TYPES / DEST_<KIND>_RULES / DEST_<KIND>_ROLES settings (and DEST_CONFIG_FILE) as the
+function, so rule changes can be backtested by pointing those at the candidate config. CRM is not called unless
+``--crm`` is given; display names then fall back to the ancestor ids.
+"""
+import argparse
+import gzip
+import json
+import logging
+import os
+import sys
+import time
+import types
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from itertools import islice
+from multiprocessing import Pool
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from handlers import lookup
+from lib import gcp
+from lib.decode import b64decode, loads
+from lib.destinations.base import event_to_dict
+from lib.destinations.factory import load_settings
+from lib.destinations.render import render
+from lib.destinations.rules import RuleSet
+from lib.policy_store import reset_policy_store
+
+_LOG_ENTRY = b'"protoPayload"'
+# asset export fields that feed messages spell in camelCase
+_CAMEL = {"asset_type": "assetType", "iam_policy": "iamPolicy", "update_time": "updateTime"}
+
+
+def _dumps(doc: Any) -> bytes:
+    return json.dumps(doc, separators=(",", ":")).encode()
+
+
+class Normalizer:
+    """Turns export lines into the message bytes the handlers take, pairing asset snapshots with their prior one.
+
+    Only the last IAM policy per asset name is kept, so memory grows with the number of assets, not of lines.
+    """
+
+    def __init__(self):
+        self._policies: Dict[str, Any] = {}
+        self.baselines = 0
+
+    def records(self, line: bytes) -> Iterator[bytes]:
+        if _LOG_ENTRY in line:  # a LogEntry is the message itself; skip parsing it here
+            yield line
+            return
+        try:
+            doc = loads(line)
+        except ValueError:
+            yield line  # counted as invalid by the worker
+            return
+        if isinstance(doc, dict) and isinstance(doc.get("message"), dict):  # saved Pub/Sub envelope
+            line = b64decode(doc["message"].get("data", ""))
+            if _LOG_ENTRY in line:
+                yield line
+                return
+            try:
+                doc = loads(line)
+            except ValueError:
+                yield line
+                return
+        if isinstance(doc, dict) and isinstance(doc.get("assets"), list):  # batchGetAssetsHistory response
+            for temporal in doc["assets"]:
+                yield from self._asset(temporal, None)
+            return
+        yield from self._asset(doc, line)
+
+    def _asset(self, doc: Any, raw: Optional[bytes]) -> Iterator[bytes]:
+        if not isinstance(doc, dict):
+            yield raw if raw is not None else _dumps(doc)
+            return
+        if isinstance(doc.get("asset"), dict):
+            temporal = doc
+        elif "name" in doc and ("assetType" in doc or "asset_type" in doc):
+            temporal, raw = {"asset": doc}, None
+        else:
+            yield raw if raw is not None else _dumps(doc)  # not an asset; let the classifier decide
+            return
+
+        asset = {_CAMEL.get(k, k): v for k, v in temporal["asset"].items()}
+        name = asset.get("name", "")
+        if "priorAsset" in temporal:  # a live feed message already carries its prior
+            self._remember(name, asset, temporal.get("deleted"))
+            yield raw if raw is not None else _dumps(temporal)
+            return
+
+        prior = self._policies.get(name)
+        if temporal.get("deleted"):
+            asset.pop("iamPolicy", None)
+        self._remember(name, asset, temporal.get("deleted"))
+        if prior is None:
+            if "iamPolicy" in asset:
+                self.baselines += 1
+                return
+            yield _dumps({"asset": asset})  # resource content etc.: no policy to diff
+            return
+        yield _dumps({"asset": asset, "priorAsset": {"name": name, "assetType": asset.get("assetType"),
+                                                      "iamPolicy": prior}})
+
+    def _remember(self, name: str, asset: Dict[str, Any], deleted: Any) -> None:
+        if deleted or "iamPolicy" not in asset:
+            self._policies.pop(name, None)
+        else:
+            self._policies[name] = asset["iamPolicy"]
+
+
+def read_lines(paths: Iterable[str]) -> Iterator[bytes]:
+    for path in paths:
+        if path == "-":
+            yield from (line for line in sys.stdin.buffer if line.strip())
+            continue
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rb") as f:
+            yield from (line for line in f if line.strip())
+
+
+class OfflineCrm:
+    """Answers CRM lookups from the resource name alone, so a replay makes no network calls."""
+
+    def get(self, name: str):
+        rid = name.split("/")[-1]
+        return types.SimpleNamespace(execute=lambda: {"projectId": rid, "name": name, "displayName": name})
+
+    def projects(self): return self
+
+    def folders(self): return self
+
+    def organizations(self): return self
+
+
+# per-process pipeline state, set by _init_worker
+_routes: List[Tuple[str, Optional[RuleSet]]] = []
+_output: Optional[str] = None
+
+
+def _init_worker(output: Optional[str], offline: bool) -> None:
+    global _routes, _output
+    settings = load_settings()
+    _routes = [(kind, RuleSet.from_env(kind, settings.env, legacy=settings.filters.get(kind)) or None)
+               for kind in settings.types]
+    _output = output
+    if offline:
+        gcp.crm_client = lambda: OfflineCrm()
+    gcp.ancestor_cache.clear()
+    # snapshots are paired here, so the policy store is only kept for what it lets through (buckets); give it a
+    # private in-memory database rather than replaying history into the live POLICY_STORE_PATH
+    if os.environ.get("POLICY_STORE_PATH"):
+        os.environ["POLICY_STORE_PATH"] = ":memory:"
+    reset_policy_store()
+
+
+ChunkResult = Tuple[Counter, Counter, Counter, List[str]]
+
+
+def process_chunk(chunk: List[bytes]) -> ChunkResult:
+    """Run a chunk of messages through lookup, build and every destination's rules.
+
+    Returns counts per (handler, outcome), per (destination, role) and per (destination, resource), plus the
+    would-be alerts rendered for the output (empty for a dry run).
+    """
+    outcomes: Counter = Counter()
+    roles: Counter = Counter()
+    resources: Counter = Counter()
+    alerts: List[str] = []
+    for raw in chunk:
+        try:
+            msg = loads(raw)
+        except ValueError:
+            outcomes["none", "invalid"] += 1
+            continue
+        handler = lookup(msg) if isinstance(msg, dict) else None
+        if handler is None:
+            outcomes["none", "unrecognized"] += 1
+            continue
+        try:
+            evt = handler.build(msg, None)
+        except Exception as e:
+            logging.warning("%s handler failed on a message: %s", handler.name, e)
+            outcomes[handler.name, "failed"] += 1
+            continue
+        if evt is None:
+            outcomes[handler.name, "no_change"] += 1
+            continue
+        routed_any = False
+        for kind, rules in _routes:
+            routed = rules.apply(evt) if rules else evt
+            if routed is None:
+                continue
+            routed_any = True
+            resources[kind, routed.resource_display or routed.resource_name] += 1
+            for g in routed.changes:
+                roles[kind, g.role or "unknown-role"] += len(g.members)
+            if _output == "json":
+                alerts.append(json.dumps({"dest": kind, "event": event_to_dict(routed)}, default=str))
+            elif _output == "text":
+                alerts.append(f"--- {kind}\n{render(routed, 'text')}\n")
+        outcomes[handler.name, "alerted" if routed_any else "filtered"] += 1
+    return outcomes, roles, resources, alerts
+
+
+@contextmanager
+def _in_process(output: Optional[str], offline: bool) -> Iterator[None]:
+    # workers=1: same pipeline without a pool; restore the CRM client and policy store afterwards
+    client = gcp.crm_client
+    store_path = os.environ.get("POLICY_STORE_PATH")
+    _init_worker(output, offline)
+    try:
+        yield
+    finally:
+        gcp.crm_client = client
+        gcp.ancestor_cache.clear()
+        if store_path:
+            os.environ["POLICY_STORE_PATH"] = store_path
+        reset_policy_store()
+
+
+def _chunks(records: Iterator[bytes], size: int) -> Iterator[List[bytes]]:
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def replay(
+        paths: List[str],
+        workers: int = 1,
+        out=None,
+        fmt: str = "json",
+        offline: bool = True,
+        chunk_size: int = 500,
+) -> Dict[str, Any]:
+    """Replay ``paths`` and return a summary; would-be alerts are written to the ``out`` text stream, if any."""
+    output = fmt if out is not None else None
+    normalizer = Normalizer()
+    lines = 0
+
+    def _records() -> Iterator[bytes]:
+        nonlocal lines
+        for line in read_lines(paths):
+            lines += 1
+            yield from normalizer.records(line)
+
+    outcomes: Counter = Counter()
+    roles: Counter = Counter()
+    resources: Counter = Counter()
+    start = time.perf_counter()
+    chunks = _chunks(_records(), chunk_size)
+    if workers > 1:
+        with Pool(workers, initializer=_init_worker, initargs=(output, offline)) as pool:
+            results = pool.imap(process_chunk, chunks)
+            for result in results:
+                _merge(result, outcomes, roles, resources, out)
+    else:
+        with _in_process(output, offline):
+            for chunk in chunks:
+                _merge(process_chunk(chunk), outcomes, roles, resources, out)
+    elapsed = time.perf_counter() - start
+
+    messages = sum(outcomes.values())
+    alerts: Counter = Counter()
+    for (kind, _), n in resources.items():
+        alerts[kind] += n
+    return {
+        "lines": lines,
+        "messages": messages,
+        "baselines": normalizer.baselines,
+        "seconds": round(elapsed, 3),
+        "messages_per_second": round(messages / elapsed, 1) if elapsed > 0 else None,
+        "outcomes": {f"{h}:{o}": n for (h, o), n in sorted(outcomes.items())},
+        "alerts": dict(alerts),
+        "top_roles": {kind: _top(roles, kind) for kind in alerts},
+        "top_resources": {kind: _top(resources, kind) for kind in alerts},
+    }
+
+
+def _merge(result: ChunkResult, outcomes: Counter, roles: Counter, resources: Counter, out) -> None:
+    o, r, res, alerts = result
+    outcomes.update(o)
+    roles.update(r)
+    resources.update(res)
+    if out is not None:
+        for alert in alerts:
+            out.write(alert + ("\n" if not alert.endswith("\n") else ""))
+
+
+def _top(counter: Counter, kind: str, n: int = 10) -> List[Tuple[str, int]]:
+    return Counter({k: v for (d, k), v in counter.items() if d == kind}).most_common(n)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="NDJSON files (.gz ok); - reads stdin")
+    parser.add_argument("--workers", type=int, default=1, help="processes running the pipeline")
+    parser.add_argument("--chunk-size", type=int, default=500, help="messages handed to a worker at a time")
+    parser.add_argument("--out", help="write would-be alerts here (- for stdout); omit for a dry run")
+    parser.add_argument("--format", choices=("json", "text"), default="json", help="format of --out")
+    parser.add_argument("--crm", action="store_true", help="resolve display names with live CRM calls")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    with ExitStack() as stack:
+        out = None
+        if args.out == "-":
+            out = sys.stdout
+        elif args.out:
+            out = stack.enter_context(open(args.out, "w", encoding="utf-8"))
+        summary = replay(args.paths, workers=args.workers, out=out, fmt=args.format, offline=not args.crm,
+                         chunk_size=args.chunk_size)
+    json.dump(summary, sys.stderr if out is sys.stdout else sys.stdout, indent=2)
+    print(file=sys.stderr if out is sys.stdout else sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,8 @@ import types
 
 import pytest
 
+from lib.destinations.base import ChangeGroup, IamChangeEvent
+
 FIXTURES = pathlib.Path(__file__).parent / "fixtures"
 
 
@@ -42,15 +44,40 @@ class FakeCRMClient:
     def organizations(self): return FakeCRMOrgs()
 
 
+@pytest.fixture(autouse=True)
+def fresh_rate_limits():
+    # Slack buckets are process-wide; don't let one test's sends throttle the next
+    from lib.ratelimit import reset_shared_stores
+    reset_shared_stores()
+    yield
+    reset_shared_stores()
+
+
 def import_main_with_stubs(monkeypatch):
     # Ensure env vars are present for the module under test
     monkeypatch.setenv("SLACK_TOKEN", "x-test-token")
     monkeypatch.setenv("SLACK_CHANNEL", "#test-temp")
     monkeypatch.setenv("LOG_LEVEL", "ERROR")  # keep test output quiet
 
-    # Stub discovery.build BEFORE importing the module (it builds crm at import time)
-    import googleapiclient.discovery as discovery
-    monkeypatch.setattr(discovery, "build", lambda *a, **k: FakeCRMClient())
+    # Drop clients/ancestors cached by earlier tests, then stub the CRM client
+    import lib.gcp as gcp
+    gcp.crm_client.cache_clear()
+    gcp.hierarchy.cache_clear()
+    gcp.ancestor_cache.clear()
+    monkeypatch.setattr(gcp, "crm_client", lambda: FakeCRMClient())
+
+    # Destination graph is built once per process; rebuild it from this test's env
+    from lib.destinations.factory import reset_destination
+    reset_destination()
+
+    from lib.dedup import reset_default_store
+    reset_default_store()
+
+    from lib.policy_store import reset_policy_store
+    reset_policy_store()
+
+    from lib.suppress import suppressor
+    suppressor.cache_clear()
 
     # Now import or reload your module (assuming filename is main.py)
     import main
@@ -72,3 +99,29 @@ class DummyResp:
         self.headers = {}
 
     def json(self): return {"ok": self._ok}
+
+
+def make_change_event(*groups, members=("user:a@example.com",), role="roles/viewer", condition=None,
+                      **fields) -> IamChangeEvent:
+    """An ``IamChangeEvent`` for destination tests: a project grant by default, any field overridable.
+
+    ``groups`` are ``ChangeGroup``s or ``(event_type, role, members)`` tuples; without any, one
+    ``binding_added`` group is built from ``members``/``role``/``condition``.
+    """
+    changes = [
+        g if isinstance(g, ChangeGroup) else ChangeGroup(g[0], g[1], None, list(g[2]))
+        for g in groups
+    ] or [ChangeGroup("binding_added", role, condition, list(members))]
+    values = dict(
+        resource_type="cloudresourcemanager.googleapis.com/Project",
+        resource_name="//cloudresourcemanager.googleapis.com/projects/1",
+        resource_display="my-proj",
+        actor=None,
+        source="asset-feed",
+        timestamp="",
+        logs_url=None,
+        raw=None,
+        changes=changes,
+    )
+    values.update(fields)
+    return IamChangeEvent(**values)
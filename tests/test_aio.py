@@ -0,0 +1,158 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from lib.destinations import aio
+from lib.destinations.aio import (
+    AsyncCompositeDestination,
+    AsyncDestination,
+    AsyncEmailDestination,
+    AsyncSlackDestination,
+    SyncDestinationAdapter,
+    build_async_destination,
+)
+from lib.destinations.errors import PartialDeliveryError
+from lib.destinations.factory import load_settings
+from tests.conftest import make_change_event
+from tests.test_rules import Recorder
+
+
+class FakeResponse:
+    def __init__(self, status, body, delay):
+        self.status, self.headers, self._body, self._delay = status, {}, body, delay
+
+    async def __aenter__(self):
+        await asyncio.sleep(self._delay)
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def text(self):
+        return self._body
+
+
+class FakeSession:
+    def __init__(self, delay=0.0):
+        self.posts = []
+        self.delay = delay
+
+    def post(self, url, json=None, headers=None):
+        self.posts.append(json)
+        body = '{"ok": true, "ts": "1700000000.%06d"}' % len(self.posts)
+        return FakeResponse(200, body, self.delay)
+
+
+class FakeAsyncSMTP:
+    def __init__(self, log):
+        self.log = log
+
+    async def connect(self): self.log.append("connect")
+
+    async def starttls(self): self.log.append("starttls")
+
+    async def login(self, user, password): self.log.append("login")
+
+    async def send_message(self, msg):
+        if self.log.count("connect") == 1 and "dropped" not in self.log:
+            self.log.append("dropped")
+            raise ConnectionResetError("gone")
+        self.log.append(msg["Subject"])
+
+    async def quit(self): self.log.append("quit")
+
+
+def test_async_slack_keeps_many_sends_in_flight_and_threads_parts():
+    session = FakeSession(delay=0.05)
+    slack = AsyncSlackDestination({"SLACK_TOKEN": "x", "SLACK_CHANNEL": "#c", "SLACK_RATE_PER_SEC": "0"}, session)
+    assert not hasattr(slack.config, "session")  # settings only: no unused requests pool behind the aiohttp one
+
+    async def main():
+        t0 = time.perf_counter()
+        await asyncio.gather(*(slack.send(make_change_event(resource_display=f"p{i}")) for i in range(50)))
+        return time.perf_counter() - t0
+
+    assert asyncio.run(main()) < 1.0  # 50 x 50ms sequentially would take 2.5s
+    assert len(session.posts) == 50
+
+    session.posts.clear()
+    slack.config.max_message_bytes = 3000
+    asyncio.run(slack.send(make_change_event(members=[f"user:member-{i}@example.com" for i in range(400)])))
+    assert len(session.posts) > 1
+    assert {p["thread_ts"] for p in session.posts[1:]} == {"1700000000.000001"}
+
+
+def test_async_email_reuses_one_session_and_reconnects_once():
+    log = []
+    email = AsyncEmailDestination({"SMTP_HOST": "relay", "SMTP_USER": "u", "SMTP_PASS": "p",
+                                   "SMTP_EMAIL_FROM": "a@example.com", "SMTP_EMAIL_TO": "b@example.com"},
+                                  client_factory=lambda: FakeAsyncSMTP(log))
+
+    async def main():
+        await email.send_many([make_change_event(resource_display="one"), make_change_event(resource_display="two")])
+        await email.send(make_change_event(resource_display="three"))
+        await email.close()
+
+    asyncio.run(main())
+    assert email.connects == 2
+    assert [x for x in log if x.startswith("[")] == [
+        "[GCP IAM] New Role Grant in one", "[GCP IAM] New Role Grant in two", "[GCP IAM] New Role Grant in three"]
+    assert log[-1] == "quit"
+
+
+def test_async_email_reports_partial_delivery():
+    class Flaky(FakeAsyncSMTP):
+        async def send_message(self, msg):
+            if len(self.log) >= 2:
+                raise ConnectionResetError("gone")
+            self.log.append(msg["Subject"])
+
+    log = []
+    email = AsyncEmailDestination({"SMTP_HOST": "relay", "SMTP_EMAIL_FROM": "a@example.com",
+                                   "SMTP_EMAIL_TO": "b@example.com"}, client_factory=lambda: Flaky(log))
+    events = [make_change_event(resource_display=name) for name in ("one", "two", "three")]
+    with pytest.raises(PartialDeliveryError) as exc:
+        asyncio.run(email.send_many(events))
+    assert exc.value.delivered == 1
+    assert isinstance(exc.value.cause, ConnectionResetError)
+
+    log.clear()
+    log.extend(["x", "y"])  # every send fails from the start: the original error, nothing delivered
+    with pytest.raises(ConnectionResetError):
+        asyncio.run(email.send_many(events))
+
+
+def test_composite_awaits_sinks_together_and_cancels_late_ones(caplog):
+    class Slow(AsyncDestination):
+        cancelled = False
+
+        async def send(self, event):
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                Slow.cancelled = True
+                raise
+
+    recorder = Recorder()
+    dest = AsyncCompositeDestination([Slow(), SyncDestinationAdapter(recorder)], names=["slow", "sync"],
+                                     deadlines={"slow": 0.05})
+    asyncio.run(dest.send(make_change_event(resource_display="p")))
+
+    assert Slow.cancelled and len(recorder.events) == 1
+    failed = [r for r in caplog.records if r.msg == "one_or_more_destinations_failed"]
+    assert [r["status"] for r in failed[0].results] == ["timeout", "ok"]
+
+
+def test_builder_falls_back_to_sync_sinks_without_the_async_library(monkeypatch):
+    monkeypatch.setitem(aio.ASYNC_REGISTRY, "email", (AsyncEmailDestination, None))
+    settings = load_settings({"DEST_TYPES": "slack,email", "SLACK_WEBHOOK_URL": "https://hooks.example/x",
+                              "DEDUP_ENABLED": "false", "SMTP_HOST": "relay",
+                              "DEST_SLACK_RULES": json.dumps([{"roles": ["roles/owner"]}])})
+    monkeypatch.setitem(aio.ASYNC_REGISTRY, "slack", (lambda env: AsyncSlackDestination(env, FakeSession()), object))
+
+    dest = build_async_destination(settings)
+    slack, email = dest.destinations
+    assert isinstance(slack, aio.AsyncRoutingDestination) and isinstance(slack.inner, AsyncSlackDestination)
+    assert isinstance(email, SyncDestinationAdapter)
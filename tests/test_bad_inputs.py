@@ -22,10 +22,10 @@ def test_non_json_message_logged_and_acked(monkeypatch, caplog):
     monkeypatch.setattr(m, "cfg", Config(dest_types="slack,email", log_level=20))
 
     # Stub handlers so we detect accidental routing
-    monkeypatch.setattr(m, "process_feeds",
-                        lambda *a, **k: (_ for _ in ()).throw(AssertionError("should not be called")))
-    monkeypatch.setattr(m, "process_audit_logs",
-                        lambda *a, **k: (_ for _ in ()).throw(AssertionError("should not be called")))
+    import handlers
+    for key, h in list(handlers.HANDLERS.items()):
+        monkeypatch.setitem(handlers.HANDLERS, key, handlers.Handler(
+            h.name, lambda *a, **k: (_ for _ in ()).throw(AssertionError("should not be called"))))
 
     caplog.clear()
     caplog.set_level("WARNING")
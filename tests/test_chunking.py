@@ -0,0 +1,123 @@
+import smtplib
+
+import pytest
+
+from lib.dedup import MemoryDedupStore
+from lib.destinations.base import ChangeGroup
+from lib.destinations.chunking import split_event
+from lib.destinations.email_dest import EmailDestination
+from lib.destinations.errors import DeliveryError
+from lib.destinations.render import render
+from lib.destinations.slack_dest import SlackDestination
+from tests.conftest import DummyResp, make_change_event
+from tests.test_email import FakeSMTP
+
+
+def _event(n_members, groups=1):
+    return make_change_event(
+        *(ChangeGroup("binding_added", f"roles/custom.role{g}", {"title": "t", "expression": "true"},
+                      [f"user:member-{g}-{i}@example.com" for i in range(n_members)])
+          for g in range(groups)),
+        resource_type="cloudresourcemanager.googleapis.com/Organization",
+        resource_name="//cloudresourcemanager.googleapis.com/organizations/1",
+        resource_display="My Org (*organization-level*)",
+        timestamp="2025-08-21T10:00:24Z",
+        logs_url="https://console.cloud.google.com/logs",
+    )
+
+
+def test_parts_respect_limits_and_keep_every_member_in_order():
+    event = _event(700, groups=3)
+    parts = list(split_event(event, "slack_mrkdwn", max_bytes=4000, max_lines=20))
+
+    assert len(parts) > 3
+    for part in parts:
+        text = render(part, "slack_mrkdwn")
+        assert len(text.encode()) <= 4000
+        assert len(text.splitlines()) <= 20
+        assert part.resource_name == event.resource_name
+    flattened = [(g.role, m) for p in parts for g in p.changes for m in g.members]
+    assert flattened == [(g.role, m) for g in event.changes for m in g.members]
+
+
+def test_small_event_is_not_copied():
+    event = _event(3)
+    assert list(split_event(event, "html", 10_000, 100)) == [event]
+    assert next(split_event(event, "html", 10_000, 100)) is event
+
+
+def test_slack_threads_follow_up_parts_with_token_api(monkeypatch):
+    posted = []
+
+    def fake_post(self, url, json=None, headers=None, timeout=None):
+        posted.append(json)
+        resp = DummyResp()
+        resp.json = lambda: {"ok": True, "ts": f"1700000000.{len(posted):06d}"}
+        return resp
+
+    monkeypatch.setattr("requests.Session.post", fake_post)
+    slack = SlackDestination({"SLACK_TOKEN": "x", "SLACK_CHANNEL": "#c", "SLACK_MAX_MESSAGE_BYTES": "3000",
+                              "SLACK_RATE_PER_SEC": "0"})
+    slack.send(_event(400))
+
+    assert len(posted) > 1
+    assert "thread_ts" not in posted[0]
+    assert {p["thread_ts"] for p in posted[1:]} == {"1700000000.000001"}
+    assert all(len(p["text"].encode()) <= 3000 for p in posted)
+
+
+def test_email_sends_one_mail_per_part(monkeypatch):
+    FakeSMTP.instances = []
+    monkeypatch.setattr(smtplib, "SMTP", FakeSMTP)
+    dest = EmailDestination({"SMTP_HOST": "relay", "SMTP_MAX_MESSAGE_BYTES": "5000",
+                             "SMTP_EMAIL_FROM": "a@example.com", "SMTP_EMAIL_TO": "b@example.com"})
+    dest.send(_event(500))
+
+    subjects = FakeSMTP.instances[0].sent
+    assert len(subjects) > 1
+    assert subjects[1].endswith("(part 2)") and "(part" not in subjects[0]
+
+
+def test_retry_resumes_at_the_first_unsent_part(monkeypatch):
+    posted = []
+
+    def fake_post(self, url, json=None, headers=None, timeout=None):
+        posted.append(json)
+        if len(posted) == 3:
+            return DummyResp(500)
+        resp = DummyResp()
+        resp.json = lambda: {"ok": True, "ts": f"1700000000.{len(posted):06d}"}
+        return resp
+
+    monkeypatch.setattr("requests.Session.post", fake_post)
+    slack = SlackDestination({"SLACK_TOKEN": "x", "SLACK_CHANNEL": "#c", "SLACK_MAX_MESSAGE_BYTES": "3000",
+                              "SLACK_RATE_PER_SEC": "0", "SLACK_MAX_ATTEMPTS": "1"}, part_store=MemoryDedupStore())
+    event = _event(400)
+    with pytest.raises(DeliveryError):
+        slack.send(event)
+    slack.send(event)
+
+    parts = list(split_event(event, "slack_mrkdwn", 3000, slack.max_message_lines))
+    assert len(posted) == len(parts) + 1  # only the failed part went out twice
+    assert posted[3]["text"] == posted[2]["text"]
+    assert {p["thread_ts"] for p in posted[3:]} == {"1700000000.000001"}  # still the original thread
+
+    dest = EmailDestination({"SMTP_HOST": "relay", "SMTP_MAX_MESSAGE_BYTES": "5000",
+                             "SMTP_EMAIL_FROM": "a@example.com", "SMTP_EMAIL_TO": "b@example.com"},
+                            part_store=MemoryDedupStore())
+    mailed = []
+
+    def send_messages(messages):
+        for m in messages:
+            if len(mailed) == 1 and not dest.failed:
+                dest.failed = True
+                raise smtplib.SMTPServerDisconnected("gone")
+            mailed.append(m["Subject"])
+
+    dest.failed = False
+    monkeypatch.setattr(dest.session, "send_messages", send_messages)
+    with pytest.raises(smtplib.SMTPServerDisconnected):
+        dest.send(event)
+    dest.send(event)
+    assert mailed[0] == "[GCP IAM] New Role Grant in My Org (*organization-level*)"
+    assert mailed[1].endswith("(part 2)") and len(mailed) == len(set(mailed))
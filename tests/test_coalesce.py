@@ -0,0 +1,47 @@
+import time
+
+from lib.destinations.base import ChangeGroup, Destination
+from lib.destinations.coalesce import CoalescingDestination, merge_events
+from tests.conftest import make_change_event
+
+
+def _event(name, *groups, **fields):
+    return make_change_event(*groups, resource_type="iam.googleapis.com/ServiceAccount", resource_name=name, **fields)
+
+
+class Recorder(Destination):
+    def __init__(self): self.sent = []
+
+    def send(self, e): self.sent.append(e)
+
+
+def test_merge_dedups_members_per_role_and_condition():
+    cond = {"expression": "request.time < x", "title": "temp"}
+    merged = merge_events([
+        _event("sa1", ChangeGroup("binding_added", "roles/viewer", None, ["user:a", "user:b"])),
+        _event("sa2", ChangeGroup("binding_added", "roles/viewer", None, ["user:b", "user:c"]),
+               ChangeGroup("binding_added", "roles/viewer", cond, ["user:a"])),
+    ])
+
+    assert merged.resource_name == "sa1, sa2"
+    assert [(g.role, g.condition, g.members) for g in merged.changes] == [
+        ("roles/viewer", None, ["user:a", "user:b", "user:c"]),
+        ("roles/viewer", cond, ["user:a"]),
+    ]
+
+
+def test_window_and_max_events():
+    rec = Recorder()
+    dest = CoalescingDestination(rec, window=0.1, max_events=3)
+    g = ChangeGroup("binding_added", "roles/viewer", None, ["user:a"])
+
+    for i in range(3):  # hits max_events → sent immediately
+        dest.send(_event(f"sa{i}", g))
+    assert len(rec.sent) == 1
+
+    dest.send(_event("sa3", g))
+    dest.send(_event("sa4", g, resource_display="other-proj"))
+    assert len(rec.sent) == 1
+    time.sleep(0.3)
+    assert sorted(e.resource_display for e in rec.sent[1:]) == ["my-proj", "other-proj"]
+    dest.close()
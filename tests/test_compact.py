@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+from lib.destinations import compact
+from lib.destinations.base import ChangeGroup, event_to_dict
+from lib.destinations.outbox import _decode
+from tests.conftest import make_change_event
+
+
+def _event(members, role="roles/viewer", condition=None):
+    return make_change_event(
+        ChangeGroup("binding_added", role, condition, list(members)),
+        ChangeGroup("binding_removed", "roles/editor", None, list(members)),
+        timestamp="2025-08-21T10:00:24Z",
+        logs_url="https://console.cloud.google.com/logs",
+    )
+
+
+def test_compact_interns_members_and_is_immutable():
+    interner = compact.Interner()
+    sa = "serviceAccount:sa@p.iam.gserviceaccount.com"
+    a = compact.compact(_event([sa]), interner)
+    b = compact.compact(_event(["".join(sa)]), interner)
+
+    assert a.changes[0].members[0] is b.changes[1].members[0]
+    assert a.changes[0].role == "roles/viewer" and a.changes[0].members == (sa,)
+    with pytest.raises(AttributeError):
+        a.changes[0].role = "roles/owner"
+    assert compact.compact(a, interner) is a
+
+
+def test_dumps_loads_round_trip_stores_each_string_once():
+    sa = "serviceAccount:sa@p.iam.gserviceaccount.com"
+    event = _event([sa, "user:a@example.com"], condition={"title": "expiry", "expression": "true"})
+
+    data = compact.dumps(event)
+    assert data.count(sa.encode()) == 1
+    assert compact.expand(compact.loads(data)) == event
+
+    big = _event([f"user:u{i}@example.com" for i in range(500)])
+    assert compact.expand(compact.loads(compact.dumps(big))) == big
+
+
+def test_outbox_still_reads_json_rows():
+    event = _event(["user:a@example.com"])
+    legacy = json.dumps(event_to_dict(event)).encode()
+    assert _decode(legacy) == event
+    assert _decode(compact.dumps(event)) == event
@@ -0,0 +1,42 @@
+import handlers.asset as asset_handler
+from handlers.asset import _compute_deltas
+
+
+def _msg(old, new):
+    return {"asset": {"iamPolicy": {"bindings": new}}, "priorAsset": {"iamPolicy": {"bindings": old}}}
+
+
+def test_additions_and_removals_in_one_pass():
+    cond = {"title": "temp", "expression": "request.time < x"}
+    old = [
+        {"role": "roles/viewer", "members": ["user:a", "user:b"]},
+        {"role": "roles/editor", "members": ["user:c"]},
+        {"role": "roles/owner", "members": ["user:d"], "condition": cond},
+    ]
+    new = [
+        {"role": "roles/viewer", "members": ["user:b", "user:e"]},
+        {"role": "roles/editor", "members": ["user:c"]},
+        {"role": "roles/owner", "members": ["user:d"]},  # same role, condition dropped
+    ]
+
+    assert _compute_deltas(_msg(old, new)) == [
+        {"role": "roles/viewer", "members": ["user:e"], "condition": None, "change": "members_added"},
+        {"role": "roles/viewer", "members": ["user:a"], "condition": None, "change": "members_removed"},
+        {"role": "roles/owner", "members": ["user:d"], "condition": None, "change": "members_added"},
+        {"role": "roles/owner", "members": ["user:d"], "condition": cond, "change": "members_removed"},
+    ]
+
+
+def test_removal_fixture(load_fixture):
+    deltas = _compute_deltas(load_fixture("asset_project_remove_condition.json"))
+    assert [(d["role"], d["change"]) for d in deltas] == [("roles/browser", "members_removed")]
+
+
+def test_removals_only_notified_when_enabled(monkeypatch, load_fixture):
+    msg = load_fixture("asset_project_remove_condition.json")
+    assert asset_handler.build_feed_event(msg) is None
+
+    monkeypatch.setattr(asset_handler, "NOTIFY_EVENT_TYPES", frozenset({"binding_added", "binding_removed"}))
+    monkeypatch.setattr(asset_handler, "resolve_ancestor", lambda name: ("project", "my-proj", "my-proj"))
+    evt = asset_handler.build_feed_event(msg)
+    assert [g.event_type for g in evt.changes] == ["binding_removed"]
@@ -0,0 +1,126 @@
+import threading
+import time
+import types
+
+import pytest
+
+import lib.gcp as gcp
+from lib.cache import TTLCache
+from lib.crm import CrmClient, CrmError
+from tests.conftest import FakeCRMClient
+
+
+class FakeClock:
+    def __init__(self): self.now = 0.0
+
+    def __call__(self): return self.now
+
+
+def test_ttl_expiry_and_lru_eviction():
+    clock = FakeClock()
+    c = TTLCache(maxsize=2, ttl=10, clock=clock)
+    loads = []
+
+    def loader(k):
+        return lambda: loads.append(k) or k.upper()
+
+    assert c.get_or_load("a", loader("a")) == "A"
+    assert c.get_or_load("a", loader("a")) == "A"
+    assert loads == ["a"]
+
+    c.get_or_load("b", loader("b"))
+    c.get_or_load("c", loader("c"))  # evicts "a" (least recently used)
+    assert c.get("a") is None
+
+    clock.now = 11
+    c.get_or_load("b", loader("b"))
+    assert loads == ["a", "b", "c", "b"]
+    assert c.stats()["evictions"] == 1
+    assert c.stats()["expirations"] == 1
+
+
+def test_negative_caching():
+    class NotFound(Exception):
+        resp = types.SimpleNamespace(status=404)
+
+    calls = {"n": 0}
+
+    def loader():
+        calls["n"] += 1
+        raise NotFound("gone")
+
+    c = TTLCache(negative=gcp._is_negative)
+    raised = []
+    for _ in range(3):
+        with pytest.raises(NotFound) as exc:
+            c.get_or_load("projects/1", loader)
+        raised.append(exc.value)
+    assert calls["n"] == 1
+    assert c.stats()["negative_hits"] == 2
+    # each hit raises its own copy: tracebacks (and the caller frames in them) don't pile up on one instance
+    assert len({id(e) for e in raised}) == 3 and raised[2].args == ("gone",) and raised[2].resp.status == 404
+    depth = 0
+    tb = raised[2].__traceback__
+    while tb is not None:
+        depth, tb = depth + 1, tb.tb_next
+    assert depth <= 3
+
+
+def test_single_flight_coalesces_concurrent_loads():
+    c = TTLCache()
+    started = threading.Event()
+    calls = {"n": 0}
+
+    def slow_loader():
+        calls["n"] += 1
+        started.set()
+        time.sleep(0.05)
+        return "v"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(c.get_or_load("k", slow_loader))) for _ in range(8)]
+    threads[0].start()
+    started.wait()
+    for t in threads[1:]:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == ["v"] * 8
+    assert calls["n"] == 1
+
+
+def test_resolve_ancestor_uses_cache(monkeypatch):
+    calls = {"n": 0}
+
+    def fake_client():
+        calls["n"] += 1
+        return FakeCRMClient()
+
+    monkeypatch.setattr(gcp, "crm_client", fake_client)
+    gcp.ancestor_cache.clear()
+
+    assert gcp.resolve_ancestor("folders/42") == ("folder", "42", "My Folder (*folder-level*)")
+    assert gcp.resolve_ancestor("folders/42").resource_id == "42"
+    assert calls["n"] == 1
+
+
+def test_crm_client_maps_calls_to_v3_rest_and_raises_status():
+    class Session:
+        def __init__(self):
+            self.urls = []
+
+        def get(self, url, timeout=None):
+            self.urls.append(url)
+            if url.endswith("/404"):
+                return types.SimpleNamespace(status_code=404, text="not found")
+            return types.SimpleNamespace(status_code=200, json=lambda: {"projectId": "my-proj"})
+
+    session = Session()
+    crm = CrmClient(session=session)
+    assert crm.projects().get(name="projects/123").execute() == {"projectId": "my-proj"}
+    assert session.urls == ["https://cloudresourcemanager.googleapis.com/v3/projects/123"]
+
+    with pytest.raises(CrmError) as exc:
+        crm.folders().get(name="folders/404").execute()
+    assert gcp._is_negative(exc.value)
@@ -0,0 +1,32 @@
+import base64
+import json
+
+import pytest
+
+import lib.decode as decode
+from lib.decode import PayloadRef
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_loads_with_and_without_orjson(monkeypatch, use_orjson):
+    if not use_orjson:
+        monkeypatch.setattr(decode, "orjson", None)
+    raw = decode.b64decode(base64.b64encode(b'{"asset": {"name": "x"}}').decode())
+    assert decode.loads(raw) == {"asset": {"name": "x"}}
+    assert decode.loads(memoryview(raw)) == {"asset": {"name": "x"}}
+    with pytest.raises(ValueError):
+        decode.loads(b"this is not json")
+
+
+def test_payload_ref_compresses_large_payloads_when_kept():
+    msg = {"asset": {"iamPolicy": {"bindings": [{"role": "roles/viewer", "members": [f"user:u{i}@example.com"
+                                                                                      for i in range(5000)]}]}}}
+    data = json.dumps(msg).encode()
+    ref = PayloadRef(data)
+    assert ref._data is data  # nothing is done on the hot path
+
+    assert ref.shrink() is ref
+    assert ref.size == len(data)
+    assert len(ref._data) < len(data) / 5
+    assert ref.materialize() == msg
+    assert PayloadRef(b'{"a":1}').materialize() == {"a": 1}
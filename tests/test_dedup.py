@@ -0,0 +1,49 @@
+import base64
+import json
+
+import handlers
+from lib.dedup import MemoryDedupStore, SqliteDedupStore, TieredDedupStore, event_fingerprint
+from lib.destinations.base import Destination
+from lib.destinations.dedup_dest import DedupDestination
+from tests.conftest import import_main_with_stubs, make_change_event
+
+
+def _event(members):
+    return make_change_event(members=members, role="roles/storage.objectViewer", timestamp="2025-08-21T10:00:24Z")
+
+
+def test_fingerprint_is_normalized():
+    assert event_fingerprint(_event(["user:a", "user:b"])) == event_fingerprint(_event(["user:b", "user:a"]))
+    assert event_fingerprint(_event(["user:a"])) != event_fingerprint(_event(["user:b"]))
+
+
+def test_sink_skips_already_delivered_event(tmp_path):
+    sent = []
+
+    class D(Destination):
+        def send(self, e): sent.append(e)
+
+    store = TieredDedupStore(MemoryDedupStore(), SqliteDedupStore(str(tmp_path / "dedup.db")))
+    dest = DedupDestination(D(), store, "slack")
+    dest.send(_event(["user:a"]))
+    dest.send(_event(["user:a"]))
+    assert len(sent) == 1
+
+    # a fresh process sharing the on-disk store also skips it
+    restarted = DedupDestination(D(), TieredDedupStore(MemoryDedupStore(), store.disk), "slack")
+    restarted.send(_event(["user:a"]))
+    assert len(sent) == 1
+
+
+def test_redelivered_message_id_is_ignored(monkeypatch, load_fixture):
+    m = import_main_with_stubs(monkeypatch)
+    calls = {"n": 0}
+    key = ("audit", "storage.googleapis.com", "storage.setIamPermissions", "gcs_bucket")
+    counting = handlers.Handler("audit", lambda msg, source=None: calls.__setitem__("n", calls["n"] + 1))
+    monkeypatch.setitem(handlers.HANDLERS, key, counting)
+
+    data = base64.b64encode(json.dumps(load_fixture("audit_bucket_iam_add.json")).encode())
+    event = type("E", (), {"data": {"message": {"data": data, "messageId": "123"}}})()
+    m.hello_pubsub(event)
+    m.hello_pubsub(event)
+    assert calls["n"] == 1
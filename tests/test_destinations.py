@@ -1,5 +1,11 @@
-from lib.destinations.base import Destination, IamChangeEvent
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from lib.destinations.base import Destination
 from lib.destinations.composite import CompositeDestination
+from lib.destinations.slack_dest import SlackDestination
+from tests.conftest import make_change_event
 
 
 def test_fanout_calls_all(monkeypatch):
@@ -11,18 +17,75 @@ def test_fanout_calls_all(monkeypatch):
         def send(self, e): called.append(self.name)
 
     comp = CompositeDestination([D("a"), D("b"), D("c")])
-    comp.send(
-        IamChangeEvent(
-            resource_type="",
-            resource_name="",
-            resource_display="",
-            actor="",
-            source="",
-            timestamp="",
-            logs_url="",
-            raw={},
-            changes=[],
-        )
+    comp.send(make_change_event())
+
+    assert sorted(called) == ["a", "b", "c"]
+
+
+def test_fanout_is_parallel_with_per_sink_deadline(caplog):
+    class Slow(Destination):
+        def __init__(self, delay): self.delay = delay
+
+        def send(self, e): time.sleep(self.delay)
+
+    comp = CompositeDestination(
+        [Slow(0.2), Slow(0.2), Slow(1.0)],
+        names=["slack", "email", "smtp-relay"],
+        deadlines={"smtp-relay": 0.3},
     )
+    t0 = time.perf_counter()
+    comp.send(make_change_event())
+    elapsed = time.perf_counter() - t0
+
+    assert elapsed < 0.6  # slowest deadline, not 0.2 + 0.2 + 1.0
+    summary = [r for r in caplog.records if r.getMessage() == "one_or_more_destinations_failed"]
+    assert len(summary) == 1
+    statuses = {r["dest"]: r["status"] for r in summary[0].results}
+    assert statuses == {"slack": "ok", "email": "ok", "smtp-relay": "timeout"}
+
+
+def test_hung_sink_does_not_starve_the_others():
+    release = threading.Event()
+    delivered = []
+
+    class Hung(Destination):
+        def send(self, e): release.wait(5)
+
+    class Ok(Destination):
+        def send(self, e): delivered.append(e)
+
+    comp = CompositeDestination([Hung(), Ok()], names=["hung", "ok"], deadlines={"hung": 0.05}, max_workers=1)
+    for _ in range(3):  # the hung sink's only thread stays busy after the first event
+        comp.send(make_change_event())
+    release.set()
+    comp.close()
+    assert len(delivered) == 3
+
+
+def test_slack_reuses_keepalive_connection():
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            self.send_response(200)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"ok")
+
+        def log_message(self, *a): pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        url = f"http://127.0.0.1:{server.server_port}/hook"
+        slack = SlackDestination({"SLACK_WEBHOOK_URL": url, "SLACK_READ_TIMEOUT": "2", "SLACK_RATE_PER_SEC": "0"})
+        for _ in range(3):
+            slack.send(make_change_event())
+        stats = slack.connection_stats()
+        slack.close()
+    finally:
+        server.shutdown()
 
-    assert called == ["a", "b", "c"]
+    assert slack.timeout == (3.0, 2.0)
+    assert stats == {"requests": 3, "connections_opened": 1, "connections_reused": 2}
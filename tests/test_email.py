@@ -0,0 +1,64 @@
+import smtplib
+
+from lib.destinations.email_dest import EmailDestination
+from tests.conftest import make_change_event
+
+
+class FakeSMTP:
+    instances = []
+
+    def __init__(self, host, port, timeout=None):
+        self.sent = []
+        self.logins = 0
+        self.drop_next = False
+        self.closed = False
+        FakeSMTP.instances.append(self)
+
+    def starttls(self): pass
+
+    def login(self, user, password): self.logins += 1
+
+    def noop(self): return (250, b"ok")
+
+    def send_message(self, msg):
+        if self.drop_next:
+            raise smtplib.SMTPServerDisconnected("gone")
+        self.sent.append(msg["Subject"])
+
+    def quit(self):
+        if self.drop_next:
+            raise smtplib.SMTPServerDisconnected("gone")
+
+    def close(self): self.closed = True
+
+
+def _dest(monkeypatch):
+    FakeSMTP.instances = []
+    monkeypatch.setattr(smtplib, "SMTP", FakeSMTP)
+    return EmailDestination({
+        "SMTP_HOST": "relay", "SMTP_USER": "u", "SMTP_PASS": "p",
+        "SMTP_EMAIL_FROM": "a@example.com", "SMTP_EMAIL_TO": "b@example.com",
+    })
+
+
+def test_session_is_reused_across_sends_and_batches(monkeypatch):
+    dest = _dest(monkeypatch)
+    dest.send(make_change_event(resource_display="p1"))
+    dest.send(make_change_event(resource_display="p2"))
+    dest.send_many([make_change_event(resource_display="p3"), make_change_event(resource_display="p4")])
+
+    assert len(FakeSMTP.instances) == 1
+    assert FakeSMTP.instances[0].logins == 1
+    assert len(FakeSMTP.instances[0].sent) == 4
+
+
+def test_reconnects_when_server_drops_session(monkeypatch):
+    dest = _dest(monkeypatch)
+    dest.send(make_change_event(resource_display="p1"))
+    FakeSMTP.instances[0].drop_next = True
+
+    dest.send_many([make_change_event(resource_display="p2"), make_change_event(resource_display="p3")])
+
+    assert len(FakeSMTP.instances) == 2
+    assert FakeSMTP.instances[0].closed  # the dead socket is closed, not just forgotten
+    assert FakeSMTP.instances[1].sent == ["[GCP IAM] New Role Grant in p2", "[GCP IAM] New Role Grant in p3"]
@@ -0,0 +1,80 @@
+import json
+import os
+import subprocess
+import sys
+
+from lib.dedup import default_store
+from lib.destinations import factory
+from lib.destinations.composite import CompositeDestination
+from lib.destinations.dedup_dest import DedupDestination
+from lib.destinations.slack_dest import SlackDestination
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_destination_graph_is_cached(monkeypatch):
+    monkeypatch.setenv("DEST_TYPES", "slack")
+    monkeypatch.setenv("SLACK_WEBHOOK_URL", "https://hooks.example/x")
+    monkeypatch.setenv("DEDUP_ENABLED", "false")
+    factory.reset_destination()
+
+    d1 = factory.get_destination()
+    d2 = factory.get_destination()
+    assert d1 is d2
+    assert isinstance(d1, SlackDestination)
+
+    assert factory.reload_destination() is not d1
+    factory.reset_destination()
+
+
+def test_config_file_overrides_env_and_hot_reloads(monkeypatch, tmp_path):
+    cfg = tmp_path / "dest.json"
+    cfg.write_text(json.dumps({"DEST_TYPES": "slack", "SLACK_WEBHOOK_URL": "https://hooks.example/a"}))
+    monkeypatch.setenv("DEST_TYPES", "email")
+    monkeypatch.setenv("DEST_CONFIG_FILE", str(cfg))
+    monkeypatch.setenv("DEDUP_ENABLED", "false")
+    factory.reset_destination()
+
+    d1 = factory.get_destination()
+    assert isinstance(d1, SlackDestination)
+    assert d1.webhook == "https://hooks.example/a"
+    assert factory.get_destination() is d1
+
+    cfg.write_text(json.dumps({"DEST_TYPES": "slack,email", "SLACK_WEBHOOK_URL": "https://hooks.example/b"}))
+    st = os.stat(cfg)
+    os.utime(cfg, (st.st_atime, st.st_mtime + 5))
+
+    d2 = factory.get_destination()
+    assert isinstance(d2, CompositeDestination)
+    assert d2.destinations[0].webhook == "https://hooks.example/b"
+
+    # a half-written file keeps the current graph and is not re-read until it changes again
+    cfg.write_text('{"DEST_TYPES": "sla')
+    os.utime(cfg, (st.st_atime, st.st_mtime + 10))
+    loads = []
+    real_load = factory.load_settings
+    monkeypatch.setattr(factory, "load_settings", lambda: loads.append(1) or real_load())
+    assert factory.get_destination() is d2
+    assert factory.get_destination() is d2
+    assert len(loads) == 1
+    factory.reset_destination()
+
+
+def test_only_configured_sinks_are_imported():
+    code = (
+        "import sys, main; from lib.destinations.factory import get_destination; get_destination(); "
+        "print(*(m in sys.modules for m in ('lib.destinations.email_dest', 'smtplib', 'googleapiclient')))"
+    )
+    env = dict(os.environ, DEST_TYPES="slack", SLACK_WEBHOOK_URL="https://hooks.example/x", LOG_LEVEL="ERROR")
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    assert out.stdout.split() == ["False", "False", "False"]
+
+
+def test_splitting_sinks_get_the_dedup_store_at_construction():
+    settings = factory.load_settings({"SLACK_WEBHOOK_URL": "https://hooks.example/x"})
+    dest = factory.make_single_destination("slack", settings)
+    assert isinstance(dest, DedupDestination)
+    assert dest.inner.part_store is default_store()
+
+    settings = factory.load_settings({"SLACK_WEBHOOK_URL": "https://hooks.example/x", "DEDUP_ENABLED": "false"})
+    assert factory.make_single_destination("slack", settings).part_store is None
@@ -1,4 +1,4 @@
-from tests.conftest import DummyResp, import_main_with_stubs, FakeEvent
+from tests.conftest import DummyResp, FakeEvent, import_main_with_stubs
 
 
 def test_audit_posts_only_on_add(monkeypatch, load_fixture):
@@ -6,11 +6,11 @@ def test_audit_posts_only_on_add(monkeypatch, load_fixture):
 
     sent = {}
 
-    def fake_post(url, json=None, headers=None, timeout=None):
+    def fake_post(self, url, json=None, headers=None, timeout=None):
         sent["body"] = json
         return DummyResp()
 
-    monkeypatch.setattr("requests.post", fake_post)
+    monkeypatch.setattr("requests.Session.post", fake_post)
 
     audit_add = load_fixture("audit_bucket_iam_add.json")
     m.hello_pubsub(FakeEvent(audit_add))
@@ -24,7 +24,7 @@ def test_audit_posts_only_on_add(monkeypatch, load_fixture):
         calls["n"] += 1
         return DummyResp()
 
-    monkeypatch.setattr("requests.post", fake_post_no)
+    monkeypatch.setattr("requests.Session.post", fake_post_no)
 
     audit_remove = load_fixture("audit_bucket_iam_no_add.json")
 
@@ -36,11 +36,11 @@ def test_asset_posts(monkeypatch, load_fixture):
     m = import_main_with_stubs(monkeypatch)
     sent = {}
 
-    def fake_post(url, json=None, headers=None, timeout=None):
+    def fake_post(self, url, json=None, headers=None, timeout=None):
         sent["body"] = json
         return DummyResp()
 
-    monkeypatch.setattr("requests.post", fake_post)
+    monkeypatch.setattr("requests.Session.post", fake_post)
     payload_add = load_fixture("asset_project.json")
 
     m.hello_pubsub(FakeEvent(payload_add))
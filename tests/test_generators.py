@@ -0,0 +1,19 @@
+from benchmarks import generators
+from handlers import lookup
+from handlers.asset import _compute_deltas
+from lib.decode import b64decode, loads
+
+
+def test_asset_generator_changes_requested_bindings():
+    msg = generators.asset_message(bindings=50, members=3, changed=4, removed=2, conditions=0.5, seed=7)
+    changes = sorted(d["change"] for d in _compute_deltas(msg))
+    assert changes == ["members_added"] * 4 + ["members_removed"] * 2
+    assert generators.asset_message(bindings=50, seed=7) == generators.asset_message(bindings=50, seed=7)
+
+
+def test_audit_generator_round_trips_through_envelope_and_router():
+    env = generators.envelope(generators.audit_message(deltas=3, removes=1, seed=1), "m-1")
+    msg = loads(b64decode(env["message"]["data"]))
+    evt = lookup(msg).build(msg)
+    assert evt.resource_name == "bench-bucket-1"
+    assert sum(len(g.members) for g in evt.changes) == 3
@@ -0,0 +1,133 @@
+import json
+import types
+
+import lib.gcp as gcp
+from handlers.audit import build_audit_event
+from lib.crm import CrmClient
+from lib.hierarchy import HierarchyIndex, Node, nodes_from_crm, nodes_from_export, write_index
+from tests.conftest import DummyResp, FakeEvent, import_main_with_stubs
+
+NODES = [
+    Node("organizations/204449333134", "example.com", None),
+    Node("folders/42", "Platform", "organizations/204449333134"),
+    Node("folders/43", "Data", "folders/42"),
+    Node("projects/1067072829763", "my-proj", "folders/43"),
+    Node("projects/99", "mercurial-feat-386023", "folders/42"),
+]
+
+
+def test_index_file_lookups_aliases_overlay_and_save(tmp_path):
+    path = str(tmp_path / "h.idx")
+    assert write_index(path, NODES + [Node("projects/not-a-number", "x", None)]) == 5
+    index = HierarchyIndex(path)
+
+    assert index.get("folders/43") == NODES[2]
+    assert index.get("projects/mercurial-feat-386023") == NODES[4]  # by projectId
+    assert index.get("folders/44") is None and index.get("projects/nope") is None
+    assert [n.display for n in index.chain("projects/1067072829763")] == ["my-proj", "Data", "Platform",
+                                                                          "example.com"]
+
+    index.update(Node("folders/43", "Analytics", "folders/42"))
+    index.update(Node("projects/7", "new-proj", "folders/43"))
+    index.remove("projects/99")
+    assert index.get("projects/new-proj").name == "projects/7"
+    assert index.get("projects/mercurial-feat-386023") is None
+    assert [n.display for n in index.chain("projects/7")] == ["new-proj", "Analytics", "Platform", "example.com"]
+
+    index.save()
+    reloaded = HierarchyIndex(path)
+    assert sorted(reloaded.nodes()) == sorted([NODES[0], NODES[1], Node("folders/43", "Analytics", "folders/42"),
+                                               NODES[3], Node("projects/7", "new-proj", "folders/43")])
+
+
+def test_nodes_from_asset_export_and_crm_search():
+    lines = [
+        json.dumps({"name": "//cloudresourcemanager.googleapis.com/projects/5", "asset_type":
+                    "cloudresourcemanager.googleapis.com/Project", "resource": {"data": {
+                        "projectId": "p5", "parent": {"type": "folder", "id": "42"}}}}).encode(),
+        json.dumps({"asset": {"name": "//cloudresourcemanager.googleapis.com/folders/42", "assetType":
+                    "cloudresourcemanager.googleapis.com/Folder", "ancestors": ["folders/42", "organizations/1"],
+                    "resource": {"data": {"displayName": "Platform"}}}}).encode(),
+        json.dumps({"name": "//storage.googleapis.com/b", "asset_type": "storage.googleapis.com/Bucket"}).encode(),
+        b"not json",
+    ]
+    assert list(nodes_from_export(lines)) == [Node("projects/5", "p5", "folders/42"),
+                                              Node("folders/42", "Platform", "organizations/1")]
+
+    pages = {
+        ("organizations", None): {"organizations": [{"name": "organizations/1", "displayName": "example.com"}]},
+        ("folders", None): {"folders": [{"name": "folders/42", "displayName": "Platform",
+                                         "parent": "organizations/1"}], "nextPageToken": "t"},
+        ("folders", "t"): {"folders": [{"name": "folders/43", "displayName": "Data", "parent": "folders/42"}]},
+        ("projects", None): {"projects": [{"name": "projects/5", "projectId": "p5", "parent": "folders/43"}]},
+    }
+
+    class Session:
+        def get(self, url, params=None, timeout=None):
+            collection = url.rsplit("/", 1)[-1].split(":")[0]
+            page = pages[collection, params.get("pageToken")]
+            return types.SimpleNamespace(status_code=200, json=lambda: page)
+
+    assert [n.name for n in nodes_from_crm(CrmClient(session=Session()))] == [
+        "organizations/1", "folders/42", "folders/43", "projects/5"]
+
+
+def test_handlers_resolve_from_the_index_without_crm(monkeypatch, tmp_path, load_fixture, request):
+    request.addfinalizer(gcp.hierarchy.cache_clear)
+    path = str(tmp_path / "h.idx")
+    write_index(path, NODES)
+    monkeypatch.setenv("HIERARCHY_INDEX_PATH", path)
+    m = import_main_with_stubs(monkeypatch)
+
+    def no_crm():
+        raise AssertionError("CRM called")
+
+    monkeypatch.setattr(gcp, "crm_client", no_crm)
+    sent = []
+    monkeypatch.setattr("requests.Session.post", lambda self, url, json=None, **kw: sent.append(json) or DummyResp())
+
+    m.hello_pubsub(FakeEvent(load_fixture("asset_project.json")))
+    assert "in my-proj" in sent[-1]["text"]
+    assert "Hierarchy:* example.com / my-proj" in sent[-1]["text"]  # the feed message lists its own ancestors
+
+    m.hello_pubsub(FakeEvent(load_fixture("audit_bucket_iam_add.json")))
+    assert "Hierarchy:* example.com / Platform / mercurial-feat-386023" in sent[-1]["text"]
+    audit = build_audit_event(load_fixture("audit_bucket_iam_add.json"))
+    assert audit.ancestors == ("projects/99", "folders/42", "organizations/204449333134")  # by number
+
+    # a resource-content feed message moves the project; nothing is sent for it
+    m.hello_pubsub(FakeEvent({"asset": {
+        "name": "//cloudresourcemanager.googleapis.com/projects/1067072829763",
+        "assetType": "cloudresourcemanager.googleapis.com/Project",
+        "ancestors": ["projects/1067072829763", "folders/42", "organizations/204449333134"],
+        "resource": {"data": {"projectId": "my-proj"}},
+    }}))
+    assert len(sent) == 2
+    assert gcp.hierarchy().chain("projects/1067072829763")[1].display == "Platform"
+
+
+def test_worker_saves_feed_updates_to_the_index_on_exit(monkeypatch, tmp_path, request):
+    import worker
+    from lib.destinations.factory import reset_destination
+
+    request.addfinalizer(gcp.hierarchy.cache_clear)
+    path = str(tmp_path / "h.idx")
+    write_index(path, NODES)
+    monkeypatch.setenv("HIERARCHY_INDEX_PATH", path)
+    monkeypatch.setenv("DEST_TYPES", "slack")
+    monkeypatch.setenv("SLACK_WEBHOOK_URL", "https://hooks.example/x")
+    monkeypatch.setenv("DEDUP_ENABLED", "false")
+    request.addfinalizer(reset_destination)
+    gcp.hierarchy.cache_clear()
+
+    feed = tmp_path / "feed.ndjson"
+    feed.write_text(json.dumps({"asset": {
+        "name": "//cloudresourcemanager.googleapis.com/projects/7",
+        "assetType": "cloudresourcemanager.googleapis.com/Project",
+        "ancestors": ["projects/7", "folders/43", "folders/42", "organizations/204449333134"],
+        "resource": {"data": {"projectId": "new-proj"}},
+    }}) + "\n")
+    worker.run(worker.FileSource(str(feed)), metrics_log_interval=0)
+
+    assert [n.display for n in HierarchyIndex(path).chain("projects/new-proj")] == [
+        "new-proj", "Data", "Platform", "example.com"]
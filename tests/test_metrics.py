@@ -0,0 +1,85 @@
+import urllib.request
+
+from lib import metrics
+from lib.destinations.slack_dest import SlackDestination
+from tests.conftest import DummyResp, FakeEvent, import_main_with_stubs, make_change_event
+
+
+def test_registry_exports_prometheus_text_and_snapshot():
+    reg = metrics.Registry()
+    c = reg.counter("t_total", "things")
+    h = reg.histogram("t_seconds", "latency", buckets=(0.1, 1.0))
+    c.inc(dest="slack")
+    c.inc(2, dest="slack")
+    h.observe(0.05, stage="decode")
+    h.observe(0.5, stage="decode")
+    h.observe(5, stage="decode")
+
+    text = reg.to_prometheus()
+    assert 't_total{dest="slack"} 3' in text
+    assert 't_seconds_bucket{stage="decode",le="0.1"} 1' in text
+    assert 't_seconds_bucket{stage="decode",le="1"} 2' in text
+    assert 't_seconds_bucket{stage="decode",le="+Inf"} 3' in text
+    assert 't_seconds_count{stage="decode"} 3' in text
+
+    snap = reg.snapshot()
+    assert snap["t_seconds"][0]["count"] == 3 and snap["t_seconds"][0]["buckets"] == {"0.1": 1, "1.0": 2}
+
+    server = metrics.serve(0, host="127.0.0.1", reg=reg)
+    try:
+        body = urllib.request.urlopen(f"http://127.0.0.1:{server.server_port}/metrics", timeout=5).read().decode()
+    finally:
+        server.shutdown()
+    assert body == reg.to_prometheus()
+
+
+def test_hello_pubsub_records_stages_and_outcome(monkeypatch, load_fixture):
+    m = import_main_with_stubs(monkeypatch)
+    monkeypatch.setattr("requests.Session.post", lambda self, url, json=None, headers=None, timeout=None: DummyResp())
+    metrics.registry.reset()
+
+    m.hello_pubsub(FakeEvent(load_fixture("asset_project.json")))
+
+    for name in ("decode", "classify", "crm", "send"):
+        assert metrics.STAGE_SECONDS.count(stage=name) == 1, name
+    assert metrics.STAGE_SECONDS.count(stage="delta", handler="asset") == 1
+    assert metrics.STAGE_SECONDS.count(stage="render", destination="slack") == 1
+    assert metrics.MESSAGES.value(handler="asset", outcome="sent") == 1
+    assert metrics.SENDS.value(destination="slack", outcome="ok") == 1
+
+
+def test_slack_counts_retries_and_rate_limits(monkeypatch):
+    answers = [DummyResp(429), DummyResp(200)]
+    answers[0].headers = {"Retry-After": "0"}
+    monkeypatch.setattr("requests.Session.post", lambda self, url, **kw: answers.pop(0))
+    monkeypatch.setattr("time.sleep", lambda s: None)
+    metrics.registry.reset()
+
+    SlackDestination({"SLACK_WEBHOOK_URL": "https://hooks.example/x"}).send(make_change_event())
+
+    assert metrics.RATE_LIMITED.value(destination="slack") == 1
+    assert metrics.RETRIES.value(destination="slack") == 1
+    assert metrics.SENDS.value(destination="slack", outcome="429") == 1
+    assert metrics.SENDS.value(destination="slack", outcome="ok") == 1
+
+
+def test_slack_ok_false_counts_as_error(monkeypatch):
+    monkeypatch.setattr("requests.Session.post", lambda self, url, **kw: DummyResp(200, ok=False))
+    metrics.registry.reset()
+
+    SlackDestination({"SLACK_TOKEN": "xoxb", "SLACK_CHANNEL": "#c"}).send(make_change_event())
+
+    assert metrics.SENDS.value(destination="slack", outcome="error") == 1
+    assert metrics.SENDS.value(destination="slack", outcome="ok") == 0
+
+
+def test_log_every_flushes_once_per_interval(monkeypatch):
+    reg, logged, now = metrics.Registry(), [], [100.0]
+    monkeypatch.setattr(reg, "log", lambda level=None: logged.append(now[0]))
+    monkeypatch.setattr(metrics.time, "monotonic", lambda: now[0])
+
+    for t in (100.0, 130.0, 160.0, 170.0, 225.0):
+        now[0] = t
+        reg.log_every(60)
+
+    assert logged == [160.0, 225.0]
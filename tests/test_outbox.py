@@ -0,0 +1,75 @@
+import time
+
+from lib.destinations import compact
+from lib.destinations.base import Destination
+from lib.destinations.errors import DeliveryError
+from lib.destinations.outbox import Outbox, OutboxDestination
+from tests.conftest import make_change_event
+
+
+def _event(name="b1"):
+    return make_change_event(resource_name=name, raw={"big": "payload"})
+
+
+class Flaky(Destination):
+    def __init__(self, failures):
+        self.failures = failures
+        self.delivered = []
+
+    def send(self, event):
+        if self.failures:
+            self.failures -= 1
+            raise DeliveryError("slack 429", retry_after=0)
+        self.delivered.append(event)
+
+
+def test_outbox_acks_fast_and_delivers_in_background(tmp_path):
+    inner = Flaky(failures=1)
+    dest = OutboxDestination(inner, Outbox(str(tmp_path / "o.db")), "slack", backoff_base=0.01, poll_interval=0.01)
+
+    dest.send(_event("b1"))
+    dest.send(_event("b2"))
+    assert dest.flush(timeout=5)
+    for _ in range(100):  # b1 is in backoff after its first failure
+        if len(inner.delivered) == 2:
+            break
+        time.sleep(0.02)
+    dest.close()
+
+    assert sorted(e.resource_name for e in inner.delivered) == ["b1", "b2"]
+    assert inner.delivered[0].changes[0].members == ["user:a@example.com"]
+    assert dest.outbox.counts("slack") == {"pending": 0, "dead": 0}
+
+
+def test_outbox_dead_letters_after_max_attempts(tmp_path):
+    outbox = Outbox(str(tmp_path / "o.db"))
+    dest = OutboxDestination(Flaky(failures=99), outbox, "email", max_attempts=3, backoff_base=0)
+
+    dest.outbox.enqueue("email", b'{"resource_type":"t","resource_name":"n","resource_display":"d","actor":null,'
+                                 b'"source":"s","timestamp":"","logs_url":null,"raw":{},"changes":[]}')
+    for _ in range(3):
+        assert dest.drain_once() == 1
+    assert dest.drain_once() == 0
+    assert outbox.counts("email") == {"pending": 0, "dead": 1}
+
+
+def test_partial_batch_failure_only_retries_undelivered_rows(tmp_path):
+    class FailsOnce(Destination):
+        def __init__(self):
+            self.delivered = []
+            self.failed = False
+
+        def send(self, event):
+            if event.resource_name == "b3" and not self.failed:
+                self.failed = True
+                raise DeliveryError("slack 500")
+            self.delivered.append(event.resource_name)
+
+    inner = FailsOnce()
+    dest = OutboxDestination(inner, Outbox(str(tmp_path / "o.db")), "slack", backoff_base=0)
+    for name in ("b1", "b2", "b3", "b4"):
+        dest.outbox.enqueue("slack", compact.dumps(_event(name)))
+
+    assert dest.drain_once() == 4
+    assert inner.delivered == ["b1", "b2", "b3", "b4"]  # b1, b2 not sent again when b3 is retried on its own
+    assert dest.outbox.counts("slack") == {"pending": 0, "dead": 0}
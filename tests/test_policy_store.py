@@ -0,0 +1,70 @@
+import copy
+import sqlite3
+
+import pytest
+
+from lib.policy_store import Seen, SqlitePolicyStore, reset_policy_store
+from tests.conftest import DummyResp, FakeEvent, import_main_with_stubs
+
+V1 = [{"role": "roles/viewer", "members": ["user:a"]}]
+V2 = [{"role": "roles/viewer", "members": ["user:a", "user:b"]}]
+V3 = [{"role": "roles/viewer", "members": ["user:b"]}]
+
+
+def test_record_returns_prior_and_handles_redelivery_and_reordering(tmp_path):
+    path = str(tmp_path / "policies.db")
+    store = SqlitePolicyStore(path)
+
+    assert store.record("b", "2025-08-17T22:06:39Z", V1) == Seen(None)  # first sighting
+    assert store.record("b", "2025-08-17T22:06:40.5Z", V2) == Seen(V1)
+    assert store.record("b", "2025-08-17T22:06:40.500000Z", V2) == Seen(V1)  # redelivery: same prior again
+    assert store.record("b", "2025-08-17T22:06:40.1Z", V3) == Seen(None, stale=True)
+    assert store.record("b", "2025-08-17T22:06:41Z", V3, prior=[]) == Seen([])  # priorAsset wins
+    # a late message with its own priorAsset is still diffed, and leaves the newer state alone
+    assert store.record("b", "2025-08-17T22:06:40Z", V2, prior=V1) == Seen(V1)
+    assert store.get("b") == V3
+
+    with pytest.raises(TypeError):
+        store.record("c", "2025-08-17T22:06:39Z", [{"role": object()}])
+    assert store.record("c", "2025-08-17T22:06:39Z", V1) == Seen(None)  # the failed write was rolled back
+
+    reopened = SqlitePolicyStore(path)
+    assert reopened.get("b") == V3
+    reopened.forget("b")
+    assert store.get("b") is None
+
+    big = [{"role": f"roles/r{i}", "members": [f"user:u{j}@example.com" for j in range(20)]} for i in range(50)]
+    store.record("big", "2025-08-17T22:06:39Z", big)
+    blob = sqlite3.connect(path).execute("SELECT bindings FROM policies WHERE name = 'big'").fetchone()[0]
+    assert len(blob) < len(str(big)) / 5
+
+
+def test_bucket_feed_is_diffed_against_stored_policy(monkeypatch, tmp_path, load_fixture, request):
+    request.addfinalizer(reset_policy_store)
+    monkeypatch.setenv("POLICY_STORE_PATH", str(tmp_path / "policies.db"))
+    m = import_main_with_stubs(monkeypatch)
+    sent = []
+    monkeypatch.setattr("requests.Session.post", lambda self, url, json=None, **kw: sent.append(json) or DummyResp())
+
+    first = load_fixture("asset_bucket.json")
+    m.hello_pubsub(FakeEvent(first))
+    assert sent == []  # baseline only
+
+    second = copy.deepcopy(first)
+    second["asset"]["updateTime"] = "2025-08-18T09:00:00Z"
+    grant = {"role": "roles/storage.admin", "members": ["user:eve@example.com"]}
+    second["asset"]["iamPolicy"]["bindings"].append(grant)
+    m.hello_pubsub(FakeEvent(second))
+    assert len(sent) == 1
+    assert "eve@example.com" in sent[0]["text"] and "alice@example.com" not in sent[0]["text"]
+
+    m.hello_pubsub(FakeEvent(first))  # late copy of the older state
+    assert len(sent) == 1
+
+    # messages with priorAsset are diffed against it even when they arrive after a newer one
+    newer = load_fixture("asset_project.json")
+    older = copy.deepcopy(newer)
+    newer["asset"]["updateTime"] = "2025-08-19T09:00:00Z"
+    m.hello_pubsub(FakeEvent(newer))
+    m.hello_pubsub(FakeEvent(older))
+    assert len(sent) == 3
@@ -0,0 +1,77 @@
+import pytest
+
+from lib import ratelimit
+from lib.destinations.slack_dest import SlackDestination
+from lib.ratelimit import MemoryRateStore, RateLimiter, SqliteRateStore, make_rate_limiter
+from tests.conftest import DummyResp, make_change_event
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    slept = []
+
+    def sleep(s):
+        slept.append(s)
+        now[0] += s
+
+    monkeypatch.setattr(ratelimit.time, "time", lambda: now[0])
+    monkeypatch.setattr(ratelimit.time, "sleep", sleep)
+    return slept
+
+
+def test_bucket_allows_burst_then_spaces_sends_at_rate(clock):
+    store = MemoryRateStore()
+    assert [round(store.reserve("k", 10, 2), 3) for _ in range(4)] == [0, 0, 0.1, 0.2]
+    assert store.reserve("other", 10, 2) == 0
+
+    limiter = RateLimiter(MemoryRateStore(), rate=1)
+    for _ in range(3):
+        limiter.acquire("k")
+    assert clock == [1.0, 1.0]
+
+
+def test_pause_is_shared_through_the_sqlite_file(tmp_path, clock):
+    path = str(tmp_path / "rate.db")
+    a, b = RateLimiter(SqliteRateStore(path)), RateLimiter(SqliteRateStore(path))  # two "processes"
+    a.acquire("k")
+    a.pause("k", 30)
+
+    assert b.acquire("k") == 30
+    assert b.acquire("k") == 1  # no burst after the pause
+
+
+def test_waiters_queued_before_a_pause_leave_at_rate_after_it(tmp_path, monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(ratelimit.time, "time", lambda: now[0])
+    monkeypatch.setattr(ratelimit.time, "sleep", lambda s: now.__setitem__(0, now[0] + s))
+    t0 = now[0]
+    for store in (MemoryRateStore(), SqliteRateStore(str(tmp_path / "rate.db"))):
+        now[0] = t0
+        limiter = RateLimiter(store, rate=1)
+        queued = [(store.shifted("k"), store.reserve("k", 1, 1)) for _ in range(4)]
+        assert [d for _, d in queued] == [0, 1, 2, 3]
+        limiter.pause("k", 10)  # the first send got a 429 with Retry-After: 10
+
+        sent = []
+        for shifted, delay in queued[1:]:
+            now[0] = t0  # the other three sleep side by side
+            limiter._wait("k", shifted, delay)
+            sent.append(now[0] - t0)
+        assert sent == [10, 11, 12]
+        assert limiter.acquire("k") == 1  # a new sender queues behind them
+
+
+def test_slack_429_pauses_every_sender_of_the_webhook(monkeypatch, clock):
+    answers = [DummyResp(429), DummyResp(200), DummyResp(200)]
+    answers[0].headers = {"Retry-After": "7"}
+    monkeypatch.setattr("requests.Session.post", lambda self, url, **kw: answers.pop(0))
+    env = {"SLACK_WEBHOOK_URL": "https://hooks.example/x"}
+    first, second = SlackDestination(env), SlackDestination(env)
+    assert first.limiter.store is second.limiter.store
+
+    first.send(make_change_event())
+    assert clock == [7]
+    second.send(make_change_event())
+    assert clock == [7, 1]
+    assert make_rate_limiter("SLACK_", {"SLACK_RATE_PER_SEC": "0"}).acquire(first.rate_key) == 0
@@ -0,0 +1,68 @@
+from lib.destinations import render as render_mod
+from lib.destinations.render import BLOCK_TEXT_LIMIT, MEMBERS_PER_LINE, iter_lines, render
+from tests.conftest import make_change_event
+
+
+def _event(members, condition=None):
+    return make_change_event(
+        members=members,
+        role="roles/storage.objectViewer",
+        condition=condition,
+        resource_type="storage.googleapis.com/Bucket",
+        resource_name="b<1>",
+        actor="bob@example.com",
+        source="audit-logs",
+        timestamp="2025-08-21T10:00:24Z",
+        logs_url="https://console.cloud.google.com/logs/query;q=a&b",
+    )
+
+
+def test_members_render_as_a_list_not_a_python_repr():
+    text = render(_event(["user:a@example.com", "user:b@example.com"]), "slack_mrkdwn")
+    assert "*Granted to:* user:a@example.com, user:b@example.com" in text
+    assert "['" not in text
+    assert text.splitlines()[0] == ":information_source: New Role Grant in my-proj"
+    assert "*Asset Name:* b&lt;1&gt;" in text
+
+
+def test_each_format_is_rendered_once_per_event(monkeypatch):
+    event = _event(["user:a@example.com"], condition={"title": "temp", "expression": "request.time < x"})
+    calls = []
+    real = render_mod.iter_lines
+    monkeypatch.setattr(render_mod, "iter_lines", lambda e, fmt: calls.append(fmt) or real(e, fmt))
+
+    html = render(event, "html")
+    assert render(event, "html") is html
+    assert "<b>With condition:</b> temp (request.time &lt; x)" in html
+    assert 'href="https://console.cloud.google.com/logs/query;q=a&amp;b"' in html
+    render(event, "text")
+    assert calls == ["html", "text"]
+
+
+def test_long_member_lists_continue_on_new_lines_and_blocks_stay_under_limit():
+    members = [f"serviceAccount:sa-{i}@my-proj.iam.gserviceaccount.com" for i in range(MEMBERS_PER_LINE * 3 + 1)]
+    event = _event(members)
+    lines = list(iter_lines(event, "text"))
+    member_lines = [ln for ln in lines if "serviceAccount:" in ln]
+    assert len(member_lines) == 4 and member_lines[0].startswith("Granted to: ")
+    assert sum(ln.count("serviceAccount:") for ln in member_lines) == len(members)
+
+    blocks = render(event, "blocks")
+    assert all(len(b["text"]["text"]) <= BLOCK_TEXT_LIMIT for b in blocks)
+    assert len(blocks) > 2
+
+
+def test_member_line_over_the_block_limit_is_split_not_cut():
+    members = [f"serviceAccount:{'x' * 80}-{i}@my-proj.iam.gserviceaccount.com" for i in range(MEMBERS_PER_LINE)]
+    blocks = render(_event(members), "blocks")
+
+    assert all(len(b["text"]["text"]) <= BLOCK_TEXT_LIMIT for b in blocks)
+    text = "".join(b["text"]["text"] for b in blocks)
+    assert all(m in text for m in members)
+
+
+def test_slack_link_url_is_escaped():
+    event = _event(["user:a@example.com"])
+    event.logs_url = "https://console.cloud.google.com/logs/query;q=a&b|c<d>"
+    text = render(event, "slack_mrkdwn")
+    assert "*<https://console.cloud.google.com/logs/query;q=a&amp;b%7Cc&lt;d&gt;|Browse Audit Logs>*" in text
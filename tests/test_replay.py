@@ -0,0 +1,74 @@
+import base64
+import copy
+import gzip
+import io
+import json
+
+import replay
+
+
+def _snapshot(asset, members):
+    # exportAssets output: a bare asset with snake_case field names
+    a = copy.deepcopy(asset["asset"])
+    bindings = a["iamPolicy"]["bindings"] + [{"role": "roles/iam.securityAdmin", "members": members}]
+    return {"name": a["name"] + "-export", "asset_type": a["assetType"], "ancestors": a["ancestors"],
+            "iam_policy": {"bindings": bindings}}
+
+
+def _write(tmp_path, load_fixture):
+    asset = load_fixture("asset_project.json")
+    audit = load_fixture("audit_bucket_iam_add.json")
+    envelope = {"message": {"data": base64.b64encode(json.dumps(asset).encode()).decode(), "messageId": "1"}}
+    lines = [
+        envelope,
+        audit,  # Logging export entry
+        _snapshot(asset, ["user:eve@example.com"]),  # baseline only
+        _snapshot(asset, ["user:eve@example.com", "user:mallory@example.com"]),
+        {"unrelated": True},
+    ]
+    path = tmp_path / "export.ndjson.gz"
+    with gzip.open(path, "wt") as f:
+        f.write("\n".join(json.dumps(x) for x in lines) + "\n\n")
+        f.write("not json\n")
+    return str(path)
+
+
+def test_replay_summarizes_and_writes_would_be_alerts(monkeypatch, tmp_path, load_fixture):
+    monkeypatch.setenv("DEST_TYPES", "slack")
+    monkeypatch.setenv("DEST_SLACK_RULES", json.dumps([{"action": "exclude", "members": ["^user:alice@"]}]))
+    out = io.StringIO()
+
+    summary = replay.replay([_write(tmp_path, load_fixture)], out=out)
+
+    assert summary["lines"] == 6 and summary["baselines"] == 1
+    assert summary["outcomes"] == {"asset:alerted": 1, "asset:filtered": 1, "audit:alerted": 1,
+                                   "none:invalid": 1,
+                                   "none:unrecognized": 1}
+    alerts = [json.loads(x) for x in out.getvalue().splitlines()]
+    assert summary["alerts"] == {"slack": len(alerts)} == {"slack": 2}
+    paired = alerts[1]["event"]
+    assert [g["members"] for g in paired["changes"]] == [["user:mallory@example.com"]]
+    assert paired["resource_name"].endswith("-export")
+    assert paired["resource_display"] == "1067072829763"  # offline: no CRM call
+    assert all("user:alice@example.com" not in g["members"] for a in alerts for g in a["event"]["changes"])
+
+
+def test_process_pool_gives_the_same_summary(monkeypatch, tmp_path, load_fixture):
+    monkeypatch.setenv("DEST_TYPES", "slack")
+    path = _write(tmp_path, load_fixture)
+    single = replay.replay([path])
+    pooled = replay.replay([path], workers=2, chunk_size=2)
+    for key in ("lines", "messages", "outcomes", "alerts", "top_roles"):
+        assert single[key] == pooled[key]
+
+
+def test_replay_leaves_the_live_policy_store_alone(monkeypatch, tmp_path, load_fixture):
+    live = tmp_path / "policies.db"
+    monkeypatch.setenv("POLICY_STORE_PATH", str(live))
+    monkeypatch.setenv("DEST_TYPES", "slack")
+
+    summary = replay.replay([_write(tmp_path, load_fixture)])
+
+    assert summary["outcomes"]["asset:alerted"] == 2
+    assert not live.exists()
+    assert replay.os.environ["POLICY_STORE_PATH"] == str(live)
@@ -1,19 +1,22 @@
+import handlers
 from config import Config
-from tests.conftest import import_main_with_stubs, FakeEvent
+from tests.conftest import FakeEvent, import_main_with_stubs
+
+
+def _record_handlers(monkeypatch):
+    called = {"feeds": 0, "audits": 0}
+    for key, h in list(handlers.HANDLERS.items()):
+        counter = "feeds" if h.name == "asset" else "audits"
+        monkeypatch.setitem(
+            handlers.HANDLERS, key,
+            handlers.Handler(h.name, lambda msg, source=None, c=counter: called.__setitem__(c, 1)),
+        )
+    return called
 
 
 def test_routes_asset(monkeypatch, load_fixture):
     m = import_main_with_stubs(monkeypatch)
-
-    called = {"feeds": 0, "audits": 0}
-    monkeypatch.setattr(
-        m, "process_feeds",
-        lambda msg: called.__setitem__("feeds", 1)
-    )
-    monkeypatch.setattr(
-        m, "process_audit_logs",
-        lambda msg: called.__setitem__("audits", 1)
-    )
+    called = _record_handlers(monkeypatch)
 
     # Replace the whole cfg with a dummy one
     monkeypatch.setattr(m, "cfg", Config(dest_types="slack", log_level=20))
@@ -27,16 +30,7 @@ def test_routes_asset(monkeypatch, load_fixture):
 
 def test_routes_audit(monkeypatch, load_fixture):
     m = import_main_with_stubs(monkeypatch)
-
-    called = {"feeds": 0, "audits": 0}
-    monkeypatch.setattr(
-        m, "process_feeds",
-        lambda msg: called.__setitem__("feeds", 1)
-    )
-    monkeypatch.setattr(
-        m, "process_audit_logs",
-        lambda msg: called.__setitem__("audits", 1)
-    )
+    called = _record_handlers(monkeypatch)
 
     # Replace the whole cfg with a dummy one
     monkeypatch.setattr(m, "cfg", Config(dest_types="slack", log_level=20))
@@ -46,3 +40,14 @@ def test_routes_audit(monkeypatch, load_fixture):
     m.hello_pubsub(FakeEvent(payload))
     assert called["feeds"] == 0
     assert called["audits"] == 1
+
+
+def test_dispatch_keys(load_fixture):
+    assert handlers.dispatch_key(load_fixture("asset_project.json")) == ("asset", "iam-policy")
+    assert handlers.dispatch_key(load_fixture("audit_bucket_iam_add.json")) == (
+        "audit", "storage.googleapis.com", "storage.setIamPermissions", "gcs_bucket",
+    )
+    # same shape, different method: not ours
+    other = load_fixture("audit_bucket_iam_add.json")
+    other["protoPayload"]["methodName"] = "storage.buckets.create"
+    assert handlers.lookup(other) is None
@@ -0,0 +1,98 @@
+import json
+
+from lib.destinations import factory
+from lib.destinations.base import Destination
+from lib.destinations.compact import compact
+from lib.destinations.rules import RoleIndex, RoutingDestination, Rule, RuleSet
+from tests.conftest import make_change_event
+
+
+def _event(*groups, resource_type="cloudresourcemanager.googleapis.com/Project", ancestors=("projects/1", "folders/7")):
+    return make_change_event(*groups, resource_type=resource_type, ancestors=ancestors)
+
+
+class Recorder(Destination):
+    def __init__(self):
+        self.events = []
+
+    def send(self, event):
+        self.events.append(event)
+
+
+def test_role_index_handles_exact_prefix_and_glob():
+    idx = RoleIndex()
+    idx.add(0, ["roles/owner"])
+    idx.add(1, ["roles/storage.*"])
+    idx.add(2, ["roles/*Admin"])
+    idx.add(3, [])
+
+    assert idx.lookup("roles/owner") == {0, 3}
+    assert idx.lookup("roles/ownerX") == {3}
+    assert idx.lookup("roles/storage.objectAdmin") == {1, 2, 3}
+    assert idx.lookup("roles/iam.securityAdmin") == {2, 3}
+
+
+def test_sink_gets_only_matching_groups_and_same_object_when_all_match():
+    rules = RuleSet([
+        Rule(roles=("roles/storage.*", "roles/owner")),
+        Rule(action="exclude", members=(r"^serviceAccount:.*@cloudbuild\.gserviceaccount\.com$",)),
+    ])
+    inner = Recorder()
+    dest = RoutingDestination(inner, rules)
+
+    event = _event(
+        ("binding_added", "roles/storage.admin", ["user:a@example.com"]),
+        ("binding_added", "roles/viewer", ["user:b@example.com"]),
+        ("binding_added", "roles/owner", ["serviceAccount:1@cloudbuild.gserviceaccount.com"]),
+    )
+    dest.send(event)
+    assert [g.role for g in inner.events[0].changes] == ["roles/storage.admin"]
+    assert inner.events[0].changes[0] is event.changes[0]
+    assert len(event.changes) == 3  # the original is untouched
+
+    all_match = _event(("binding_added", "roles/owner", ["user:a@example.com"]))
+    dest.send(all_match)
+    assert inner.events[1] is all_match
+
+    dest.send(_event(("binding_added", "roles/viewer", ["user:a@example.com"])))
+    assert len(inner.events) == 2
+
+
+def test_resource_type_ancestor_and_event_type_filters():
+    rules = RuleSet([Rule(resource_types=("storage.googleapis.com/Bucket",), ancestors=("folders/7",),
+                          event_types=("binding_removed",))])
+    bucket = _event(("binding_removed", "roles/viewer", ["user:a"]), ("binding_added", "roles/viewer", ["user:b"]),
+                    resource_type="storage.googleapis.com/Bucket")
+    assert rules.select(bucket) == [bucket.changes[0]]
+    assert rules.apply(_event(("binding_removed", "roles/viewer", ["user:a"]))) is None
+    assert rules.apply(compact(bucket)).changes[0].members == ("user:a",)
+    other_folder = _event(("binding_removed", "roles/viewer", ["user:a"]),
+                          resource_type="storage.googleapis.com/Bucket", ancestors=("projects/2", "folders/8"))
+    assert rules.apply(other_folder) is None
+
+
+def test_factory_compiles_rules_and_legacy_filters(monkeypatch):
+    monkeypatch.setenv("DEST_TYPES", "slack")
+    monkeypatch.setenv("SLACK_WEBHOOK_URL", "https://hooks.example/x")
+    monkeypatch.setenv("DEDUP_ENABLED", "false")
+    monkeypatch.setenv("DEST_SLACK_ROLES", "roles/storage.objectViewer")
+    monkeypatch.setenv("DEST_SLACK_RULES", json.dumps([{"action": "exclude", "members": ["^user:bot-"]}]))
+    factory.reset_destination()
+
+    dest = factory.get_destination()
+    assert isinstance(dest, RoutingDestination)
+    sent = []
+    monkeypatch.setattr(dest.inner, "send", sent.append)
+
+    dest.send(_event(
+        ("binding_added", "roles/storage.objectViewer", ["user:a@example.com"]),
+        ("binding_added", "roles/storage.objectViewer", ["user:bot-1@example.com"]),
+        ("binding_added", "roles/editor", ["user:a@example.com"]),
+        ("binding_added", "roles/storage.objectViewer", ["user:bot-2@example.com", "user:b@example.com"]),
+    ))
+    # an exclude by member removes those members, not the rest of their group
+    assert [g.members for g in sent[0].changes] == [["user:a@example.com"], ["user:b@example.com"]]
+    compacted = dest.rules.apply(compact(_event(
+        ("binding_added", "roles/storage.objectViewer", ["user:bot-3@example.com", "user:c@example.com"]))))
+    assert compacted.changes[0].members == ("user:c@example.com",)
+    factory.reset_destination()
@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+import lib.gcp as gcp
+from lib.suppress import Suppressor, SuppressRule, suppressor
+from tests.conftest import DummyResp, FakeEvent, import_main_with_stubs
+
+TF = "serviceAccount:terraform@infra.iam.gserviceaccount.com"
+
+
+def test_rules_compile_and_match(tmp_path):
+    rules_file = tmp_path / "suppress.json"
+    rules_file.write_text(json.dumps([{"resource_types": "pubsub.googleapis.com/Topic"}]))
+    s = Suppressor.from_env({
+        "SUPPRESS_RULES_FILE": str(rules_file),
+        "SUPPRESS_RULES": json.dumps([
+            {"principals": [TF], "roles": ["roles/storage.*"]},  # expected grant
+            {"members": ["^group:sre-"]},
+            {"roles": "roles/logging.viewer", "resource_types": ["storage.googleapis.com/Bucket"]},
+            {"actors": ["deployer@infra.iam.gserviceaccount.com"]},
+        ]),
+    })
+    bucket = "storage.googleapis.com/Bucket"
+    members = [TF, "group:sre-oncall@example.com", "projectOwner:p1", "user:a@example.com"]
+
+    assert s.skips("pubsub.googleapis.com/Topic") and not s.skips(bucket)
+    assert s.keep(bucket, "roles/storage.admin", members) == ["user:a@example.com"]
+    assert s.keep(bucket, "roles/owner", members) == [TF, "user:a@example.com"]
+    assert s.keep(bucket, "roles/logging.viewer", members) == []
+    assert s.keep("compute.googleapis.com/Instance", "roles/logging.viewer", [TF]) == [TF]
+    assert s.keep(bucket, "roles/owner", [TF], actor="Deployer@infra.iam.gserviceaccount.com") == []
+
+    assert Suppressor.from_env({"SUPPRESS_DEFAULTS": "false"}).keep(bucket, "roles/owner", members) == members
+    with pytest.raises(ValueError):
+        SuppressRule.from_dict({"member": "x"})
+    with pytest.raises(ValueError):
+        SuppressRule.from_dict({})
+
+
+def test_suppressed_changes_never_reach_crm_or_sinks(monkeypatch, load_fixture, request):
+    request.addfinalizer(suppressor.cache_clear)
+    monkeypatch.setenv("SUPPRESS_RULES", json.dumps([
+        {"principals": ["user:alice@example.com"], "roles": ["roles/browser"]},
+        {"actors": ["bob@example.com"], "roles": ["roles/storage.*"]},
+    ]))
+    m = import_main_with_stubs(monkeypatch)
+
+    def no_crm():
+        raise AssertionError("CRM called")
+
+    monkeypatch.setattr(gcp, "crm_client", no_crm)
+    sent = []
+    monkeypatch.setattr("requests.Session.post", lambda self, url, json=None, **kw: sent.append(json) or DummyResp())
+
+    m.hello_pubsub(FakeEvent(load_fixture("asset_project.json")))
+    m.hello_pubsub(FakeEvent(load_fixture("audit_bucket_iam_add.json")))
+    assert sent == []
+
+
+def test_bad_rules_fail_at_start_up_not_per_message(monkeypatch, request):
+    import worker
+
+    request.addfinalizer(suppressor.cache_clear)
+    monkeypatch.setenv("SUPPRESS_RULES", json.dumps([{"member": "typo"}]))
+    with pytest.raises(ValueError):
+        import_main_with_stubs(monkeypatch)
+
+    class NoSource:
+        def batches(self, *args):
+            raise AssertionError("pulled before the rules were checked")
+
+    suppressor.cache_clear()
+    with pytest.raises(ValueError):
+        worker.run(NoSource())
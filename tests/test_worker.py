@@ -0,0 +1,153 @@
+import asyncio
+import base64
+import copy
+import json
+
+import lib.gcp as gcp
+from lib.destinations.aio import AsyncDestination
+from lib.destinations.base import Destination
+from tests.conftest import FakeCRMClient
+
+
+def _envelope(payload, message_id):
+    return {"message": {"data": base64.b64encode(json.dumps(payload).encode()).decode(), "messageId": message_id}}
+
+
+def test_file_batch_groups_per_resource_and_resolves_ancestors_once(monkeypatch, tmp_path, load_fixture):
+    import worker
+    from lib.dedup import reset_default_store
+    reset_default_store()
+
+    lookups = []
+
+    class CountingCRM(FakeCRMClient):
+        def projects(self):
+            lookups.append("p")
+            return super().projects()
+
+    monkeypatch.setattr(gcp, "crm_client", lambda: CountingCRM())
+    gcp.ancestor_cache.clear()
+
+    asset = load_fixture("asset_project.json")
+    asset2 = copy.deepcopy(asset)
+    asset2["asset"]["iamPolicy"]["bindings"].append({"role": "roles/owner", "members": ["user:eve@example.com"]})
+    audit = load_fixture("audit_bucket_iam_add.json")
+
+    path = tmp_path / "envelopes.ndjson"
+    lines = [_envelope(asset, "1"), _envelope(asset2, "2"), _envelope(audit, "3"), _envelope({"x": 1}, "4"),
+             _envelope([], "5"), _envelope("x", "6")]
+    path.write_text("\n".join(json.dumps(x) for x in lines) + "\n")
+
+    sent = []
+
+    class Recorder(Destination):
+        def send(self, e): sent.append(e)
+
+    acked = []
+    for batch in worker.FileSource(str(path)).batches(10, worker.FlowControl(), 0):
+        for pm in batch:
+            pm.ack = lambda pm=pm: acked.append(pm.message_id)
+        assert worker.process_batch(batch, Recorder(), coalesce=True) == (6, 0)
+
+    assert sorted(acked) == ["1", "2", "3", "4", "5", "6"]  # valid JSON that isn't an object is acked, not fatal
+    assert len(lookups) == 1
+    assert [e.source for e in sent] == ["asset-feed", "audit-logs"]
+    roles = {g.role for g in sent[0].changes}
+    assert "roles/owner" in roles
+
+    # without coalescing every message is its own alert
+    sent.clear()
+    reset_default_store()
+    for batch in worker.FileSource(str(path)).batches(10, worker.FlowControl(), 0):
+        for pm in batch:
+            pm.ack = lambda: None
+        assert worker.process_batch(batch, Recorder()) == (6, 0)
+    assert [e.source for e in sent] == ["asset-feed", "asset-feed", "audit-logs"]
+
+
+def test_async_destination_gets_the_batch_concurrently(tmp_path, load_fixture):
+    import worker
+    from lib.dedup import reset_default_store
+    reset_default_store()
+
+    asset = load_fixture("asset_project.json")
+    audit = load_fixture("audit_bucket_iam_add.json")
+    path = tmp_path / "envelopes.ndjson"
+    path.write_text("\n".join(json.dumps(_envelope(p, str(i))) for i, p in enumerate([asset, audit, asset])))
+
+    in_flight, peak, sent = [0], [0], []
+
+    class Slow(AsyncDestination):
+        async def send(self, e):
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+            await asyncio.sleep(0.01)
+            in_flight[0] -= 1
+            if e.source == "audit-logs":
+                raise RuntimeError("sink down")
+            sent.append(e.source)
+
+    acked, nacked = [], []
+    loop = asyncio.new_event_loop()
+    try:
+        for batch in worker.FileSource(str(path)).batches(10, worker.FlowControl(), 0):
+            for pm in batch:
+                pm.ack = lambda pm=pm: acked.append(pm.message_id)
+                pm.nack = lambda pm=pm: nacked.append(pm.message_id)
+            assert worker.process_batch(batch, Slow(), dedup=False, loop=loop) == (2, 1)
+    finally:
+        loop.close()
+    assert peak[0] == 3
+    assert sent == ["asset-feed", "asset-feed"] and sorted(acked) == ["0", "2"] and nacked == ["1"]
+
+
+def test_coalescing_worker_nacks_when_the_sink_fails(monkeypatch, tmp_path, load_fixture):
+    import worker
+    from lib.dedup import reset_default_store
+    from lib.destinations.coalesce import CoalescingDestination
+    reset_default_store()
+
+    class Down(Destination):
+        def send(self, e):
+            raise RuntimeError("sink down")
+
+    coalescer = CoalescingDestination(Down(), window=60)
+    monkeypatch.setattr(worker, "get_destination", lambda: coalescer)
+    asset = load_fixture("asset_project.json")
+    path = tmp_path / "envelopes.ndjson"
+    path.write_text("\n".join(json.dumps(_envelope(asset, str(i))) for i in range(2)))
+
+    acked, nacked = [], []
+
+    class Source(worker.FileSource):
+        def batches(self, *args):
+            for batch in super().batches(*args):
+                for pm in batch:
+                    pm.ack = lambda pm=pm: acked.append(pm.message_id)
+                    pm.nack = lambda pm=pm: nacked.append(pm.message_id)
+                yield batch
+
+    worker.run(Source(str(path)), metrics_log_interval=0)
+    assert acked == [] and sorted(nacked) == ["0", "1"]
+    assert not coalescer._buffers  # nothing was left buffered behind an ack
+
+
+def test_file_source_takes_bare_messages_as_is(tmp_path, load_fixture):
+    import worker
+
+    asset = load_fixture("asset_project.json")
+    path = tmp_path / "messages.ndjson"
+    path.write_text(json.dumps(asset) + "\n" + json.dumps(_envelope(asset, "1")) + "\n")
+
+    batch = next(worker.FileSource(str(path)).batches(10, worker.FlowControl(), 0))
+    assert [json.loads(pm.data) for pm in batch] == [asset, asset]
+    assert [pm.message_id for pm in batch] == [None, "1"]
+
+
+def test_file_source_respects_flow_control(tmp_path):
+    import worker
+
+    path = tmp_path / "envelopes.ndjson"
+    path.write_text("\n".join(json.dumps(_envelope({"i": i}, str(i))) for i in range(5)))
+    sizes = [len(b) for b in worker.FileSource(str(path)).batches(10, worker.FlowControl(max_messages=2), 0)]
+    assert sizes == [2, 2, 1]
@@ -0,0 +1,308 @@
+"""Long-running worker: pulls Pub/Sub messages in batches instead of one CloudEvent per invocation.
+
+usage:
+    python worker.py --subscription projects/MY_PROJECT/subscriptions/iam-changes-sub
+    python worker.py --file ./envelopes.ndjson   # one Pub/Sub envelope per line, for local testing
+    python worker.py --subscription ... --metrics-port 9090   # Prometheus scrape endpoint on :9090/metrics
+    python worker.py --subscription ... --async   # send each batch's alerts concurrently on one event loop
+"""
+import argparse
+import asyncio
+import json
+import logging
+import queue
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from config import load_config
+from handlers import lookup
+from lib import metrics
+from lib.decode import PayloadRef, b64decode, loads
+from lib.dedup import default_store
+from lib.destinations.aio import AsyncDestination, build_async_destination
+from lib.destinations.base import Destination, IamChangeEvent
+from lib.destinations.coalesce import CoalescingDestination, merge_events
+from lib.destinations.factory import get_destination, load_settings, reset_destination
+from lib.gcp import hierarchy, prefetch_ancestors, save_hierarchy
+from lib.metrics import MESSAGES, stage
+from lib.suppress import suppressor
+
+
+def _noop() -> None:
+    pass
+
+
+@dataclass
+class PulledMessage:
+    data: bytes  # decoded Pub/Sub payload
+    message_id: Optional[str] = None
+    ack: Callable[[], None] = _noop
+    nack: Callable[[], None] = _noop
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+
+@dataclass(frozen=True)
+class FlowControl:
+    """Upper bounds on messages pulled but not yet acked/nacked."""
+    max_messages: int = 1000
+    max_bytes: int = 10 * 1024 * 1024
+
+
+class FileSource:
+    """Newline-delimited Pub/Sub envelopes (``{"message": {"data": <base64>, "messageId": ...}}``) or bare messages."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def batches(self, batch_size: int, flow: FlowControl, batch_timeout: float) -> Iterator[List[PulledMessage]]:
+        batch: List[PulledMessage] = []
+        nbytes = 0
+        limit = min(batch_size, flow.max_messages)
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                envelope = json.loads(line)
+                message = envelope.get("message") if isinstance(envelope, dict) else None
+                if isinstance(message, dict):
+                    pm = PulledMessage(b64decode(message.get("data", "")), message.get("messageId"))
+                else:  # a bare message: the line is the payload
+                    pm = PulledMessage(line.strip().encode())
+                if batch and (len(batch) >= limit or nbytes + pm.size > flow.max_bytes):
+                    yield batch
+                    batch, nbytes = [], 0
+                batch.append(pm)
+                nbytes += pm.size
+        if batch:
+            yield batch
+
+
+class PubSubSource:
+    """Streaming pull; the client library enforces ``flow`` on outstanding messages/bytes."""
+
+    def __init__(self, subscription: str):
+        self.subscription = subscription
+
+    def batches(self, batch_size: int, flow: FlowControl, batch_timeout: float) -> Iterator[List[PulledMessage]]:
+        try:
+            from google.cloud import pubsub_v1
+        except ImportError as e:
+            raise SystemExit("Streaming pull needs google-cloud-pubsub: pip install google-cloud-pubsub") from e
+
+        inbox: "queue.Queue[PulledMessage]" = queue.Queue()
+
+        def _callback(message) -> None:
+            inbox.put(PulledMessage(message.data, message.message_id, message.ack, message.nack))
+
+        subscriber = pubsub_v1.SubscriberClient()
+        future = subscriber.subscribe(
+            self.subscription,
+            callback=_callback,
+            flow_control=pubsub_v1.types.FlowControl(max_messages=flow.max_messages, max_bytes=flow.max_bytes),
+        )
+        logging.info("Listening on %s", self.subscription)
+        try:
+            while True:
+                batch = [inbox.get()]
+                nbytes = batch[0].size
+                deadline = time.monotonic() + batch_timeout
+                while len(batch) < batch_size and nbytes < flow.max_bytes:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        pm = inbox.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    batch.append(pm)
+                    nbytes += pm.size
+                yield batch
+        finally:
+            future.cancel()
+            subscriber.close()
+
+
+def _send(dest: Destination, event: IamChangeEvent) -> Optional[Exception]:
+    try:
+        with stage("send"):
+            dest.send(event)
+    except Exception as e:
+        return e
+    return None
+
+
+async def _send_all(dest: AsyncDestination, events: List[IamChangeEvent]) -> List[Optional[BaseException]]:
+    return await asyncio.gather(*(dest.send(e) for e in events), return_exceptions=True)
+
+
+def process_batch(messages: List[PulledMessage], dest, dedup: bool = True, coalesce: bool = False,
+                  loop: Optional[asyncio.AbstractEventLoop] = None) -> Tuple[int, int]:
+    """Decode, classify and build events for a whole batch, then send them.
+
+    With ``coalesce`` (``COALESCE_WINDOW_SECONDS`` set), the events of one resource are sent as one merged event;
+    otherwise each is sent as is. Distinct CRM ancestors are resolved once per batch. ``dest`` is a ``Destination``
+    or an ``AsyncDestination``, whose sends for the batch then run concurrently on ``loop``. Returns (acked, nacked).
+    """
+    store = default_store() if dedup else None
+    done: List[PulledMessage] = []
+    nacked = 0
+
+    items = []
+    for pm in messages:
+        if store is not None and pm.message_id and store.seen(f"msg:{pm.message_id}"):
+            MESSAGES.inc(handler="none", outcome="duplicate")
+            done.append(pm)
+            continue
+        try:
+            with stage("decode"):
+                msg = loads(pm.data)
+        except ValueError:
+            logging.warning("Non-JSON Pub/Sub message received; ignoring. Payload=%r", pm.data[:200])
+            MESSAGES.inc(handler="none", outcome="invalid")
+            done.append(pm)
+            continue
+        with stage("classify"):
+            handler = lookup(msg) if isinstance(msg, dict) else None
+        if handler is None:
+            logging.warning("Unrecognized message format; ignoring.")
+            MESSAGES.inc(handler="none", outcome="unrecognized")
+            done.append(pm)
+            continue
+        items.append((pm, handler, msg))
+
+    with stage("crm_prefetch"):
+        prefetch_ancestors(
+            ((msg["asset"].get("ancestors") or [""])[0] for _, handler, msg in items if handler.name == "asset")
+        )
+
+    groups: "OrderedDict[Tuple[str, str], Tuple[List[Tuple[str, IamChangeEvent]], List[PulledMessage]]]" = OrderedDict()
+    for pm, handler, msg in items:
+        try:
+            evt = handler.build(msg, PayloadRef(pm.data))
+        except Exception:
+            logging.exception("Failed to process message %s; nacking.", pm.message_id)
+            MESSAGES.inc(handler=handler.name, outcome="failed")
+            pm.nack()
+            nacked += 1
+            continue
+        if evt is None:
+            MESSAGES.inc(handler=handler.name, outcome="no_change")
+            done.append(pm)
+            continue
+        key = (evt.resource_display, evt.resource_type) if coalesce else (pm.message_id or "", str(len(groups)))
+        events, pms = groups.setdefault(key, ([], []))
+        events.append((handler.name, evt))
+        pms.append(pm)
+
+    batch = [(events, pms, merge_events([evt for _, evt in events]) if coalesce else events[0][1])
+             for events, pms in groups.values()]
+    if isinstance(dest, AsyncDestination):
+        with stage("send"):
+            errors = loop.run_until_complete(_send_all(dest, [evt for _, _, evt in batch]))
+    else:
+        errors = [_send(dest, evt) for _, _, evt in batch]
+
+    for (events, pms, _), error in zip(batch, errors):
+        if error is not None:
+            logging.error("Delivery failed for %s message(s); nacking.", len(pms), exc_info=error)
+            for name, _ in events:
+                MESSAGES.inc(handler=name, outcome="failed")
+            for pm in pms:
+                pm.nack()
+            nacked += len(pms)
+            continue
+        for name, _ in events:
+            MESSAGES.inc(handler=name, outcome="sent")
+        done.extend(pms)
+
+    for pm in done:
+        if store is not None and pm.message_id:
+            store.add(f"msg:{pm.message_id}")
+        pm.ack()
+    return len(done), nacked
+
+
+def run(
+        source,
+        batch_size: int = 100,
+        batch_timeout: float = 1.0,
+        flow: Optional[FlowControl] = None,
+        metrics_log_interval: float = 60.0,
+        use_async: bool = False,
+) -> None:
+    flow = flow or FlowControl()
+    cfg = load_config()
+    hierarchy()  # map the local hierarchy index, if configured, before the first batch
+    suppressor()  # and compile the suppression rules, so a bad config stops the worker before it pulls
+    acked = nacked = 0
+    next_metrics_log = time.monotonic() + metrics_log_interval
+    loop = adest = None
+    if use_async:
+        # built once: unlike get_destination(), the async graph is not rebuilt when DEST_CONFIG_FILE changes
+        settings = load_settings()
+        loop, adest = asyncio.new_event_loop(), build_async_destination(settings)
+        coalesce = float(settings.env.get("COALESCE_WINDOW_SECONDS", "0")) > 0
+    try:
+        for batch in source.batches(batch_size, flow, batch_timeout):
+            if adest is not None:
+                a, n = process_batch(batch, adest, dedup=cfg.dedup_enabled, coalesce=coalesce, loop=loop)
+            else:
+                dest = get_destination()
+                coalesce = isinstance(dest, CoalescingDestination)
+                if coalesce:
+                    # the batch is merged per resource here; the coalescer would only buffer it and ack messages
+                    # whose delivery could still fail, so send straight to the sinks behind it
+                    dest = dest.inner
+                a, n = process_batch(batch, dest, dedup=cfg.dedup_enabled, coalesce=coalesce)
+            acked, nacked = acked + a, nacked + n
+            logging.info("Batch of %s processed (acked=%s nacked=%s)", len(batch), a, n)
+            if metrics_log_interval > 0 and time.monotonic() >= next_metrics_log:
+                metrics.registry.log()
+                next_metrics_log = time.monotonic() + metrics_log_interval
+    finally:
+        if adest is not None:
+            loop.run_until_complete(adest.close())
+            loop.close()
+        reset_destination()  # flushes coalescing buffers, stops outbox workers
+        save_hierarchy()  # keep the project/folder changes seen on the feed across restarts
+        logging.info("Worker stopped: acked=%s nacked=%s", acked, nacked)
+        metrics.registry.log()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    src = parser.add_mutually_exclusive_group(required=True)
+    src.add_argument("--subscription", help="projects/<p>/subscriptions/<s> to streaming-pull from")
+    src.add_argument("--file", help="newline-delimited Pub/Sub envelopes to replay")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--batch-timeout", type=float, default=1.0, help="seconds to wait for a batch to fill")
+    parser.add_argument("--max-outstanding-messages", type=int, default=1000)
+    parser.add_argument("--max-outstanding-bytes", type=int, default=10 * 1024 * 1024)
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus text on :PORT/metrics")
+    parser.add_argument("--metrics-log-interval", type=float, default=60.0,
+                        help="seconds between structured metrics log records (0 disables)")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="deliver through the asyncio destination graph, a batch's alerts concurrently")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=load_config().log_level)
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+    source = PubSubSource(args.subscription) if args.subscription else FileSource(args.file)
+    run(
+        source,
+        batch_size=args.batch_size,
+        batch_timeout=args.batch_timeout,
+        flow=FlowControl(args.max_outstanding_messages, args.max_outstanding_bytes),
+        metrics_log_interval=args.metrics_log_interval,
+        use_async=args.use_async,
+    )
+
+
+if __name__ == "__main__":
+    main()